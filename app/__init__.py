@@ -1,3 +1,4 @@
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
@@ -5,18 +6,53 @@ from flask_marshmallow import Marshmallow
 db = SQLAlchemy()
 ma = Marshmallow()
 
-def create_app():
+def create_app(test_config=None, config_object=None):
     app = Flask(__name__)
-    app.config.from_object('app.config.Config')
+    # Pick the profile, e.g. MEAL_TRACKER_CONFIG=app.config.ProductionConfig
+    if config_object is None:
+        config_object = os.environ.get('MEAL_TRACKER_CONFIG', 'app.config.Config')
+    app.config.from_object(config_object)
+    if test_config is not None:
+        app.config.update(test_config)
     
     db.init_app(app)
     ma.init_app(app)
+
+    from .storage import init_storage
+    init_storage(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
+    from .cache import init_user_cache
+    init_user_cache(app)
+
+    from .versions import init_body_cache
+    init_body_cache(app)
+
+    from .archive import init_meal_archive
+    init_meal_archive(app)
+
+    from .catalog import init_food_catalog
+    init_food_catalog(app)
+
+    from .writequeue import init_write_queue
+    init_write_queue(app)
+
+    from .admission import init_write_admission
+    init_write_admission(app)
     
     from .routes import bp as routes_bp
     app.register_blueprint(routes_bp)
+
+    from .commands import register_commands
+    register_commands(app)
     
-    with app.app_context():
-        from . import routes
-        db.create_all()
+    # Production runs 'flask db-upgrade' explicitly; otherwise check the
+    # stored schema version, which costs one query when nothing changed
+    if app.config['DB_AUTO_UPGRADE']:
+        from .migrations import upgrade_database
+        with app.app_context():
+            upgrade_database()
     
     return app
\ No newline at end of file
@@ -0,0 +1,200 @@
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, jsonify, request
+
+
+class TokenBuckets:
+    # One token bucket per key (a username or a client IP): `burst` tokens at
+    # most, refilled at `rate` per second. Only the most recently used
+    # `max_keys` buckets are kept; a forgotten key starts over with a full
+    # bucket, which only ever errs towards admitting.
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def _refill(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def wait_time(self, key, now):
+        # Seconds until the bucket holds a whole token, 0 if it already does
+        tokens = self._refill(key, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key, now):
+        self._buckets[key] = (self._refill(key, now) - 1, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def throttled(self, now, limit):
+        # Keys currently out of tokens, the emptiest first
+        if not limit:
+            return []
+        empty = [(key, self._refill(key, now)) for key in self._buckets]
+        empty = sorted((tokens, key) for key, tokens in empty if tokens < 1)
+        return [{'key': key, 'tokens': round(tokens, 3)} for tokens, key in empty[:limit]]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Rejected(Exception):
+    # A write turned away before it started: 429 for a client over its rate,
+    # 503 when the server has no room for it
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class WriteAdmission:
+    # Admission control for the write routes. A write first takes a token
+    # from its username's and its client IP's bucket, then one of
+    # `max_in_flight` slots; up to `max_queued` writes wait at most
+    # `queue_timeout` seconds for a slot, anything beyond that is shed at
+    # once. SQLite runs one writer at a time, so a small cap keeps a burst
+    # from piling up busy retries in front of everyone else.
+
+    def __init__(self, user_rate=None, user_burst=None, ip_rate=None, ip_burst=None,
+                 max_in_flight=None, max_queued=0, queue_timeout=1.0, retry_after=1,
+                 max_keys=100000, clock=time.monotonic):
+        self.users = TokenBuckets(user_rate, user_burst or 1, max_keys) if user_rate else None
+        self.ips = TokenBuckets(ip_rate, ip_burst or 1, max_keys) if ip_rate else None
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.clock = clock
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rate_limited = {'user': 0, 'ip': 0}
+        self.shed = {'queue_full': 0, 'queue_timeout': 0}
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+
+    def check_rate(self, username, ip):
+        # Charge both buckets, or neither when either is empty
+        with self._lock:
+            now = self.clock()
+            limits = [('user', self.users, username), ('ip', self.ips, ip)]
+            limits = [(kind, buckets, key) for kind, buckets, key in limits if buckets is not None and key]
+            for kind, buckets, key in limits:
+                wait = buckets.wait_time(key, now)
+                if wait:
+                    self.rate_limited[kind] += 1
+                    label = f"user '{key}'" if kind == 'user' else f"client {key}"
+                    raise Rejected(429, f"Too many writes from {label}, slow down.", wait)
+            for kind, buckets, key in limits:
+                buckets.take(key, now)
+
+    def acquire(self):
+        if self.max_in_flight is None:
+            with self._lock:
+                self.in_flight += 1
+                self.admitted += 1
+            return
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queued:
+                    self.shed['queue_full'] += 1
+                    raise Rejected(503, "Too many writes in progress, try again shortly.", self.retry_after)
+                self.queued += 1
+                try:
+                    admitted = self._slot_free.wait_for(
+                        lambda: self.in_flight < self.max_in_flight, self.queue_timeout)
+                finally:
+                    self.queued -= 1
+                if not admitted:
+                    self.shed['queue_timeout'] += 1
+                    raise Rejected(503, "Too many writes in progress, try again shortly.", self.retry_after)
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._slot_free.notify()
+
+    def stats(self, throttled_limit=20):
+        with self._lock:
+            now = self.clock()
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queued': self.queued,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'rate_limited': dict(self.rate_limited),
+                'shed': dict(self.shed),
+                'tracked_users': len(self.users) if self.users is not None else 0,
+                'tracked_ips': len(self.ips) if self.ips is not None else 0,
+                'throttled_users': self.users.throttled(now, throttled_limit) if self.users is not None else [],
+                'throttled_ips': self.ips.throttled(now, throttled_limit) if self.ips is not None else [],
+            }
+
+
+def _username():
+    body = request.get_json(silent=True)
+    return body.get('username') if isinstance(body, dict) else None
+
+
+def admit_write(view):
+    # Route decorator, outside retry_on_busy so busy retries keep their slot
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        admission = current_app.extensions.get('write_admission')
+        if admission is None:
+            return view(*args, **kwargs)
+        try:
+            admission.check_rate(_username(), request.remote_addr)
+            admission.acquire()
+        except Rejected as e:
+            response = jsonify({"error": e.message})
+            response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+            return response, e.status
+        g.write_slot = admission.release
+        try:
+            return view(*args, **kwargs)
+        finally:
+            release_write_slot()
+    return wrapper
+
+
+def release_write_slot():
+    # Give the request's slot back before it is done. add_meal calls this
+    # before waiting on the group-commit writer: that one thread serializes
+    # the commits already, and holding slots while waiting would cap every
+    # batch at WRITE_MAX_IN_FLIGHT meals.
+    release = g.pop('write_slot', None)
+    if release is not None:
+        release()
+
+
+def init_write_admission(app):
+    config = app.config
+    if not (config['WRITE_RATE_PER_USER'] or config['WRITE_RATE_PER_IP'] or config['WRITE_MAX_IN_FLIGHT']):
+        return
+    app.extensions['write_admission'] = WriteAdmission(
+        user_rate=config['WRITE_RATE_PER_USER'],
+        user_burst=config['WRITE_BURST_PER_USER'],
+        ip_rate=config['WRITE_RATE_PER_IP'],
+        ip_burst=config['WRITE_BURST_PER_IP'],
+        max_in_flight=config['WRITE_MAX_IN_FLIGHT'],
+        max_queued=config['WRITE_MAX_QUEUED'],
+        queue_timeout=config['WRITE_QUEUE_TIMEOUT'],
+        retry_after=config['WRITE_RETRY_AFTER'],
+        max_keys=config['WRITE_RATE_MAX_KEYS'],
+    )
+
+
+def write_admission():
+    return current_app.extensions.get('write_admission')
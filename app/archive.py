@@ -0,0 +1,262 @@
+import gzip
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from collections import defaultdict
+from collections import namedtuple
+from datetime import date as date_type
+from flask import current_app
+from sqlalchemy.dialects.sqlite import insert
+from . import db
+from .models import ArchivedMeal, ArchivedMonth, ArchivedTotal, Meal, User
+from .serializers import meal_serializer
+
+# An archived meal shaped like meal_serializer's rows, plus the owner's id for the ETag
+ArchivedRow = namedtuple('ArchivedRow', meal_serializer.names + ('user_id',))
+
+# Columns stored per meal besides the day of the month
+_FIELDS = ('id', 'name', 'description', 'calories')
+
+
+def month_of(day):
+    # YYYY-MM, without strftime which is slow enough to show up per meal
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+class MealArchive:
+    # Cold storage for old meals: gzip-compressed, column-oriented JSON files,
+    # one per user and month, <root>/<user_id>/<YYYY-MM>.<generation>.json.gz.
+    # Adding meals to a month writes its next generation; the archived_month
+    # table says which generation is committed, so a run that dies halfway
+    # leaves only files nobody reads.
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, user_id, month, generation):
+        return os.path.join(self.root, str(user_id), f'{month}.{generation}.json.gz')
+
+    def months(self, user_id, date_from=None, date_to=None):
+        # Months with files for the user overlapping the inclusive date range, oldest first
+        try:
+            names = os.listdir(os.path.join(self.root, str(user_id)))
+        except FileNotFoundError:
+            return []
+        months = sorted({name[:7] for name in names if name.endswith('.json.gz')})
+        if date_from is not None:
+            months = [month for month in months if month >= month_of(date_from)]
+        if date_to is not None:
+            months = [month for month in months if month <= month_of(date_to)]
+        return months
+
+    def read(self, user_id, month, generation):
+        # The month's meals as (id, name, description, calories, date) in (date, id) order
+        if not generation:
+            return []
+        with gzip.open(self.path(user_id, month, generation), 'rt', encoding='utf-8') as f:
+            columns = json.load(f)
+        year, number = int(month[:4]), int(month[5:])
+        dates = [date_type(year, number, day) for day in columns['day']]
+        return list(zip(*(columns[field] for field in _FIELDS), dates))
+
+    def write(self, user_id, month, generation, meals):
+        # Write generation + 1 of the month: the given generation's meals plus
+        # these. Returns the new generation.
+        rows = self.read(user_id, month, generation) + list(meals)
+        rows.sort(key=lambda meal: (meal[4], meal[0]))
+        columns = {field: [row[i] for row in rows] for i, field in enumerate(_FIELDS)}
+        columns['day'] = [row[4].day for row in rows]
+
+        path = self.path(user_id, month, generation + 1)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                    f.write(json.dumps(columns, separators=(',', ':')).encode())
+                # On disk before the caller deletes the meals from the hot table
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return generation + 1
+
+    def discard(self, user_id, month, generation):
+        # Remove a generation that is no longer committed
+        try:
+            os.unlink(self.path(user_id, month, generation))
+        except FileNotFoundError:
+            pass
+
+    def remove_user(self, user_id):
+        shutil.rmtree(os.path.join(self.root, str(user_id)), ignore_errors=True)
+
+
+def init_meal_archive(app):
+    root = app.config['MEAL_ARCHIVE_DIR'] or os.path.join(app.instance_path, 'archive')
+    app.extensions['meal_archive'] = MealArchive(root)
+
+
+def meal_archive():
+    return current_app.extensions['meal_archive']
+
+
+def _generations(keys, chunk_size=400):
+    # (user_id, month) -> committed generation for the given keys that have one
+    generations = {}
+    keys = list(keys)
+    for start in range(0, len(keys), chunk_size):
+        result = db.session.execute(
+            db.select(ArchivedMonth.user_id, ArchivedMonth.month, ArchivedMonth.generation)
+            .where(db.tuple_(ArchivedMonth.user_id, ArchivedMonth.month).in_(keys[start:start + chunk_size]))
+        )
+        generations.update(((user_id, month), generation) for user_id, month, generation in result)
+    return generations
+
+
+def _add_archived_totals(totals):
+    # Fold {(user_id, date): [calories, meal_count]} into archived_total in one executemany
+    table = ArchivedTotal.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.date],
+        set_={
+            'calories': table.c.calories + stmt.excluded.calories,
+            'meal_count': table.c.meal_count + stmt.excluded.meal_count,
+        },
+    )
+    db.session.execute(stmt, [
+        {'user_id': user_id, 'date': date, 'calories': calories, 'meal_count': count}
+        for (user_id, date), (calories, count) in sorted(totals.items())
+    ])
+
+
+def archive_meals(before, chunk_size=5000):
+    # Move meals dated before `before` to cold storage, one transaction per chunk.
+    # Daily totals and data versions are untouched: the meals still exist, they
+    # are only stored elsewhere. Yields the number of meals moved so far.
+    archive = meal_archive()
+    moved = 0
+    last = None
+    while True:
+        # Walk the (user_id, date) index from where the last chunk ended, so each
+        # chunk fills few user-months and no chunk rescans kept rows. Deleting
+        # first takes the write lock, so no meal can change before its file is written.
+        chunk = db.select(Meal.id).where(Meal.date < before)
+        if last is not None:
+            chunk = chunk.where(db.tuple_(Meal.user_id, Meal.date, Meal.id) > last)
+        chunk = chunk.order_by(Meal.user_id, Meal.date, Meal.id).limit(chunk_size)
+        rows = db.session.execute(
+            db.delete(Meal).where(Meal.id.in_(chunk.scalar_subquery()))
+            .returning(Meal.id, Meal.user_id, Meal.name, Meal.description, Meal.calories, Meal.date),
+            execution_options={'synchronize_session': False},
+        ).all()
+        if not rows:
+            db.session.rollback()
+            break
+        last = max((row.user_id, row.date, row.id) for row in rows)
+
+        by_month = defaultdict(list)
+        totals = defaultdict(lambda: [0, 0])
+        for row in rows:
+            by_month[(row.user_id, month_of(row.date))].append((row.id, row.name, row.description, row.calories, row.date))
+            total = totals[(row.user_id, row.date)]
+            total[0] += row.calories
+            total[1] += 1
+
+        committed = _generations(by_month)
+        written = []
+        for (user_id, month), meals in by_month.items():
+            generation = archive.write(user_id, month, committed.get((user_id, month), 0), meals)
+            written.append({'user_id': user_id, 'month': month, 'generation': generation})
+
+        # The archive's writes are Core inserts on the tables, per row the ORM
+        # bulk path costs more than the statements themselves
+        stmt = insert(ArchivedMonth.__table__)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={'generation': stmt.excluded.generation},
+        ), written)
+        db.session.execute(db.insert(ArchivedMeal.__table__), [
+            {'id': row.id, 'user_id': row.user_id, 'month': month_of(row.date)} for row in rows
+        ])
+        _add_archived_totals(totals)
+        db.session.commit()
+        for (user_id, month), generation in committed.items():
+            archive.discard(user_id, month, generation)
+        moved += len(rows)
+        yield moved
+
+    if moved:
+        # Merge the search index's delete markers into its segments
+        db.session.execute(db.text("INSERT INTO meal_fts (meal_fts) VALUES ('optimize')"))
+        db.session.commit()
+
+
+def archived_rows(user_id, username, date_from=None, date_to=None, cursor=None):
+    # The user's archived meals within the range and after the cursor, as
+    # ArchivedRows in (date, id) order. None when the range reaches no archived
+    # month, which costs a directory listing and no query.
+    start = date_from
+    if cursor is not None and (start is None or cursor[0] > start):
+        start = cursor[0]
+    archive = meal_archive()
+    months = archive.months(user_id, start, date_to)
+    if not months:
+        return None
+    generations = _generations((user_id, month) for month in months)
+    if not generations:
+        return None
+    return _read_months(archive, sorted(generations.items()), username, date_from, date_to, cursor)
+
+
+def _read_months(archive, generations, username, date_from, date_to, cursor):
+    for (user_id, month), generation in generations:
+        for meal_id, name, description, calories, day in archive.read(user_id, month, generation):
+            if date_from is not None and day < date_from or date_to is not None and day > date_to:
+                continue
+            if cursor is not None and (day, meal_id) <= cursor:
+                continue
+            yield ArchivedRow(id=meal_id, name=name, description=description, calories=calories,
+                              date=day, username=username, user_id=user_id)
+
+
+def merge_tiers(hot, archived):
+    # One (date, id)-ordered stream over hot rows and archived rows. A meal is
+    # in exactly one tier, so nothing needs de-duplicating.
+    if archived is None:
+        return hot
+    return heapq.merge(hot, archived, key=lambda row: (row.date, row.id))
+
+
+def find_archived_meals(meal_ids):
+    # id -> ArchivedRow for the given ids found in the archive, reading each
+    # month file once however many of its meals are asked for
+    entries = db.session.execute(
+        db.select(ArchivedMeal.id, ArchivedMeal.user_id, ArchivedMeal.month, ArchivedMonth.generation, User.username)
+        .join(ArchivedMonth, (ArchivedMonth.user_id == ArchivedMeal.user_id) & (ArchivedMonth.month == ArchivedMeal.month))
+        .join(User, User.id == ArchivedMeal.user_id)
+        .where(ArchivedMeal.id.in_(meal_ids))
+    ).all()
+    files = defaultdict(set)
+    usernames = {}
+    for entry in entries:
+        files[(entry.user_id, entry.month, entry.generation)].add(entry.id)
+        usernames[entry.user_id] = entry.username
+    found = {}
+    archive = meal_archive()
+    for (user_id, month, generation), wanted in files.items():
+        for meal_id, name, description, calories, day in archive.read(user_id, month, generation):
+            if meal_id in wanted:
+                found[meal_id] = ArchivedRow(id=meal_id, name=name, description=description, calories=calories,
+                                             date=day, username=usernames[user_id], user_id=user_id)
+    return found
+
+
+def find_archived_meal(meal_id):
+    # The archived meal with this id as an ArchivedRow, or None
+    return find_archived_meals([meal_id]).get(meal_id)
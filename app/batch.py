@@ -0,0 +1,67 @@
+from . import db
+from .archive import find_archived_meals
+from .models import DailyTotal, Meal, User
+from .rollup import daily_totals_for
+from .serializers import meal_serializer
+from .utils import describe_remaining
+
+
+def _remaining(tdee, calories):
+    # Remaining calories as add_meal reports them, None for users without a TDEE
+    if tdee is None:
+        return None
+    return describe_remaining(tdee, calories or 0)[1]
+
+
+def _with_remaining(meal, tdee, day_calories):
+    return dict(meal, tdee=tdee, remaining_calories=_remaining(tdee, day_calories))
+
+
+def meals_by_ids(meal_ids):
+    # id -> meal dict plus the owner's TDEE and remaining calories on the meal's
+    # day. One query over the meal table with the day's rollup row joined in;
+    # only ids it does not have are looked up in the archive.
+    rows = db.session.execute(
+        meal_serializer.select()
+        .add_columns(User.tdee, DailyTotal.calories.label('day_calories'))
+        .outerjoin(DailyTotal, (DailyTotal.user_id == Meal.user_id) & (DailyTotal.date == Meal.date))
+        .where(Meal.id.in_(meal_ids))
+    ).all()
+    found = {row.id: _with_remaining(meal_serializer.dump(row), row.tdee, row.day_calories) for row in rows}
+
+    missing = [meal_id for meal_id in meal_ids if meal_id not in found]
+    archived = find_archived_meals(missing) if missing else {}
+    if archived:
+        user_ids = {row.user_id for row in archived.values()}
+        tdees = dict(db.session.execute(db.select(User.id, User.tdee).where(User.id.in_(user_ids))).all())
+        totals = daily_totals_for({(row.user_id, row.date) for row in archived.values()})
+        for meal_id, row in archived.items():
+            found[meal_id] = _with_remaining(
+                meal_serializer.dump(row), tdees[row.user_id], totals.get((row.user_id, row.date)))
+    return found
+
+
+def daily_summaries(usernames, date_from, date_to):
+    # username -> per-day calories, meal counts and remaining calories within
+    # the inclusive range, for the usernames that exist. One query: the users
+    # by their unique username, outer joined to their rollup rows in range.
+    rows = db.session.execute(
+        db.select(User.username, User.tdee, DailyTotal.date, DailyTotal.calories, DailyTotal.meal_count)
+        .outerjoin(DailyTotal, (DailyTotal.user_id == User.id) & DailyTotal.date.between(date_from, date_to))
+        .where(User.username.in_(usernames))
+        .order_by(User.username, DailyTotal.date)
+    ).all()
+    summaries = {}
+    for username, tdee, day, calories, meal_count in rows:
+        summary = summaries.setdefault(username, {'username': username, 'tdee': tdee, 'total_calories': 0, 'days': []})
+        # A user without meals in range comes back once, with no rollup columns
+        if day is None:
+            continue
+        summary['total_calories'] += calories
+        summary['days'].append({
+            'date': day.isoformat(),
+            'calories': calories,
+            'meal_count': meal_count,
+            'remaining_calories': _remaining(tdee, calories),
+        })
+    return summaries
@@ -0,0 +1,126 @@
+import json
+from . import db
+from .models import Meal
+from .models import User
+from .rollup import add_meals_to_daily_totals, daily_totals_for
+from .utils import describe_remaining, parse_date
+from .versions import bump_data_versions
+
+# Keys per IN (...) lookup, well below SQLite's bound parameter limit
+LOOKUP_CHUNK_SIZE = 400
+
+
+def parse_bulk_body(body, mimetype):
+    # Turn a JSON array or NDJSON body into (index, item) pairs.
+    # NDJSON lines that fail to parse are reported as row errors.
+    if mimetype == 'application/x-ndjson':
+        items = []
+        for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+            try:
+                items.append((index, json.loads(line)))
+            except ValueError:
+                items.append((index, ValueError("Line is not valid JSON.")))
+        return items
+
+    data = json.loads(body)
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of meals.")
+    return list(enumerate(data))
+
+
+def validate_meal(item, default_date):
+    # Return the column values for one meal or raise ValueError
+    if isinstance(item, ValueError):
+        raise item
+    if not isinstance(item, dict):
+        raise ValueError("Meal must be a JSON object.")
+    for field in ('name', 'username', 'calories'):
+        if field not in item:
+            raise ValueError(f"Missing field '{field}'.")
+    if not isinstance(item['name'], str) or not isinstance(item['username'], str):
+        raise ValueError("name and username must be strings.")
+    if not isinstance(item['calories'], int) or isinstance(item['calories'], bool):
+        raise ValueError("calories must be an integer.")
+    return {
+        'name': item['name'],
+        'username': item['username'],
+        'description': item.get('description', ''),
+        'calories': item['calories'],
+        'date': parse_date(item.get('date', default_date)),
+    }
+
+
+def _load_users(usernames):
+    # username -> (id, tdee) for every known user among usernames
+    users = {}
+    usernames = sorted(usernames)
+    for start in range(0, len(usernames), LOOKUP_CHUNK_SIZE):
+        chunk = usernames[start:start + LOOKUP_CHUNK_SIZE]
+        result = db.session.execute(
+            db.select(User.username, User.id, User.tdee).where(User.username.in_(chunk))
+        )
+        users.update((username, (user_id, tdee)) for username, user_id, tdee in result)
+    return users
+
+
+def insert_meals(items, default_date):
+    # Validate, insert and roll up a batch of meals in a single transaction
+    errors = []
+    rows = []
+    indexes = []
+    for index, item in items:
+        try:
+            rows.append(validate_meal(item, default_date))
+            indexes.append(index)
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+
+    # One lookup for all usernames in the batch, meals are stored by user id
+    users = _load_users({row['username'] for row in rows})
+    valid_rows = []
+    valid_indexes = []
+    for index, row in zip(indexes, rows):
+        username = row.pop('username')
+        if username not in users:
+            errors.append({'index': index, 'error': f"Username '{username}' does not exist. Please register first."})
+            continue
+        row['user_id'] = users[username][0]
+        valid_rows.append(row)
+        valid_indexes.append(index)
+    errors.sort(key=lambda error: error['index'])
+
+    if not valid_rows:
+        return [], [], errors
+
+    # executemany-style insert, ids come back in parameter order
+    ids = db.session.scalars(
+        db.insert(Meal).returning(Meal.id, sort_by_parameter_order=True),
+        valid_rows,
+    ).all()
+
+    # One rollup update per affected (user, date) rather than per meal
+    keys = add_meals_to_daily_totals(valid_rows)
+    totals = daily_totals_for(keys)
+    bump_data_versions(*(user_id for user_id, _ in keys))
+
+    # The response is built before the commit: a failure here must not leave
+    # the batch stored for a retry to insert again
+    created = [{'index': index, 'id': meal_id} for index, meal_id in zip(valid_indexes, ids)]
+    usernames = {user_id: username for username, (user_id, _) in users.items()}
+    days = []
+    for user_id, date in keys:
+        username = usernames[user_id]
+        tdee = users[username][1]
+        if tdee is None:
+            # Nothing to compare with for users without a TDEE
+            message, remaining_calories = "Meal added successfully.", None
+        else:
+            message, remaining_calories = describe_remaining(tdee, totals.get((user_id, date), 0))
+        days.append({
+            'username': username,
+            'date': date.isoformat(),
+            'message': message,
+            'remaining_calories': remaining_calories,
+        })
+    db.session.commit()
+    return created, days, errors
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from collections import namedtuple
+from flask import current_app
+from . import db
+from .models import User
+
+# What the meal routes need to know about a user
+UserProfile = namedtuple('UserProfile', ['id', 'tdee'])
+
+
+class UserProfileCache:
+    # Bounded LRU of username -> UserProfile with a time-to-live per entry.
+    # The cache is per process, so the TTL bounds how long another worker's
+    # update_user/delete_user can go unnoticed here.
+
+    def __init__(self, max_size=1024, ttl=60.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                profile, expires_at = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(username)
+                    self.hits += 1
+                    return profile
+                del self._entries[username]
+            self.misses += 1
+            return None
+
+    def put(self, username, profile):
+        with self._lock:
+            self._entries[username] = (profile, self.clock() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *usernames):
+        with self._lock:
+            for username in usernames:
+                self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def init_user_cache(app):
+    app.extensions['user_cache'] = UserProfileCache(
+        max_size=app.config['USER_CACHE_SIZE'],
+        ttl=app.config['USER_CACHE_TTL'],
+    )
+
+
+def user_cache():
+    return current_app.extensions['user_cache']
+
+
+def get_user_profile(username):
+    # Cached replacement for User.query.filter_by(username=...).first(), None if unknown.
+    # Unknown usernames are not cached so a new registration is seen immediately.
+    cache = user_cache()
+    profile = cache.get(username)
+    if profile is None:
+        row = db.session.execute(
+            db.select(User.id, User.tdee).where(User.username == username)
+        ).first()
+        if row is None:
+            return None
+        profile = UserProfile(*row)
+        cache.put(username, profile)
+    return profile
@@ -0,0 +1,216 @@
+import bisect
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from flask import current_app
+
+# A catalog entry; calories per 100 g and the usual serving in grams
+Food = namedtuple('Food', ['id', 'name', 'kcal_per_100g', 'serving_grams'])
+
+# On-disk format, little-endian:
+#   header   magic, version, food count, records, name index and strings offsets
+#   ids      food ids (uint32), ascending
+#   records  per id: kcal per 100 g and serving grams in tenths, name offset
+#            and length in the strings area
+#   index    record numbers (uint32) in casefolded name order, for prefix lookups
+#   strings  the names, UTF-8
+MAGIC = b'MTFOODS\0'
+VERSION = 1
+_HEADER = struct.Struct('<8sIIQQQ')
+_RECORD = struct.Struct('<IIIH2x')
+_UINT32 = struct.Struct('<I')
+
+
+class _Keys:
+    # A read-only sequence over the mapped file, so bisect can search it in place
+    def __init__(self, length, key):
+        self.length = length
+        self.key = key
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        return self.key(i)
+
+
+class FoodCatalog:
+    # Read-only food catalog memory-mapped from a file written by
+    # write_catalog(). Every worker maps the same file, so the operating
+    # system keeps one copy of it in the page cache for all of them; a lookup
+    # unpacks just the records it touches. Ids and name prefixes are found by
+    # binary search over the mapped id column and name index.
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._map) if len(self._map) >= _HEADER.size else (None,) * 6
+        magic, version, self.count, self._records_offset, index_offset, self._strings_offset = header
+        # Wrong magic or version, or cut short before the strings area
+        if magic != MAGIC or version != VERSION or self._strings_offset > len(self._map):
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} food catalog.")
+        self._views = []
+        self._ids = self._uint32_column(_HEADER.size)
+        self._index = self._uint32_column(index_offset)
+        self._names = _Keys(self.count, lambda i: self._name(self._index[i]).casefold())
+
+    def _uint32_column(self, offset):
+        # Zero-copy view where the machine is little-endian, unpacked per item otherwise
+        if sys.byteorder == 'little' and struct.calcsize('I') == 4:
+            view = memoryview(self._map)[offset:offset + self.count * 4].cast('I')
+            self._views.append(view)
+            return view
+        return _Keys(self.count, lambda i: _UINT32.unpack_from(self._map, offset + i * 4)[0])
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        # Views into the map have to go before the map can close
+        for view in self._views:
+            view.release()
+        self._map.close()
+
+    def _record(self, i):
+        return _RECORD.unpack_from(self._map, self._records_offset + i * _RECORD.size)
+
+    def _name(self, i):
+        _, _, offset, length = self._record(i)
+        start = self._strings_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def _food(self, i):
+        kcal, serving, offset, length = self._record(i)
+        start = self._strings_offset + offset
+        return Food(self._ids[i], self._map[start:start + length].decode('utf-8'), kcal / 10, serving / 10)
+
+    def get(self, food_id):
+        i = bisect.bisect_left(self._ids, food_id)
+        if i < self.count and self._ids[i] == food_id:
+            return self._food(i)
+        return None
+
+    def search(self, prefix, limit=20):
+        # Foods whose name starts with prefix, ignoring case, in name order
+        prefix = prefix.casefold()
+        foods = []
+        i = bisect.bisect_left(self._names, prefix)
+        while i < self.count and len(foods) < limit:
+            food = self._food(self._index[i])
+            if not food.name.casefold().startswith(prefix):
+                break
+            foods.append(food)
+            i += 1
+        return foods
+
+
+def write_catalog(path, foods):
+    # Write foods, (id, name, kcal_per_100g, serving_grams) tuples, as a
+    # catalog file. The file is replaced atomically: workers that already
+    # mapped the old one keep reading it until they reopen.
+    foods = sorted((int(food_id), str(name), float(kcal), float(serving)) for food_id, name, kcal, serving in foods)
+    for previous, food in zip(foods, foods[1:]):
+        if previous[0] == food[0]:
+            raise ValueError(f"Duplicate food id {food[0]}.")
+
+    strings = []
+    names = []
+    records = []
+    ids = []
+    offset = 0
+    for food_id, name, kcal, serving in foods:
+        if not 0 <= food_id < 2 ** 32:
+            raise ValueError(f"Food id {food_id} is out of range.")
+        if kcal < 0 or serving < 0:
+            raise ValueError(f"Food {food_id} has negative calories or serving size.")
+        encoded = name.encode('utf-8')
+        if len(encoded) > 0xffff:
+            # Cut long names on a character boundary, never inside one
+            name = encoded[:0xffff].decode('utf-8', 'ignore')
+            encoded = name.encode('utf-8')
+        ids.append(food_id)
+        records.append(_RECORD.pack(round(kcal * 10), round(serving * 10), offset, len(encoded)))
+        strings.append(encoded)
+        names.append(name)
+        offset += len(encoded)
+    # Sorted on the names as stored, which is what search() compares with
+    order = sorted(range(len(foods)), key=lambda i: (names[i].casefold(), ids[i]))
+
+    records_offset = _HEADER.size + len(ids) * _UINT32.size
+    index_offset = records_offset + len(records) * _RECORD.size
+    strings_offset = index_offset + len(order) * _UINT32.size
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(foods), records_offset, index_offset, strings_offset))
+            f.write(struct.pack(f'<{len(ids)}I', *ids))
+            f.write(b''.join(records))
+            f.write(struct.pack(f'<{len(order)}I', *order))
+            f.write(b''.join(strings))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return len(foods)
+
+
+class _CatalogFile:
+    # The app's catalog, opened on first use in each worker and reopened when
+    # the file is replaced, e.g. by 'flask build-food-catalog'
+    def __init__(self, path):
+        self.path = path
+        self._catalog = None
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key != self._stat:
+                # The old mapping is left to the garbage collector, another
+                # request may still be reading from it
+                self._catalog = FoodCatalog(self.path)
+                self._stat = key
+            return self._catalog
+
+
+def init_food_catalog(app):
+    path = app.config['FOOD_CATALOG_PATH'] or os.path.join(app.instance_path, 'foods.catalog')
+    app.extensions['food_catalog'] = _CatalogFile(path)
+
+
+def food_catalog():
+    # The FoodCatalog, or None when no catalog file has been built
+    return current_app.extensions['food_catalog'].get()
+
+
+def food_portion(food_id, grams=None):
+    # The catalog food and the calories in `grams` of it (a serving by
+    # default), or ValueError with a message for the client
+    catalog = food_catalog()
+    if catalog is None:
+        raise ValueError("The food catalog is not available.")
+    if isinstance(food_id, bool) or not isinstance(food_id, int):
+        raise ValueError("food_id must be an integer.")
+    food = catalog.get(food_id)
+    if food is None:
+        raise ValueError(f"Unknown food_id {food_id}.")
+    if grams is None:
+        grams = food.serving_grams or 100
+    if isinstance(grams, bool) or not isinstance(grams, (int, float)) or not math.isfinite(grams) or grams <= 0:
+        raise ValueError("grams must be a positive number.")
+    return food, round(food.kcal_per_100g * grams / 100)
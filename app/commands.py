@@ -0,0 +1,185 @@
+import click
+import csv
+import json
+import os
+from datetime import date, timedelta
+from flask import current_app
+from . import db
+from .archive import archive_meals
+from .catalog import write_catalog
+from .export import EXPORT_FORMATS, export_rows, export_body
+from .models import User
+from .migrations import SCHEMA_VERSION, current_version, upgrade_database
+from .rollup import rebuild_daily_totals, verify_daily_totals
+
+
+@click.group('daily-totals')
+def daily_totals_cli():
+    """Maintain the per-user daily calorie rollup."""
+
+
+@daily_totals_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the rollup from the meal table."""
+    rows = rebuild_daily_totals()
+    click.echo(f"Rebuilt {rows} daily total rows.")
+
+
+@daily_totals_cli.command('verify')
+def verify_command():
+    """Report days where the rollup and the meal table disagree."""
+    mismatches = verify_daily_totals()
+    for user_id, date in mismatches:
+        click.echo(f"Mismatch: user {user_id} {date}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} daily totals out of sync, run 'flask daily-totals rebuild'.")
+    click.echo("Daily totals are in sync.")
+
+
+@click.command('recompute-tdee')
+@click.option('--chunk-size', default=1000, show_default=True, help='Users read and updated per batch.')
+@click.option('--dry-run', is_flag=True, help='Print the changes without writing them.')
+def recompute_tdee_command(chunk_size, dry_run):
+    """Recompute every user's TDEE with the current formula."""
+    from .tdee import recompute_tdees
+    total_changed = 0
+    for processed, changes in recompute_tdees(chunk_size, dry_run):
+        total_changed += len(changes)
+        if dry_run:
+            for user_id, username, old, new in changes:
+                click.echo(f"{user_id} {username}: {old} -> {new}")
+        # Progress goes to stderr so a dry-run diff on stdout stays clean
+        click.echo(f"Processed {processed} users, {total_changed} changed.", err=True)
+    # Running workers keep their cached profiles until USER_CACHE_TTL runs
+    # out; clearing a cache here would only reach this process
+    verb = "would change" if dry_run else "updated"
+    click.echo(f"Done, {verb} {total_changed} users.")
+
+
+@click.command('db-upgrade')
+@click.option('--check', is_flag=True, help='Exit with an error if an upgrade is needed instead of running it.')
+def db_upgrade_command(check):
+    """Create or upgrade the database tables to the current schema version."""
+    if check:
+        with db.engine.connect() as conn:
+            version = current_version(conn)
+        if version != SCHEMA_VERSION:
+            raise click.ClickException(f"Database is at version {version}, expected {SCHEMA_VERSION}.")
+        click.echo(f"Database is at version {version}.")
+        return
+    before, after = upgrade_database()
+    if before == after:
+        click.echo(f"Database already at version {after}.")
+    elif before is None:
+        click.echo(f"Created database at version {after}.")
+    else:
+        click.echo(f"Upgraded database from version {before} to {after}.")
+
+
+@click.command('archive-meals')
+@click.option('--days', type=int, help='Archive meals older than this many days [default: MEAL_ARCHIVE_AFTER_DAYS].')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), help='Archive meals dated before this day instead.')
+@click.option('--chunk-size', default=5000, show_default=True, help='Meals moved per transaction.')
+def archive_meals_command(days, before, chunk_size):
+    """Move old meals from the meal table into per-month cold storage."""
+    if before is not None:
+        before = before.date()
+    else:
+        if days is None:
+            days = current_app.config['MEAL_ARCHIVE_AFTER_DAYS']
+        before = date.today() - timedelta(days=days)
+    moved = 0
+    for moved in archive_meals(before, chunk_size):
+        click.echo(f"Archived {moved} meals.", err=True)
+    click.echo(f"Done, archived {moved} meals dated before {before.isoformat()}.")
+
+
+@click.command('export-meals')
+@click.option('--username', help='Export only this user [default: every user].')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+@click.option('--after-id', type=int, default=0, help='Resume after this meal id.')
+@click.option('--output', '-o', default='-', show_default=True, help='File to write, - for stdout.')
+def export_meals_command(username, fmt, compress, after_id, output):
+    """Stream meals, archived ones included, in id order as CSV or NDJSON."""
+    user_id = None
+    if username is not None:
+        user_id = db.session.execute(db.select(User.id).where(User.username == username)).scalar()
+        if user_id is None:
+            raise click.ClickException(f"Username '{username}' does not exist.")
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    progress = {'meals': 0, 'last_id': after_id}
+
+    def counted(rows):
+        for row in rows:
+            progress['meals'] += 1
+            progress['last_id'] = row[0]
+            yield row
+
+    # The encoder takes one chunk of rows per piece it returns, so once a piece
+    # is written every meal up to last_id is in the output
+    written_id = after_id
+    try:
+        with click.open_file(output, 'wb') as f:
+            for piece in export_body(counted(export_rows(user_id, after_id, chunk_size)), fmt, compress, chunk_size):
+                f.write(piece)
+                written_id = progress['last_id']
+    except BaseException:
+        if not compress:
+            click.echo(f"Stopped, resume with --after-id {written_id}.", err=True)
+        raise
+    click.echo(f"Exported {progress['meals']} meals, last id {progress['last_id']}.", err=True)
+
+
+@click.command('daily-report')
+@click.option('--date', 'day', type=click.DateTime(formats=['%Y-%m-%d']), help='Day to report on [default: yesterday].')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True, help='Worker processes.')
+@click.option('--partitions', type=int, help='User id ranges to split the work into [default: 4 per worker].')
+@click.option('--top', default=10, show_default=True, help='Offenders listed.')
+@click.option('--bucket-width', default=100, show_default=True, help='Calories per histogram bucket.')
+@click.option('--output', '-o', default='-', show_default=True, help='File to write, - for stdout.')
+def daily_report_command(day, workers, partitions, top, bucket_width, output):
+    """Write a JSON report of who exceeded their TDEE on a day."""
+    from .report import daily_report
+    day = day.date() if day is not None else date.today() - timedelta(days=1)
+    try:
+        report = daily_report(day, max(1, workers), partitions, top, bucket_width)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    with click.open_file(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    click.echo(f"{report['exceeded']} of {report['users_logged']} users who logged meals exceeded their TDEE "
+               f"({report['partitions']} partitions, {report['workers']} workers, {report['seconds']}s).", err=True)
+
+
+@click.command('build-food-catalog')
+@click.argument('source', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--output', '-o', help='Catalog file to write [default: FOOD_CATALOG_PATH].')
+def build_food_catalog_command(source, output):
+    """Build the food catalog from a CSV of id,name,kcal_per_100g,serving_grams."""
+    output = output or current_app.extensions['food_catalog'].path
+    foods = []
+    with click.open_file(source, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                foods.append((int(row['id']), row['name'], float(row['kcal_per_100g']),
+                              float(row['serving_grams'] or 0)))
+            except (KeyError, TypeError, ValueError) as e:
+                raise click.ClickException(f"Line {reader.line_num}: bad or missing value ({e}).")
+    try:
+        count = write_catalog(output, foods)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Wrote {count} foods to {output}.")
+
+
+def register_commands(app):
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(daily_totals_cli)
+    app.cli.add_command(recompute_tdee_command)
+    app.cli.add_command(archive_meals_command)
+    app.cli.add_command(export_meals_command)
+    app.cli.add_command(daily_report_command)
+    app.cli.add_command(build_food_catalog_command)
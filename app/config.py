@@ -1,3 +1,91 @@
 class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///meals.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Upgrade the database on startup when its schema version is behind
+    DB_AUTO_UPGRADE = True
+    # PRAGMA name -> value applied to every new SQLite connection.
+    # foreign_keys enforces the ON DELETE CASCADE from users to their meals.
+    SQLITE_PRAGMAS = {'foreign_keys': 'ON'}
+    # Retries (with exponential backoff, in seconds) when SQLite reports SQLITE_BUSY on a write
+    DB_WRITE_RETRIES = 3
+    DB_WRITE_RETRY_BACKOFF = 0.01
+    # Rows fetched per query and encoded per piece by GET /export and 'flask export-meals'
+    EXPORT_CHUNK_SIZE = 1000
+    # Largest page GET /meals/<username>?limit= will return
+    MEALS_MAX_PAGE_SIZE = 1000
+    # Rows fetched per round trip when streaming meals
+    MEALS_STREAM_CHUNK_SIZE = 500
+    # Most meals accepted by one POST /meals/bulk request
+    MEALS_BULK_MAX_ROWS = 10000
+    # Per-process cache of username -> (id, tdee) used by the meal routes
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 60
+    # Most ids POST /batch/meals and usernames POST /batch/daily_summary accept,
+    # and the longest date range in days the latter covers
+    BATCH_MAX_IDS = 1000
+    BATCH_MAX_USERNAMES = 500
+    BATCH_MAX_DAYS = 366
+    # Results returned by GET /search and GET /autocomplete without and with ?limit=
+    SEARCH_DEFAULT_LIMIT = 20
+    SEARCH_MAX_LIMIT = 100
+    # Serialized GET /meals/<username> bodies kept per (query, data version), 0 disables
+    MEALS_BODY_CACHE_SIZE = 256
+    MEALS_BODY_CACHE_MAX_BYTES = 65536
+    # Food catalog built by 'flask build-food-catalog', default <instance path>/foods.catalog,
+    # and the results GET /foods returns without and with ?limit=
+    FOOD_CATALOG_PATH = None
+    FOODS_DEFAULT_LIMIT = 20
+    FOODS_MAX_LIMIT = 100
+    # Cold storage for 'flask archive-meals', default <instance path>/archive,
+    # and the age in days past which meals are moved there
+    MEAL_ARCHIVE_DIR = None
+    MEAL_ARCHIVE_AFTER_DAYS = 365
+    # Group-commit add_meal through a single writer thread
+    MEAL_WRITE_BEHIND = False
+    MEAL_WRITE_BATCH_SIZE = 100
+    MEAL_WRITE_MAX_DELAY = 0.005  # seconds a batch waits to fill up
+    MEAL_WRITE_TIMEOUT = 10  # seconds a request waits for its batch
+    # Admission control for the write routes, all off by default (None).
+    # Token buckets per username and per client IP: writes per second and burst size.
+    WRITE_RATE_PER_USER = None
+    WRITE_BURST_PER_USER = 10
+    WRITE_RATE_PER_IP = None
+    WRITE_BURST_PER_IP = 50
+    WRITE_RATE_MAX_KEYS = 100000  # buckets kept per kind, least recently used dropped
+    # Writes running at once, writes waiting for a slot and how long they wait
+    WRITE_MAX_IN_FLIGHT = None
+    WRITE_MAX_QUEUED = 32
+    WRITE_QUEUE_TIMEOUT = 1.0  # seconds
+    WRITE_RETRY_AFTER = 1  # seconds, sent with 503 responses
+    # Per-request timing and SQL instrumentation exposed at /metrics
+    METRICS_ENABLED = True
+    METRICS_SLOW_QUERY_SECONDS = 0.1
+    METRICS_SLOW_QUERY_SAMPLES = 50
+    # Log a warning when one request issues more queries than this (None disables)
+    METRICS_QUERY_WARNING_THRESHOLD = None
+
+
+class ProductionConfig(Config):
+    # WAL lets readers run alongside the single writer, the other pragmas
+    # trade a little durability on power loss for far fewer fsyncs
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # ms
+        'cache_size': -65536,  # KiB, i.e. 64 MiB
+        'mmap_size': 268435456,  # 256 MiB
+        'temp_store': 'MEMORY',
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 10,
+        'connect_args': {'check_same_thread': False},
+    }
+    DB_WRITE_RETRIES = 8
+    DB_WRITE_RETRY_BACKOFF = 0.005
+    # One writer at a time in SQLite, a few more only wait on its lock
+    WRITE_MAX_IN_FLIGHT = 4
+    # Schema upgrades run once per deploy via 'flask db-upgrade'
+    DB_AUTO_UPGRADE = False
@@ -0,0 +1,140 @@
+import csv
+import heapq
+import io
+import json
+import zlib
+from functools import lru_cache
+from itertools import islice
+from . import db
+from .archive import meal_archive
+from .models import ArchivedMeal, ArchivedMonth, Meal, User
+from .streaming import NDJSON_MIMETYPE
+
+# Columns of an exported meal, in order; the user id stays stable across renames
+EXPORT_COLUMNS = ('id', 'user_id', 'username', 'name', 'description', 'calories', 'date')
+
+
+def _hot_rows(user_id, after_id, chunk_size):
+    # Keyset chunks by id over the meal table. Each chunk is its own short
+    # read, so a long export never holds up writers.
+    query = (
+        db.select(Meal.id, Meal.user_id, User.username, Meal.name, Meal.description, Meal.calories, Meal.date)
+        .join(User, User.id == Meal.user_id)
+    )
+    if user_id is not None:
+        query = query.where(Meal.user_id == user_id)
+    last = after_id
+    while True:
+        rows = db.session.execute(query.where(Meal.id > last).order_by(Meal.id).limit(chunk_size)).all()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1].id
+
+
+@lru_cache(maxsize=256)
+def _archived_month(archive, user_id, month, generation):
+    # A generation never changes once written, so decoded files can be shared
+    return {meal[0]: meal for meal in archive.read(user_id, month, generation)}
+
+
+def _archived_rows(after_id, chunk_size):
+    # Every user's archived meals in id order, keyset chunks over archived_meal
+    archive = meal_archive()
+    query = (
+        db.select(ArchivedMeal.id, ArchivedMeal.user_id, ArchivedMeal.month, ArchivedMonth.generation, User.username)
+        .join(ArchivedMonth, (ArchivedMonth.user_id == ArchivedMeal.user_id) & (ArchivedMonth.month == ArchivedMeal.month))
+        .join(User, User.id == ArchivedMeal.user_id)
+    )
+    last = after_id
+    while True:
+        entries = db.session.execute(query.where(ArchivedMeal.id > last).order_by(ArchivedMeal.id).limit(chunk_size)).all()
+        for entry in entries:
+            meal_id, name, description, calories, day = _archived_month(
+                archive, entry.user_id, entry.month, entry.generation)[entry.id]
+            yield meal_id, entry.user_id, entry.username, name, description, calories, day
+        if len(entries) < chunk_size:
+            return
+        last = entries[-1].id
+
+
+def _user_archived_rows(user_id, after_id):
+    # One user's archived meals in id order. Their month files are read whole,
+    # which bounds memory by that user's archive rather than everyone's.
+    archive = meal_archive()
+    months = db.session.execute(
+        db.select(ArchivedMonth.month, ArchivedMonth.generation, User.username)
+        .join(User, User.id == ArchivedMonth.user_id)
+        .where(ArchivedMonth.user_id == user_id)
+    ).all()
+    rows = [
+        (meal_id, user_id, username, name, description, calories, day)
+        for month, generation, username in months
+        for meal_id, name, description, calories, day in archive.read(user_id, month, generation)
+        if meal_id > after_id
+    ]
+    rows.sort()
+    return rows
+
+
+def export_rows(user_id=None, after_id=0, chunk_size=1000):
+    # Meals after after_id in id order, from both the meal table and the
+    # archive, as EXPORT_COLUMNS tuples. user_id None exports every user.
+    if user_id is None:
+        archived = _archived_rows(after_id, chunk_size)
+    else:
+        archived = _user_archived_rows(user_id, after_id)
+    return heapq.merge(_hot_rows(user_id, after_id, chunk_size), archived, key=lambda row: row[0])
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _csv_text(rows, chunk_size):
+    # Header, then one block of lines per chunk of rows
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for chunk in _chunks(rows, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def _ndjson_text(rows, chunk_size):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(
+            dumps({'id': meal_id, 'user_id': user_id, 'username': username, 'name': name,
+                   'description': description, 'calories': calories, 'date': day.isoformat()}) + '\n'
+            for meal_id, user_id, username, name, description, calories, day in chunk
+        )
+
+
+# format -> (text generator, mimetype)
+EXPORT_FORMATS = {
+    'csv': (_csv_text, 'text/csv'),
+    'ndjson': (_ndjson_text, NDJSON_MIMETYPE),
+}
+
+
+def _gzip(chunks):
+    # Compress on the fly into a single gzip member
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_body(rows, fmt, compress=False, chunk_size=1000):
+    # The export as an iterator of bytes, one piece per chunk of rows
+    text, _ = EXPORT_FORMATS[fmt]
+    body = (piece.encode() for piece in text(rows, chunk_size))
+    return _gzip(body) if compress else body
@@ -0,0 +1,201 @@
+import bisect
+import threading
+import time
+from collections import deque
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from . import db
+
+# Histogram bucket upper bounds
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class RequestStats:
+    # What one request did, filled in by the engine and request hooks
+    __slots__ = ('start', 'queries', 'sql_time', 'rows', 'status')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.status = 500
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    # Per-endpoint aggregates and a bounded sample of slow queries
+
+    def __init__(self, slow_query_samples=50):
+        self.durations = {}
+        self.queries = {}
+        self.sql_time = {}
+        self.rows = {}
+        self.responses = {}
+        self.slow_queries = deque(maxlen=slow_query_samples)
+        self.slow_query_counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, stats, duration):
+        with self._lock:
+            if endpoint not in self.durations:
+                self.durations[endpoint] = Histogram(DURATION_BUCKETS)
+                self.queries[endpoint] = Histogram(QUERY_BUCKETS)
+                self.sql_time[endpoint] = Histogram(DURATION_BUCKETS)
+                self.rows[endpoint] = Histogram(ROW_BUCKETS)
+            self.durations[endpoint].observe(duration)
+            self.queries[endpoint].observe(stats.queries)
+            self.sql_time[endpoint].observe(stats.sql_time)
+            self.rows[endpoint].observe(stats.rows)
+            key = (endpoint, stats.status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def record_slow_query(self, endpoint, statement, duration):
+        with self._lock:
+            self.slow_query_counts[endpoint] = self.slow_query_counts.get(endpoint, 0) + 1
+            self.slow_queries.append({
+                'endpoint': endpoint,
+                'statement': statement[:1000],
+                'seconds': round(duration, 6),
+                'at': time.time(),
+            })
+
+    def render(self, extra=()):
+        # Prometheus text exposition format
+        lines = []
+        with self._lock:
+            histograms = (
+                ('meal_tracker_request_duration_seconds', 'Wall time per request.', self.durations),
+                ('meal_tracker_request_queries', 'SQL statements per request.', self.queries),
+                ('meal_tracker_request_sql_seconds', 'Time spent in SQL per request.', self.sql_time),
+                ('meal_tracker_request_rows', 'Rows fetched from the database per request.', self.rows),
+            )
+            for name, help_text, series in histograms:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for endpoint, histogram in sorted(series.items()):
+                    lines.extend(histogram.render(name, f'endpoint="{endpoint}"'))
+
+            lines.append('# HELP meal_tracker_responses_total Responses by endpoint and status code.')
+            lines.append('# TYPE meal_tracker_responses_total counter')
+            for (endpoint, status), count in sorted(self.responses.items()):
+                lines.append(f'meal_tracker_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+            lines.append('# HELP meal_tracker_slow_queries_total Queries slower than METRICS_SLOW_QUERY_SECONDS.')
+            lines.append('# TYPE meal_tracker_slow_queries_total counter')
+            for endpoint, count in sorted(self.slow_query_counts.items()):
+                lines.append(f'meal_tracker_slow_queries_total{{endpoint="{endpoint}"}} {count}')
+
+        for name, kind, help_text, value in extra:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def _endpoint():
+    return request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+
+
+def _on_connect(dbapi_connection, connection_record):
+    # Count fetched rows against whichever request last executed on this connection
+    info = connection_record.info
+
+    def counting_row_factory(cursor, row):
+        stats = info.get('request_stats')
+        if stats is not None:
+            stats.rows += 1
+        return row
+
+    dbapi_connection.row_factory = counting_row_factory
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    conn.info['request_stats'] = stats
+    if stats is not None:
+        conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = conn.info.get('request_stats')
+    if stats is None:
+        return
+    duration = time.perf_counter() - conn.info['query_start']
+    stats.queries += 1
+    stats.sql_time += duration
+    if duration >= current_app.config['METRICS_SLOW_QUERY_SECONDS']:
+        current_app.extensions['metrics'].record_slow_query(_endpoint(), statement, duration)
+
+
+def _start_request():
+    g.request_stats = RequestStats()
+
+
+def _finish_response(response):
+    stats = g.get('request_stats')
+    if stats is not None:
+        stats.status = response.status_code
+    return response
+
+
+def _record_request(exc):
+    stats = g.pop('request_stats', None)
+    if stats is None or request.endpoint == 'routes.metrics':
+        return
+    duration = time.perf_counter() - stats.start
+    endpoint = _endpoint()
+    current_app.extensions['metrics'].record(endpoint, stats, duration)
+
+    # Opt-in N+1 detection
+    threshold = current_app.config['METRICS_QUERY_WARNING_THRESHOLD']
+    if threshold is not None and stats.queries > threshold:
+        current_app.logger.warning(
+            "%s %s issued %d SQL queries (threshold %d), possible N+1 pattern",
+            request.method, request.path, stats.queries, threshold,
+        )
+
+
+def init_metrics(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['metrics'] = MetricsRegistry(app.config['METRICS_SLOW_QUERY_SAMPLES'])
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'connect', _on_connect)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_record_request)
@@ -0,0 +1,268 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from . import db
+
+# Formats seen in string-typed date columns written by older versions
+LEGACY_DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y/%m/%d')
+
+
+def _parse_legacy_date(value):
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+# Migrations are written against the table layout of their own version
+# rather than the current models, so they keep working as the models change.
+
+def _migrate_to_2(conn):
+    # Meal dates become a DATE column with a (username, date) index, plus the daily rollup.
+    # Normalise every non-ISO value while the column is still a string.
+    rows = conn.execute(text(
+        "SELECT id, date FROM meal WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+    )).all()
+    for meal_id, value in rows:
+        parsed = _parse_legacy_date(value)
+        if parsed is None:
+            raise RuntimeError(f"Meal {meal_id} has an unreadable date '{value}', fix it before upgrading.")
+        conn.execute(text("UPDATE meal SET date = :date WHERE id = :id"), {'date': parsed.isoformat(), 'id': meal_id})
+
+    # SQLite cannot change a column type, so rebuild the table
+    conn.execute(text("DROP TABLE IF EXISTS meal_new"))
+    conn.execute(text(
+        "CREATE TABLE meal_new (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, username VARCHAR(100) NOT NULL, "
+        "description VARCHAR(200), calories INTEGER NOT NULL, date DATE NOT NULL, PRIMARY KEY (id))"
+    ))
+    conn.execute(text(
+        "INSERT INTO meal_new (id, name, username, description, calories, date) "
+        "SELECT id, name, username, description, calories, date FROM meal"
+    ))
+    conn.execute(text("DROP TABLE meal"))
+    conn.execute(text("ALTER TABLE meal_new RENAME TO meal"))
+    conn.execute(text("CREATE INDEX ix_meal_username_date ON meal (username, date)"))
+
+    conn.execute(text("DROP TABLE IF EXISTS daily_total"))
+    conn.execute(text(
+        "CREATE TABLE daily_total (username VARCHAR(100) NOT NULL, date DATE NOT NULL, "
+        "calories INTEGER NOT NULL, meal_count INTEGER NOT NULL, PRIMARY KEY (username, date))"
+    ))
+    conn.execute(text(
+        "INSERT INTO daily_total (username, date, calories, meal_count) "
+        "SELECT username, date, SUM(calories), COUNT(id) FROM meal GROUP BY username, date"
+    ))
+
+
+def _migrate_to_3(conn):
+    # Per-user data versions backing the ETags of the meal reads
+    conn.execute(text(
+        "CREATE TABLE data_version (username VARCHAR(100) NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (username))"
+    ))
+
+
+def _migrate_to_4(conn):
+    # Full-text index over meal names and descriptions, and the autocomplete index
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE meal_fts USING fts5(name, description, username, content='meal', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    conn.execute(text("INSERT INTO meal_fts (meal_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 0.0)')"))
+    conn.execute(text(
+        "CREATE TRIGGER meal_fts_insert AFTER INSERT ON meal BEGIN "
+        "INSERT INTO meal_fts (rowid, name, description, username) VALUES (new.id, new.name, new.description, new.username); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER meal_fts_delete AFTER DELETE ON meal BEGIN "
+        "INSERT INTO meal_fts (meal_fts, rowid, name, description, username) "
+        "VALUES ('delete', old.id, old.name, old.description, old.username); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER meal_fts_update AFTER UPDATE OF name, description, username ON meal BEGIN "
+        "INSERT INTO meal_fts (meal_fts, rowid, name, description, username) "
+        "VALUES ('delete', old.id, old.name, old.description, old.username); "
+        "INSERT INTO meal_fts (rowid, name, description, username) VALUES (new.id, new.name, new.description, new.username); END"
+    ))
+    conn.execute(text("INSERT INTO meal_fts (meal_fts) VALUES ('rebuild')"))
+    conn.execute(text("CREATE INDEX ix_meal_username_name ON meal (username, name COLLATE NOCASE)"))
+
+
+def _migrate_to_5(conn):
+    # Meals reference their user by an integer foreign key instead of the username.
+    # Meals whose user was deleted could never be read or removed, drop them.
+    orphans = conn.execute(text(
+        'DELETE FROM meal WHERE username NOT IN (SELECT username FROM "user")'
+    )).rowcount
+    if orphans:
+        current_app.logger.warning("Dropped %d meals of deleted users.", orphans)
+
+    # The search index and its triggers refer to meal.username
+    for trigger in ('meal_fts_insert', 'meal_fts_delete', 'meal_fts_update'):
+        conn.execute(text(f"DROP TRIGGER {trigger}"))
+    conn.execute(text("DROP TABLE meal_fts"))
+
+    conn.execute(text("DROP TABLE IF EXISTS meal_new"))
+    conn.execute(text(
+        "CREATE TABLE meal_new (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, user_id INTEGER NOT NULL, "
+        "description VARCHAR(200), calories INTEGER NOT NULL, date DATE NOT NULL, PRIMARY KEY (id), "
+        'FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'
+    ))
+    conn.execute(text(
+        "INSERT INTO meal_new (id, name, user_id, description, calories, date) "
+        'SELECT meal.id, meal.name, "user".id, meal.description, meal.calories, meal.date '
+        'FROM meal JOIN "user" ON "user".username = meal.username'
+    ))
+    conn.execute(text("DROP TABLE meal"))
+    conn.execute(text("ALTER TABLE meal_new RENAME TO meal"))
+    conn.execute(text("CREATE INDEX ix_meal_user_id_date ON meal (user_id, date)"))
+    conn.execute(text("CREATE INDEX ix_meal_user_id_name ON meal (user_id, name COLLATE NOCASE)"))
+
+    conn.execute(text("DROP TABLE daily_total"))
+    conn.execute(text(
+        "CREATE TABLE daily_total (user_id INTEGER NOT NULL, date DATE NOT NULL, "
+        "calories INTEGER NOT NULL, meal_count INTEGER NOT NULL, PRIMARY KEY (user_id, date), "
+        'FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'
+    ))
+    conn.execute(text(
+        "INSERT INTO daily_total (user_id, date, calories, meal_count) "
+        "SELECT user_id, date, SUM(calories), COUNT(id) FROM meal GROUP BY user_id, date"
+    ))
+
+    # Carry the counters over to user ids: starting again from 0 would let
+    # tags handed out before the upgrade match again after a few writes
+    conn.execute(text("DROP TABLE IF EXISTS data_version_old"))
+    conn.execute(text("ALTER TABLE data_version RENAME TO data_version_old"))
+    conn.execute(text(
+        "CREATE TABLE data_version (user_id INTEGER NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (user_id))"
+    ))
+    conn.execute(text(
+        "INSERT INTO data_version (user_id, version) "
+        'SELECT "user".id, data_version_old.version FROM data_version_old '
+        'JOIN "user" ON "user".username = data_version_old.username'
+    ))
+    conn.execute(text("DROP TABLE data_version_old"))
+
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE meal_fts USING fts5(name, description, user_id, content='meal', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    conn.execute(text("INSERT INTO meal_fts (meal_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 0.0)')"))
+    _create_fts_triggers_5(conn)
+    conn.execute(text("INSERT INTO meal_fts (meal_fts) VALUES ('rebuild')"))
+
+
+def _create_fts_triggers_5(conn):
+    # The search index triggers as of version 5, on meal.user_id
+    conn.execute(text(
+        "CREATE TRIGGER meal_fts_insert AFTER INSERT ON meal BEGIN "
+        "INSERT INTO meal_fts (rowid, name, description, user_id) VALUES (new.id, new.name, new.description, new.user_id); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER meal_fts_delete AFTER DELETE ON meal BEGIN "
+        "INSERT INTO meal_fts (meal_fts, rowid, name, description, user_id) "
+        "VALUES ('delete', old.id, old.name, old.description, old.user_id); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER meal_fts_update AFTER UPDATE OF name, description, user_id ON meal BEGIN "
+        "INSERT INTO meal_fts (meal_fts, rowid, name, description, user_id) "
+        "VALUES ('delete', old.id, old.name, old.description, old.user_id); "
+        "INSERT INTO meal_fts (rowid, name, description, user_id) VALUES (new.id, new.name, new.description, new.user_id); END"
+    ))
+
+
+def _migrate_to_6(conn):
+    # Meal ids become AUTOINCREMENT so archived ids are never reused, plus the
+    # archive's bookkeeping tables. Ids are kept, so meal_fts stays valid;
+    # its triggers go with the old table and are recreated.
+    conn.execute(text("DROP TABLE IF EXISTS meal_new"))
+    conn.execute(text(
+        "CREATE TABLE meal_new (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, name VARCHAR(100) NOT NULL, "
+        "user_id INTEGER NOT NULL, description VARCHAR(200), calories INTEGER NOT NULL, date DATE NOT NULL, "
+        'FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'
+    ))
+    conn.execute(text(
+        "INSERT INTO meal_new (id, name, user_id, description, calories, date) "
+        "SELECT id, name, user_id, description, calories, date FROM meal"
+    ))
+    conn.execute(text("DROP TABLE meal"))
+    conn.execute(text("ALTER TABLE meal_new RENAME TO meal"))
+    conn.execute(text("CREATE INDEX ix_meal_user_id_date ON meal (user_id, date)"))
+    conn.execute(text("CREATE INDEX ix_meal_user_id_name ON meal (user_id, name COLLATE NOCASE)"))
+    _create_fts_triggers_5(conn)
+
+    conn.execute(text(
+        "CREATE TABLE archived_month (user_id INTEGER NOT NULL, month VARCHAR(7) NOT NULL, generation INTEGER NOT NULL, "
+        'PRIMARY KEY (user_id, month), FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'
+    ))
+    conn.execute(text(
+        "CREATE TABLE archived_meal (id INTEGER NOT NULL, user_id INTEGER NOT NULL, month VARCHAR(7) NOT NULL, "
+        'PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'
+    ))
+    conn.execute(text(
+        "CREATE TABLE archived_total (user_id INTEGER NOT NULL, date DATE NOT NULL, "
+        "calories INTEGER NOT NULL, meal_count INTEGER NOT NULL, PRIMARY KEY (user_id, date), "
+        'FOREIGN KEY(user_id) REFERENCES "user" (id) ON DELETE CASCADE)'
+    ))
+
+
+# (version, migration) in order, version 1 being the original layout
+MIGRATIONS = [
+    (2, _migrate_to_2),
+    (3, _migrate_to_3),
+    (4, _migrate_to_4),
+    (5, _migrate_to_5),
+    (6, _migrate_to_6),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _detect_version(conn):
+    # Databases from before the schema_version table: work the version out from the layout
+    inspector = db.inspect(conn)
+    if not inspector.has_table('meal'):
+        return None
+    for column in inspector.get_columns('meal'):
+        if column['name'] == 'date' and isinstance(column['type'], db.String):
+            return 1
+    return 2
+
+
+def current_version(conn):
+    # Stored schema version, or None for an empty database
+    try:
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    except OperationalError:
+        conn.rollback()
+        return _detect_version(conn)
+    return version if version is not None else _detect_version(conn)
+
+
+def _stamp(conn, version):
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {'version': version})
+
+
+def upgrade_database():
+    # Bring the database to SCHEMA_VERSION, return (version before, version after).
+    # When the database is current this is a single SELECT.
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    if version == SCHEMA_VERSION:
+        return version, version
+
+    with db.engine.begin() as conn:
+        # pysqlite only opens a transaction before INSERT/UPDATE/DELETE, so DDL
+        # ahead of those would commit on its own. Open it explicitly, so a
+        # failed upgrade leaves nothing behind, stamp included.
+        conn.exec_driver_sql('BEGIN')
+        if version is not None:
+            for target, migrate in MIGRATIONS:
+                if target > version:
+                    migrate(conn)
+        # Create whatever the migrations did not, including schema_version itself
+        db.metadata.create_all(conn)
+        _stamp(conn, SCHEMA_VERSION)
+    return version, SCHEMA_VERSION
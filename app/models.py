@@ -3,10 +3,21 @@ from . import db
 class Meal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    username = db.Column(db.String(100), nullable=False)
+    # Meals go with their user (needs PRAGMA foreign_keys, see Config.SQLITE_PRAGMAS)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     description = db.Column(db.String(200), nullable=True)
     calories = db.Column(db.Integer, nullable=False)
-    date = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+
+    user = db.relationship('User')
+
+    # Serves per-user lookups and date range scans, and name prefix lookups.
+    # AUTOINCREMENT so the ids of archived meals are never handed out again.
+    __table_args__ = (
+        db.Index('ix_meal_user_id_date', 'user_id', 'date'),
+        db.Index('ix_meal_user_id_name', 'user_id', db.text('name COLLATE NOCASE')),
+        {'sqlite_autoincrement': True},
+    )
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,4 +25,53 @@ class User(db.Model):
     height = db.Column(db.Integer, nullable=False)  # height in cm
     weight = db.Column(db.Integer, nullable=False)  # weight in kg
     activity_level = db.Column(db.Integer, nullable=False)  # activity level from 1 to 5
-    tdee = db.Column(db.Integer, nullable=True)
\ No newline at end of file
+    tdee = db.Column(db.Integer, nullable=True)
+
+class DailyTotal(db.Model):
+    # Per-user, per-day calorie rollup kept in step with the meal table
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    calories = db.Column(db.Integer, nullable=False, default=0)
+    meal_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SchemaVersion(db.Model):
+    # Layout version of the database, maintained by app/migrations.py
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True)
+
+
+class DataVersion(db.Model):
+    # Per-user counter bumped in the same transaction as every change to the
+    # user's meals, so reads can be validated with an ETag alone. Rows outlive
+    # their user on purpose: a reused user id keeps counting up.
+    __tablename__ = 'data_version'
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ArchivedMonth(db.Model):
+    # The committed generation of each user-month file in cold storage, see
+    # app/archive.py. Files of any other generation are ignored.
+    __tablename__ = 'archived_month'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    generation = db.Column(db.Integer, nullable=False)
+
+
+class ArchivedMeal(db.Model):
+    # Which user-month file each archived meal lives in, for lookups by id
+    __tablename__ = 'archived_meal'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)
+
+
+class ArchivedTotal(db.Model):
+    # Per-day sums of the archived meals, so the rollup can still be rebuilt
+    # and verified with set-based SQL after meals leave the meal table
+    __tablename__ = 'archived_total'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    calories = db.Column(db.Integer, nullable=False, default=0)
+    meal_count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,123 @@
+import heapq
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+from . import db
+
+# Partition queries over one user id range, run on a worker's own read-only
+# connection. CROSS JOIN keeps SQLite from reordering the join: walk the user
+# id range and look up each user's day in daily_total by its primary key,
+# rather than scan every day of every user in the range.
+_FROM = (
+    'FROM "user" u CROSS JOIN daily_total d ON d.user_id = u.id AND d.date = :date '
+    'WHERE u.id BETWEEN :low AND :high AND u.tdee IS NOT NULL'
+)
+_USERS_SQL = 'SELECT COUNT(*), COUNT(tdee) FROM "user" WHERE id BETWEEN :low AND :high'
+_SUMMARY_SQL = (
+    'SELECT COUNT(*), SUM(d.calories > u.tdee), SUM(MAX(d.calories - u.tdee, 0)) ' + _FROM
+)
+# Remaining calories floored to the bucket width; integer division alone truncates toward zero
+_HISTOGRAM_SQL = (
+    'SELECT CASE WHEN u.tdee - d.calories >= 0 THEN (u.tdee - d.calories) / :width '
+    'ELSE (u.tdee - d.calories - :width + 1) / :width END AS bucket, COUNT(*) '
+    + _FROM + ' GROUP BY bucket'
+)
+_TOP_SQL = (
+    'SELECT u.id, u.username, u.tdee, d.calories, d.calories - u.tdee AS excess '
+    + _FROM + ' AND d.calories > u.tdee ORDER BY excess DESC, u.id LIMIT :top'
+)
+
+
+def _read_only(path):
+    return sqlite3.connect(f'file:{quote(path)}?mode=ro', uri=True)
+
+
+def report_partition(path, day, low, high, top, width):
+    # Partial report for users low..high: counts, a histogram of remaining
+    # calories keyed by bucket and this partition's top offenders
+    params = {'date': day, 'low': low, 'high': high, 'top': top, 'width': width}
+    conn = _read_only(path)
+    try:
+        users, with_tdee = conn.execute(_USERS_SQL, params).fetchone()
+        logged, exceeded, excess = conn.execute(_SUMMARY_SQL, params).fetchone()
+        histogram = dict(conn.execute(_HISTOGRAM_SQL, params).fetchall())
+        offenders = conn.execute(_TOP_SQL, params).fetchall()
+    finally:
+        conn.close()
+    return {
+        'users': users,
+        'users_without_tdee': users - with_tdee,
+        'users_logged': logged,
+        'exceeded': exceeded or 0,
+        'excess_calories': excess or 0,
+        'histogram': histogram,
+        'top': offenders,
+    }
+
+
+def merge_partials(partials, top):
+    # Counts add up, histograms add bucket by bucket, and the overall top k is
+    # the top k of the partitions' top k lists
+    merged = Counter()
+    histogram = Counter()
+    offenders = []
+    for partial in partials:
+        for key in ('users', 'users_without_tdee', 'users_logged', 'exceeded', 'excess_calories'):
+            merged[key] += partial[key]
+        histogram.update(partial['histogram'])
+        offenders.append(partial['top'])
+    best = heapq.nlargest(top, (row for rows in offenders for row in rows), key=lambda row: (row[4], -row[0]))
+    return dict(merged), histogram, best
+
+
+def user_id_ranges(partitions):
+    # Split the user ids into at most `partitions` contiguous, inclusive ranges
+    low, high = db.session.execute(db.text('SELECT MIN(id), MAX(id) FROM "user"')).one()
+    if low is None:
+        return []
+    size = max(1, -(-(high - low + 1) // partitions))
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
+
+
+def daily_report(day, workers=1, partitions=None, top=10, width=100):
+    # The compliance report for one day as a JSON-ready dict. Partitions run
+    # in a process pool when workers > 1, in this process otherwise.
+    path = db.engine.url.database
+    if not path or path == ':memory:':
+        raise ValueError("daily_report needs a file-backed SQLite database.")
+    began = time.perf_counter()
+    ranges = user_id_ranges(partitions or workers * 4)
+    jobs = [(path, day.isoformat(), low, high, top, width) for low, high in ranges]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(report_partition, *zip(*jobs))) if jobs else []
+    else:
+        partials = [report_partition(*job) for job in jobs]
+    merged, histogram, best = merge_partials(partials, top)
+
+    logged = merged.get('users_logged', 0)
+    return {
+        'date': day.isoformat(),
+        'users': merged.get('users', 0),
+        'users_without_tdee': merged.get('users_without_tdee', 0),
+        'users_logged': logged,
+        'exceeded': merged.get('exceeded', 0),
+        'exceeded_share': round(merged.get('exceeded', 0) / logged, 4) if logged else None,
+        'excess_calories': merged.get('excess_calories', 0),
+        'top_offenders': [
+            {'user_id': user_id, 'username': username, 'tdee': tdee, 'calories': calories, 'excess': excess}
+            for user_id, username, tdee, calories, excess in best
+        ],
+        'remaining_histogram': {
+            'bucket_width': width,
+            'buckets': [
+                {'from': bucket * width, 'to': (bucket + 1) * width, 'count': histogram[bucket]}
+                for bucket in sorted(histogram)
+            ],
+        },
+        'partitions': len(ranges),
+        'workers': workers,
+        'seconds': round(time.perf_counter() - began, 3),
+    }
@@ -0,0 +1,109 @@
+from sqlalchemy.dialects.sqlite import insert
+from . import db
+from .models import ArchivedTotal
+from .models import DailyTotal
+from .models import Meal
+
+
+def add_to_daily_total(user_id, date, calories, meal_count=1):
+    # Apply a delta to the (user_id, date) rollup row inside the current transaction.
+    # Negative deltas are used when a meal is removed from a day.
+    stmt = insert(DailyTotal).values(user_id=user_id, date=date, calories=calories, meal_count=meal_count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyTotal.user_id, DailyTotal.date],
+        set_={
+            'calories': DailyTotal.calories + stmt.excluded.calories,
+            'meal_count': DailyTotal.meal_count + stmt.excluded.meal_count,
+        },
+    )
+    db.session.execute(stmt)
+
+    # Drop the row once the last meal of the day is gone
+    if meal_count < 0:
+        db.session.execute(
+            db.delete(DailyTotal)
+            .where(DailyTotal.user_id == user_id, DailyTotal.date == date, DailyTotal.meal_count <= 0)
+        )
+
+
+def move_daily_total(old_user_id, old_date, old_calories, new_user_id, new_date, new_calories):
+    # Re-attribute a meal whose owner, date or calories changed
+    if (old_user_id, old_date) == (new_user_id, new_date):
+        if old_calories != new_calories:
+            add_to_daily_total(new_user_id, new_date, new_calories - old_calories, 0)
+        return
+    add_to_daily_total(old_user_id, old_date, -old_calories, -1)
+    add_to_daily_total(new_user_id, new_date, new_calories, 1)
+
+
+def daily_calories(user_id, date):
+    # Single primary-key lookup on the rollup table
+    total = db.session.execute(
+        db.select(DailyTotal.calories).where(DailyTotal.user_id == user_id, DailyTotal.date == date)
+    ).scalar()
+    return total or 0
+
+
+def add_meals_to_daily_totals(rows):
+    # One rollup update per affected (user_id, date) for a batch of meal rows.
+    # Returns the affected keys in sorted order.
+    deltas = {}
+    for row in rows:
+        calories, count = deltas.get((row['user_id'], row['date']), (0, 0))
+        deltas[(row['user_id'], row['date'])] = (calories + row['calories'], count + 1)
+    for (user_id, date), (calories, count) in sorted(deltas.items()):
+        add_to_daily_total(user_id, date, calories, count)
+    return sorted(deltas)
+
+
+def daily_totals_for(keys, chunk_size=400):
+    # (user_id, date) -> calories for the given keys, chunked below SQLite's parameter limit
+    totals = {}
+    keys = list(keys)
+    for start in range(0, len(keys), chunk_size):
+        result = db.session.execute(
+            db.select(DailyTotal.user_id, DailyTotal.date, DailyTotal.calories)
+            .where(db.tuple_(DailyTotal.user_id, DailyTotal.date).in_(keys[start:start + chunk_size]))
+        )
+        totals.update(((user_id, date), calories) for user_id, date, calories in result)
+    return totals
+
+
+def _meal_totals_query():
+    # Hot meals plus the per-day sums of archived ones
+    hot = db.select(
+        Meal.user_id,
+        Meal.date,
+        db.func.sum(Meal.calories).label('calories'),
+        db.func.count(Meal.id).label('meal_count'),
+    ).group_by(Meal.user_id, Meal.date)
+    archived = db.select(ArchivedTotal.user_id, ArchivedTotal.date, ArchivedTotal.calories, ArchivedTotal.meal_count)
+    both = db.union_all(hot, archived).subquery()
+    return db.select(
+        both.c.user_id,
+        both.c.date,
+        db.func.sum(both.c.calories),
+        db.func.sum(both.c.meal_count),
+    ).group_by(both.c.user_id, both.c.date)
+
+
+def rebuild_daily_totals():
+    # Recompute the whole rollup from the meal and archive tables in one transaction
+    db.session.execute(db.delete(DailyTotal))
+    db.session.execute(
+        db.insert(DailyTotal).from_select(
+            ['user_id', 'date', 'calories', 'meal_count'],
+            _meal_totals_query(),
+        )
+    )
+    db.session.commit()
+    return db.session.query(db.func.count()).select_from(DailyTotal).scalar()
+
+
+def verify_daily_totals():
+    # Return the (user_id, date) keys where the rollup disagrees with the meal table
+    stored = db.select(DailyTotal.user_id, DailyTotal.date, DailyTotal.calories, DailyTotal.meal_count)
+    expected = _meal_totals_query()
+    missing = db.session.execute(expected.except_(stored)).all()
+    stale = db.session.execute(stored.except_(expected)).all()
+    return sorted({(row[0], row[1]) for row in missing + stale})
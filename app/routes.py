@@ -1,11 +1,25 @@
-from flask import request, jsonify, Blueprint
+import itertools
+from flask import request, jsonify, abort, Blueprint, Response, current_app, stream_with_context
 from . import db
 from .models import Meal
 from .models import User
-from .schemas import meal_schema, meals_schema
-from .schemas import user_schema, users_schema
-from .utils import calculate_tdee
-from datetime import datetime
+from . import schemas
+from .utils import calculate_tdee, describe_remaining, parse_calories, parse_date, encode_cursor, decode_cursor
+from .serializers import meal_serializer
+from .streaming import STREAM_FORMATS
+from .cache import get_user_profile, user_cache
+from .storage import retry_on_busy
+from .admission import admit_write, release_write_slot, write_admission
+from .bulk import parse_bulk_body, insert_meals
+from .rollup import add_to_daily_total, move_daily_total, daily_calories
+from .search import search_meals, autocomplete_names
+from .archive import archived_rows, merge_tiers, find_archived_meal, meal_archive
+from .export import EXPORT_FORMATS, export_rows, export_body
+from .batch import meals_by_ids, daily_summaries
+from .catalog import food_catalog, food_portion
+from .writequeue import WriteUnavailable
+from .versions import bump_data_versions, data_version, meals_etag, meal_etag, meal_not_modified, not_modified, body_cache
+from datetime import date as date_type
 
 bp = Blueprint('routes', __name__)
 
@@ -15,70 +29,353 @@ def index():
 
 # Route for adding a meal
 @bp.route('/add_meal', methods=['POST'])
+@admit_write
+@retry_on_busy
 def add_meal():
     # Extract meal details from request JSON
-    name = request.json['name']
     username = request.json['username']
     description = request.json.get('description', '')
-    calories = request.json['calories']
-    date = request.json.get('date', datetime.now().strftime('%Y-%m-%d'))
+    if 'calories' not in request.json and 'food_id' in request.json:
+        # Fill in the calories, and the name unless given, from the food catalog
+        try:
+            food, calories = food_portion(request.json['food_id'], request.json.get('grams'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        name = request.json.get('name', food.name)
+    else:
+        name = request.json['name']
+        calories = request.json['calories']
+    try:
+        # The response echoes these, so they have to be what gets stored
+        calories = parse_calories(calories)
+        date = parse_date(request.json.get('date', date_type.today()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # Check if the user exists
-    existing_user = User.query.filter_by(username=username).first()
+    existing_user = get_user_profile(username)
     if not existing_user:
         return jsonify({"error": f"Username '{username}' does not exist. Please register first."}), 400
     
-    # Create a new meal
-    new_meal = Meal(name=name, username=username, description=description, calories=calories, date=date)
-    db.session.add(new_meal)
-    db.session.commit()
-    
-    # Calculate total calories consumed by the user for the day
-    total_calories_consumed = db.session.query(db.func.sum(Meal.calories)).filter_by(username=username, date=date).scalar()
-    
-    if total_calories_consumed is None:
-        total_calories_consumed = 0
-    
-    # Calculate remaining calories based on TDEE
-    remaining_calories = existing_user.tdee - total_calories_consumed
-    
-    # Determine message based on remaining calories
-    if remaining_calories > 0:
-        message = "Meal added successfully."
+    row = dict(name=name, user_id=existing_user.id, description=description, calories=calories, date=date)
+    write_queue = current_app.extensions.get('meal_write_queue')
+    if write_queue is not None:
+        # Hand the insert to the group-commit writer and wait for its batch.
+        # Failures come back as a 503 rather than through retry_on_busy,
+        # which would queue the same meal again.
+        future = write_queue.submit(row)
+        release_write_slot()
+        try:
+            meal_id, total_calories_consumed = write_queue.wait(future, current_app.config['MEAL_WRITE_TIMEOUT'])
+        except WriteUnavailable as e:
+            response = jsonify({"error": str(e)})
+            response.headers['Retry-After'] = str(current_app.config['WRITE_RETRY_AFTER'])
+            return response, 503
     else:
-        message = f"The daily TDEE has been surpassed by {abs(remaining_calories)} calories."
-        remaining_calories = 0
+        # Create a new meal
+        new_meal = Meal(**row)
+        db.session.add(new_meal)
+
+        # Fold the meal into the daily rollup in the same transaction
+        add_to_daily_total(existing_user.id, date, calories)
+        bump_data_versions(existing_user.id)
+
+        # Total calories consumed by the user for the day (the meal is flushed by now)
+        total_calories_consumed = daily_calories(existing_user.id, date)
+        meal_id = new_meal.id
+        db.session.commit()
+    meal = dict(id=meal_id, name=name, username=username, description=description, calories=calories,
+                date=date.isoformat())
+    
+    # Calculate remaining calories based on TDEE and pick the message
+    message, remaining_calories = describe_remaining(existing_user.tdee, total_calories_consumed)
 
     return jsonify({
         "message": message,
-        "meal": meal_schema.dump(new_meal),
+        "meal": meal,
         "remaining_calories": remaining_calories
     })
 
-# Route for retrieving meals by username
+# Route for adding many meals, possibly for several users, in one transaction.
+# Accepts a JSON array or an NDJSON body (Content-Type: application/x-ndjson).
+@bp.route('/meals/bulk', methods=['POST'])
+@admit_write
+@retry_on_busy
+def add_meals_bulk():
+    try:
+        items = parse_bulk_body(request.get_data(as_text=True), request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    max_rows = current_app.config['MEALS_BULK_MAX_ROWS']
+    if len(items) > max_rows:
+        return jsonify({"error": f"At most {max_rows} meals can be added per request."}), 413
+
+    created, days, errors = insert_meals(items, date_type.today())
+
+    # Nothing could be stored, report the per-row errors as a bad request
+    status = 200 if created or not errors else 400
+    return jsonify({"created": created, "days": days, "errors": errors}), status
+
+# Route for retrieving meals by username, optionally within a ?from=&to= date range.
+# ?limit= (with ?cursor=) returns one keyset page, ?stream=json|ndjson streams the result.
 @bp.route('/meals/<username>', methods=['GET'])
 def get_meals(username): 
-    # Fetch meals based on username if provided, otherwise fetch all meals
-    if username:
-        meals = Meal.query.filter_by(username=username).all()
+    # Parse the optional inclusive date bounds, cursor and page size
+    try:
+        date_from = parse_date(request.args['from']) if 'from' in request.args else None
+        date_to = parse_date(request.args['to']) if 'to' in request.args else None
+        cursor = decode_cursor(request.args['cursor']) if 'cursor' in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = request.args.get('limit')
+    if limit is not None:
+        max_limit = current_app.config['MEALS_MAX_PAGE_SIZE']
+        if not limit.isdigit() or not 0 < int(limit) <= max_limit:
+            return jsonify({"error": f"limit must be between 1 and {max_limit}."}), 400
+        limit = int(limit)
+    stream = request.args.get('stream')
+    if stream is not None and stream not in STREAM_FORMATS:
+        return jsonify({"error": f"stream must be one of: {', '.join(STREAM_FORMATS)}."}), 400
+
+    # Meals are stored by user id, an unknown username has none
+    user = get_user_profile(username)
+    if user is None:
+        return jsonify({'message': 'No meals found'}), 404
+
+    # Revalidate against the user's data version without touching the meal table.
+    # The version is read before the meals, so a body is never older than its tag.
+    version = data_version(user.id)
+    etag = meals_etag(user.id, version, request.query_string)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    cache = body_cache() if stream is None else None
+    cache_key = (user.id, request.query_string, version)
+    body = cache.get(cache_key) if cache is not None else None
+    if body is not None:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    # Plain column tuples are selected and serialized without ORM objects.
+    # Range scan on the (user_id, date) index.
+    query = meal_serializer.select().where(Meal.user_id == user.id)
+    if date_from is not None:
+        query = query.where(Meal.date >= date_from)
+    if date_to is not None:
+        query = query.where(Meal.date <= date_to)
+    # Resume strictly after the last (date, id) the client has seen
+    if cursor is not None:
+        query = query.where(db.tuple_(Meal.date, Meal.id) > cursor)
+    query = query.order_by(Meal.date, Meal.id)
+    # Meals moved to cold storage are merged in when the range reaches their months
+    archived = archived_rows(user.id, username, date_from, date_to, cursor)
+
+    if stream is not None:
+        response = _stream_meals(query, limit, stream, archived)
+    elif limit is not None:
+        # Fetch one extra row to learn whether another page exists
+        meals = db.session.execute(query.limit(limit + 1)).all()
+        if archived is not None:
+            meals = list(itertools.islice(merge_tiers(meals, archived), limit + 1))
+        next_cursor = None
+        if len(meals) > limit:
+            meals = meals[:limit]
+            next_cursor = encode_cursor(meals[-1].date, meals[-1].id)
+        response = jsonify({"meals": meal_serializer.dump_many(meals), "next": next_cursor})
     else:
-        meals = Meal.query.all()
+        meals = db.session.execute(query).all()
+        if archived is not None:
+            meals = list(merge_tiers(meals, archived))
+
+        # Check if meals list is empty and return an error if no meals are found
+        if not meals:
+            return jsonify({'message': 'No meals found'}), 404
+        response = jsonify(meal_serializer.dump_many(meals))
+
+    # An empty stream already answered 404
+    if isinstance(response, tuple):
+        return response
+    if cache is not None:
+        cache.put(cache_key, response.get_data())
+    response.set_etag(etag)
+    return response
+
+def _stream_meals(query, limit, stream, archived=None):
+    # Pull rows in chunks so memory stays flat however long the history is
+    if limit is not None:
+        query = query.limit(limit)
+    chunk_size = current_app.config['MEALS_STREAM_CHUNK_SIZE']
+    rows = merge_tiers(db.session.execute(query.execution_options(yield_per=chunk_size)), archived)
+    if archived is not None and limit is not None:
+        rows = itertools.islice(rows, limit)
+    rows = iter(rows)
 
-    # Check if meals list is empty and return an error if no meals are found
-    if not meals:
+    # Peek at the first row so an empty result still answers 404
+    first = next(rows, None)
+    if first is None:
         return jsonify({'message': 'No meals found'}), 404
-    
-    return meals_schema.jsonify(meals)
+
+    lines, mimetype = STREAM_FORMATS[stream]
+    body = lines(itertools.chain([first], rows), meal_serializer.dump)
+    return Response(stream_with_context(body), mimetype=mimetype)
+
+# Route for downloading a user's whole meal history, hot and archived, as CSV or
+# NDJSON in id order. ?after=<id> resumes an interrupted download, ?gzip=1 compresses it.
+@bp.route('/export/<username>', methods=['GET'])
+def export_meals(username):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}."}), 400
+    after = request.args.get('after', '0')
+    if not after.isdigit():
+        return jsonify({"error": "after must be a meal id."}), 400
+    compress = request.args.get('gzip') in ('1', 'true')
+
+    user = get_user_profile(username)
+    if not user:
+        return jsonify({"error": f"Username '{username}' does not exist. Please register first."}), 404
+
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    body = export_body(export_rows(user.id, int(after), chunk_size), fmt, compress, chunk_size)
+    _, mimetype = EXPORT_FORMATS[fmt]
+    filename = f'meals-{user.id}.{fmt}'
+    if compress:
+        mimetype, filename = 'application/gzip', filename + '.gz'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 # Route for retrieving a single meal by ID
 @bp.route('/get_meal/<int:id>', methods=['GET'])
 def get_meal(id):
+    # A still-current ETag is answered from the data version alone
+    etag = meal_not_modified(id)
+    if etag is not None:
+        return not_modified(etag)
+
     # Retrieve meal by ID or return 404 if not found
-    meal = Meal.query.get_or_404(id)
-    return meal_schema.jsonify(meal)
+    # The owner's id rides along after the serialized columns, for the ETag
+    meal = db.session.execute(meal_serializer.select().add_columns(Meal.user_id).where(Meal.id == id)).first()
+    if meal is None:
+        # Only ids missing from the hot table are looked up in the archive
+        meal = find_archived_meal(id)
+    if meal is None:
+        abort(404)
+    # If-None-Match: * matches any meal that exists, as in get_meals
+    etag = meal_etag(id, meal.user_id, data_version(meal.user_id))
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    response = jsonify(meal_serializer.dump(meal))
+    response.set_etag(etag)
+    return response
 
-# Route for updating a meal
+# Route for many meals by id in one request, each with its owner's TDEE and the
+# calories remaining on the meal's day. Body: {"ids": [...]}
+@bp.route('/batch/meals', methods=['POST'])
+def batch_meals():
+    data = request.json
+    ids = data.get('ids') if isinstance(data, dict) else None
+    max_ids = current_app.config['BATCH_MAX_IDS']
+    if (not isinstance(ids, list) or not 0 < len(ids) <= max_ids
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+        return jsonify({"error": f"ids must be a list of 1 to {max_ids} meal ids."}), 400
+    ids = list(dict.fromkeys(ids))
+
+    found = meals_by_ids(ids)
+    return jsonify({
+        "meals": [found[i] for i in ids if i in found],
+        "not_found": [i for i in ids if i not in found],
+    })
+
+# Route for per-day calorie totals of many users over a date range, with each
+# user's TDEE and remaining calories. Body: {"usernames": [...], "from": ..., "to": ...}
+@bp.route('/batch/daily_summary', methods=['POST'])
+def batch_daily_summary():
+    data = request.json
+    usernames = data.get('usernames') if isinstance(data, dict) else None
+    max_usernames = current_app.config['BATCH_MAX_USERNAMES']
+    if (not isinstance(usernames, list) or not 0 < len(usernames) <= max_usernames
+            or not all(isinstance(username, str) for username in usernames)):
+        return jsonify({"error": f"usernames must be a list of 1 to {max_usernames} usernames."}), 400
+    usernames = list(dict.fromkeys(usernames))
+    try:
+        date_to = parse_date(data.get('to', date_type.today()))
+        date_from = parse_date(data.get('from', date_to))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    max_days = current_app.config['BATCH_MAX_DAYS']
+    if not 0 <= (date_to - date_from).days < max_days:
+        return jsonify({"error": f"from must be on or before to, at most {max_days} days apart."}), 400
+
+    summaries = daily_summaries(usernames, date_from, date_to)
+    return jsonify({
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "users": [summaries[username] for username in usernames if username in summaries],
+        "unknown": [username for username in usernames if username not in summaries],
+    })
+
+def _search_args(text_arg):
+    # User id, text and limit shared by /search and /autocomplete, or an error response
+    username = request.args.get('username')
+    text = request.args.get(text_arg)
+    if not username or text is None:
+        return None, (jsonify({"error": f"username and {text_arg} are required."}), 400)
+    max_limit = current_app.config['SEARCH_MAX_LIMIT']
+    limit = request.args.get('limit', str(current_app.config['SEARCH_DEFAULT_LIMIT']))
+    if not limit.isdigit() or not 0 < int(limit) <= max_limit:
+        return None, (jsonify({"error": f"limit must be between 1 and {max_limit}."}), 400)
+    user = get_user_profile(username)
+    if not user:
+        return None, (jsonify({"error": f"Username '{username}' does not exist. Please register first."}), 404)
+    return (user.id, text, int(limit)), None
+
+# Route for full-text search over a user's meal names and descriptions, best match first
+@bp.route('/search', methods=['GET'])
+def search():
+    args, error = _search_args('q')
+    if error is not None:
+        return error
+    user_id, text, limit = args
+    return jsonify(meal_serializer.dump_many(search_meals(user_id, text, limit)))
+
+# Route for suggesting meal names the user has logged before, by prefix
+@bp.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    args, error = _search_args('prefix')
+    if error is not None:
+        return error
+    user_id, prefix, limit = args
+    return jsonify(autocomplete_names(user_id, prefix, limit))
+
+# Route for looking up catalog foods by name prefix, ignoring case
+@bp.route('/foods', methods=['GET'])
+def foods():
+    prefix = request.args.get('prefix', '').strip()
+    if not prefix:
+        return jsonify({"error": "prefix is required."}), 400
+    max_limit = current_app.config['FOODS_MAX_LIMIT']
+    limit = request.args.get('limit', str(current_app.config['FOODS_DEFAULT_LIMIT']))
+    if not limit.isdigit() or not 0 < int(limit) <= max_limit:
+        return jsonify({"error": f"limit must be between 1 and {max_limit}."}), 400
+    catalog = food_catalog()
+    if catalog is None:
+        return jsonify({"error": "The food catalog is not available."}), 404
+    return jsonify([food._asdict() for food in catalog.search(prefix, int(limit))])
+
+# Route for retrieving one catalog food
+@bp.route('/foods/<int:food_id>', methods=['GET'])
+def get_food(food_id):
+    catalog = food_catalog()
+    food = catalog.get(food_id) if catalog is not None else None
+    if food is None:
+        abort(404)
+    return jsonify(food._asdict())
+
+# Route for updating a meal (archived meals are read-only and answer 404)
 @bp.route('/update_meal/<int:id>', methods=['PUT'])
+@admit_write
+@retry_on_busy
 def update_meal(id):
     # Retrieve meal by ID or return 404 if not found
     meal = Meal.query.get_or_404(id)
@@ -86,44 +383,77 @@ def update_meal(id):
     json_data = request.json
     
     # Check if the user is authorized to update this meal
-    if 'username' not in json_data or json_data['username'] != meal.username:
+    if 'username' not in json_data or json_data['username'] != meal.user.username:
         return jsonify({"error": "You are not authorized to update this meal."}), 403
+
+    # Remember where the meal was counted before the update
+    old_date, old_calories = meal.date, meal.calories
     
-    # Update meal details if provided in the request
+    # Update meal details if provided in the request. The username is the
+    # owner's, so the meal always stays with the same user.
     if 'name' in json_data:
         meal.name = json_data['name']
-    if 'username' in json_data:
-        meal.username = json_data['username']
     if 'description' in json_data:
         meal.description = json_data['description']
     if 'calories' in json_data:
         meal.calories = json_data['calories']
     if 'date' in json_data:
-        meal.date = json_data['date']
+        try:
+            meal.date = parse_date(json_data['date'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
     
-    # Check if the user exists
-    existing_user = User.query.filter_by(username=meal.username).first()
-    if not existing_user:
-        return jsonify({"error": f"Username '{meal.username}' does not exist. Please register first."}), 400
+    # Move the calories between daily totals if the day or amount changed
+    move_daily_total(meal.user_id, old_date, old_calories, meal.user_id, meal.date, meal.calories)
+    bump_data_versions(meal.user_id)
     
     # Commit changes to the database
     db.session.commit()
     # Return the updated meal
-    return meal_schema.jsonify(meal)
+    return schemas.meal_schema.jsonify(meal)
 
 # Route for deleting a meal by ID
 @bp.route('/meals/<int:id>', methods=['DELETE'])
+@admit_write
+@retry_on_busy
 def delete_meal(id):
     # Retrieve meal by ID or return 404 if not found
     meal = Meal.query.get_or_404(id)
-    # Delete the meal from the database
+    # Delete the meal from the database and take it out of the daily total
     db.session.delete(meal)
+    add_to_daily_total(meal.user_id, meal.date, -meal.calories, -1)
+    bump_data_versions(meal.user_id)
     db.session.commit()
     # Return message with 204 status code
     return jsonify({'message': 'Meal successfully deleted'}), 204
 
+# Route for weekly or monthly calorie statistics of a user
+@bp.route('/stats/<username>', methods=['GET'])
+def get_stats(username):
+    # NumPy is only loaded once statistics are first requested
+    from .stats import PERIODS, fetch_daily_series, summarize
+
+    period = request.args.get('period', 'week')
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of: {', '.join(PERIODS)}."}), 400
+    try:
+        date_from = parse_date(request.args['from']) if 'from' in request.args else None
+        date_to = parse_date(request.args['to']) if 'to' in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Check if the user exists
+    existing_user = get_user_profile(username)
+    if not existing_user:
+        return jsonify({"error": f"Username '{username}' does not exist. Please register first."}), 404
+
+    dates, calories = fetch_daily_series(existing_user.id, date_from, date_to)
+    stats = summarize(dates, calories, existing_user.tdee, period)
+    return jsonify(dict(stats, username=username, period=period, tdee=existing_user.tdee))
+
 # Route for adding a user
 @bp.route('/add_user', methods=['POST'])
+@retry_on_busy
 def add_user():
     # Extract user details from request JSON
     username = request.json['username']
@@ -147,10 +477,11 @@ def add_user():
     db.session.commit()
 
     # Returm user_schema
-    return user_schema.jsonify(new_user)
+    return schemas.user_schema.jsonify(new_user)
 
 # Route for updating a user by ID
 @bp.route('/update_user/<int:id>', methods=['PUT'])
+@retry_on_busy
 def update_user(id):
     # Retrieve the user by ID or return 404 if not found
     user = User.query.get_or_404(id)
@@ -158,6 +489,7 @@ def update_user(id):
     # Get JSON data from the request
     json_data = request.json
     tdee_reassession = False
+    old_username = user.username
 
     # Update user details if provided in the request
     if 'username' in json_data:
@@ -180,24 +512,97 @@ def update_user(id):
     else:
         message = "User updated successfully!"
 
+    # Meals are shown with their owner's username
+    bump_data_versions(user.id)
     db.session.commit()
+    # Drop cached profiles under both the old and the new username
+    user_cache().invalidate(old_username, user.username)
 
     # Return JSON response with the update message and user details
     return jsonify({
         "message":message,
-        "user":user_schema.dump(user)})
+        "user":schemas.user_schema.dump(user)})
 
 # Route for deleting a user by ID
 @bp.route('/delete_user/<int:id>', methods=['DELETE'])
+@retry_on_busy
 def delete_user(id):
-    # Retrieve the user by ID or return 404 if not found
-    user = User.query.get_or_404(id)
-    # Delete the user from the database
-    db.session.delete(user)
+    # Delete the user in one statement, the database cascades to their meals
+    # and daily totals, or return 404 if not found
+    username = db.session.execute(
+        db.delete(User).where(User.id == id).returning(User.username)
+    ).scalar()
+    if username is None:
+        db.session.rollback()
+        abort(404)
+    bump_data_versions(id)
     db.session.commit()
+    user_cache().invalidate(username)
+    # The archive index rows cascaded, the files go once the delete is committed
+    meal_archive().remove_user(id)
     # Return message with 204 status code
     return jsonify({'message': 'Meal successfully deleted'}), 204
 
+# Route for Prometheus metrics
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    registry = current_app.extensions.get('metrics')
+    if registry is None:
+        abort(404)
+    cache = user_cache().stats()
+    extra = [
+        ('meal_tracker_user_cache_hits_total', 'counter', 'User profile cache hits.', cache['hits']),
+        ('meal_tracker_user_cache_misses_total', 'counter', 'User profile cache misses.', cache['misses']),
+        ('meal_tracker_user_cache_evictions_total', 'counter', 'User profile cache evictions.', cache['evictions']),
+        ('meal_tracker_user_cache_size', 'gauge', 'Entries in the user profile cache.', cache['size']),
+    ]
+    write_queue = current_app.extensions.get('meal_write_queue')
+    if write_queue is not None:
+        queue_stats = write_queue.stats()
+        extra += [
+            ('meal_tracker_write_batches_total', 'counter', 'Group commits by the meal writer.', queue_stats['batches']),
+            ('meal_tracker_write_meals_total', 'counter', 'Meals written by the meal writer.', queue_stats['meals']),
+            ('meal_tracker_write_pending', 'gauge', 'Meals waiting for the meal writer.', queue_stats['pending']),
+        ]
+    bodies = body_cache()
+    if bodies is not None:
+        body_stats = bodies.stats()
+        extra += [
+            ('meal_tracker_body_cache_hits_total', 'counter', 'Meal list body cache hits.', body_stats['hits']),
+            ('meal_tracker_body_cache_misses_total', 'counter', 'Meal list body cache misses.', body_stats['misses']),
+            ('meal_tracker_body_cache_size', 'gauge', 'Entries in the meal list body cache.', body_stats['size']),
+        ]
+    admission = write_admission()
+    if admission is not None:
+        admission_stats = admission.stats(throttled_limit=0)
+        extra += [
+            ('meal_tracker_write_admitted_total', 'counter', 'Writes admitted.', admission_stats['admitted']),
+            ('meal_tracker_write_rate_limited_total', 'counter', 'Writes answered 429 by the rate limiter.',
+             sum(admission_stats['rate_limited'].values())),
+            ('meal_tracker_write_shed_total', 'counter', 'Writes answered 503 for want of a slot.',
+             sum(admission_stats['shed'].values())),
+            ('meal_tracker_write_in_flight', 'gauge', 'Writes running.', admission_stats['in_flight']),
+            ('meal_tracker_write_queued', 'gauge', 'Writes waiting for a slot.', admission_stats['queued']),
+        ]
+    return Response(registry.render(extra), mimetype='text/plain; version=0.0.4')
+
+# Route for the most recent slow query samples
+@bp.route('/metrics/slow_queries', methods=['GET'])
+def slow_queries():
+    registry = current_app.extensions.get('metrics')
+    if registry is None:
+        abort(404)
+    return jsonify(list(registry.slow_queries))
+
+# Route for the write admission state: slots, queue, rejections and the
+# usernames and client IPs currently out of tokens
+@bp.route('/metrics/admission', methods=['GET'])
+def admission_state():
+    admission = write_admission()
+    if admission is None:
+        abort(404)
+    return jsonify(admission.stats())
+
 # Error handler for 404 Not Found errors
 @bp.errorhandler(404)
 def not_found(error):
@@ -1,18 +1,41 @@
+from functools import cache
 from . import ma
 from .models import Meal
 from .models import User
 
-class MealSchema(ma.SQLAlchemyAutoSchema):
-    class Meta:
-        model = Meal
+# SQLAlchemyAutoSchema reflects the model when the class is created, so the
+# classes and their instances are built on first use rather than at import.
 
-meal_schema = MealSchema()
-meals_schema = MealSchema(many=True)
+@cache
+def _meal_schema_class():
+    class MealSchema(ma.SQLAlchemyAutoSchema):
+        class Meta:
+            model = Meal
+        # Meals link to their user by id but are still shown with the username
+        username = ma.String(attribute='user.username', dump_only=True)
+    return MealSchema
 
-class UserSchema(ma.SQLAlchemyAutoSchema):
-    class Meta:
-        model = User
-        load_instance = True
+@cache
+def _user_schema_class():
+    class UserSchema(ma.SQLAlchemyAutoSchema):
+        class Meta:
+            model = User
+            load_instance = True
+    return UserSchema
 
-user_schema = UserSchema()
-users_schema = UserSchema(many=True)
\ No newline at end of file
+_LAZY = {
+    'MealSchema': lambda: _meal_schema_class(),
+    'meal_schema': lambda: _meal_schema_class()(),
+    'meals_schema': lambda: _meal_schema_class()(many=True),
+    'UserSchema': lambda: _user_schema_class(),
+    'user_schema': lambda: _user_schema_class()(),
+    'users_schema': lambda: _user_schema_class()(many=True),
+}
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = _LAZY[name]()
+    # Later lookups find the module global and skip __getattr__
+    globals()[name] = value
+    return value
@@ -0,0 +1,75 @@
+import re
+from sqlalchemy import DDL, column, event, func, literal_column, table
+from . import db
+from .models import Meal
+from .serializers import meal_serializer
+
+# External-content FTS5 index over meal names and descriptions. Triggers keep
+# it in step with every write path, including bulk inserts and raw SQL.
+MEAL_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS meal_fts USING fts5("
+    "name, description, user_id, content='meal', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    # Rank name matches above description matches; user_id only scopes the match
+    "INSERT INTO meal_fts (meal_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 0.0)')",
+    "CREATE TRIGGER IF NOT EXISTS meal_fts_insert AFTER INSERT ON meal BEGIN "
+    "INSERT INTO meal_fts (rowid, name, description, user_id) VALUES (new.id, new.name, new.description, new.user_id); END",
+    "CREATE TRIGGER IF NOT EXISTS meal_fts_delete AFTER DELETE ON meal BEGIN "
+    "INSERT INTO meal_fts (meal_fts, rowid, name, description, user_id) "
+    "VALUES ('delete', old.id, old.name, old.description, old.user_id); END",
+    "CREATE TRIGGER IF NOT EXISTS meal_fts_update AFTER UPDATE OF name, description, user_id ON meal BEGIN "
+    "INSERT INTO meal_fts (meal_fts, rowid, name, description, user_id) "
+    "VALUES ('delete', old.id, old.name, old.description, old.user_id); "
+    "INSERT INTO meal_fts (rowid, name, description, user_id) VALUES (new.id, new.name, new.description, new.user_id); END",
+)
+
+# Created and dropped along with the meal table (triggers go with the table itself)
+for statement in MEAL_FTS_DDL:
+    event.listen(Meal.__table__, 'after_create', DDL(statement))
+event.listen(Meal.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS meal_fts"))
+
+meal_fts = table('meal_fts', column('rowid'), column('rank'))
+
+_TERM = re.compile(r'\w+')
+
+
+def match_expression(user_id, text):
+    # Quote every word so user input can never be FTS5 syntax; the last
+    # word matches as a prefix since it may still be being typed.
+    terms = _TERM.findall(text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    # Narrow to the user's meals inside the index rather than ranking every user's matches
+    return f'user_id : "{int(user_id)}" AND {{name description}} : ({" ".join(quoted)})'
+
+
+def search_meals(user_id, text, limit):
+    # Best bm25 matches among the user's meals, as column tuples for meal_serializer
+    match = match_expression(user_id, text)
+    if match is None:
+        return []
+    query = (
+        meal_serializer.select()
+        .join(meal_fts, meal_fts.c.rowid == Meal.id)
+        .where(literal_column('meal_fts').op('MATCH')(match))
+        .order_by(meal_fts.c.rank)
+        .limit(limit)
+    )
+    return db.session.execute(query).all()
+
+
+def autocomplete_names(user_id, prefix, limit):
+    # Distinct meal names starting with prefix (case-insensitive), most logged first.
+    # Range scan on the (user_id, name COLLATE NOCASE) index.
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    count = func.count()
+    query = (
+        db.select(Meal.name)
+        .where(Meal.user_id == user_id, Meal.name.like(escaped + '%', escape='\\'))
+        .group_by(Meal.name)
+        .order_by(count.desc(), Meal.name)
+        .limit(limit)
+    )
+    return db.session.scalars(query).all()
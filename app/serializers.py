@@ -0,0 +1,48 @@
+from . import db
+from .models import Meal
+from .models import User
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+class RowSerializer:
+    # Turns plain column tuples into the same dicts the SQLAlchemyAutoSchema
+    # of the model dumps, without hydrating ORM objects or running marshmallow.
+    # Like the auto schema, foreign key columns are left out; related columns
+    # (e.g. the owner's username) are joined in through those foreign keys.
+
+    def __init__(self, model, related=()):
+        self.model = model
+        self.related = tuple(related)
+        self.columns = tuple(
+            getattr(model, column.key) for column in model.__table__.columns if not column.foreign_keys
+        ) + self.related
+        self.names = tuple(column.key for column in self.columns)
+        converters = tuple(
+            _isoformat if isinstance(column.type, (db.Date, db.DateTime)) else None
+            for column in self.columns
+        )
+        self._converted = tuple(
+            (i, name, convert) for i, (name, convert) in enumerate(zip(self.names, converters)) if convert
+        )
+
+    def select(self):
+        query = db.select(*self.columns)
+        for target in dict.fromkeys(column.class_ for column in self.related):
+            query = query.join_from(self.model, target)
+        return query
+
+    def dump(self, row):
+        data = dict(zip(self.names, row))
+        for i, name, convert in self._converted:
+            data[name] = convert(row[i])
+        return data
+
+    def dump_many(self, rows):
+        return [self.dump(row) for row in rows]
+
+
+meal_serializer = RowSerializer(Meal, related=(User.username,))
+user_serializer = RowSerializer(User)
@@ -0,0 +1,109 @@
+import numpy as np
+from . import db
+from .models import DailyTotal
+
+PERIODS = ('week', 'month')
+# Periods averaged by the moving average trend
+MOVING_AVERAGE_WINDOW = 4
+
+
+def fetch_daily_series(user_id, date_from=None, date_to=None):
+    # One columnar fetch of (date, calories) from the daily rollup, ordered by day
+    query = db.select(DailyTotal.date, DailyTotal.calories).where(DailyTotal.user_id == user_id)
+    if date_from is not None:
+        query = query.where(DailyTotal.date >= date_from)
+    if date_to is not None:
+        query = query.where(DailyTotal.date <= date_to)
+    rows = db.session.execute(query.order_by(DailyTotal.date)).all()
+    dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    calories = np.array([row[1] for row in rows], dtype=np.int64)
+    return dates, calories
+
+
+def period_starts(dates, period):
+    # First day of the ISO week (Monday) or calendar month of each date
+    if period == 'month':
+        return dates.astype('datetime64[M]').astype('datetime64[D]')
+    days = dates.astype(np.int64)
+    # 1970-01-01 was a Thursday, three days after a Monday
+    return (days - (days + 3) % 7).astype('datetime64[D]')
+
+
+def _grouped_percentile(sorted_values, starts, counts, q):
+    # Linear-interpolated percentile of each group in a group-wise sorted array
+    position = (counts - 1) * q
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    low_values = sorted_values[starts + low]
+    high_values = sorted_values[starts + high]
+    return low_values + (high_values - low_values) * (position - low)
+
+
+def _streaks(within, dates, breaks):
+    # Length of the run of consecutive within-TDEE days ending at each day.
+    # A run starts wherever the previous day is missing, over TDEE, or in breaks.
+    index = np.arange(len(dates))
+    gap = np.ones(len(dates), dtype=bool)
+    gap[1:] = np.diff(dates).astype(np.int64) != 1
+    previous_within = np.zeros(len(dates), dtype=bool)
+    previous_within[1:] = within[:-1]
+    start = within & (gap | ~previous_within | breaks)
+    run_start = np.maximum.accumulate(np.where(start, index, -1))
+    return np.where(within, index - run_start + 1, 0)
+
+
+def _moving_average(values, window):
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    return (cumulative[upper] - cumulative[lower]) / (upper - lower)
+
+
+def summarize(dates, calories, tdee, period):
+    # Per-period statistics over a day-ordered (dates, calories) series. Days
+    # over TDEE and streaks are None for users without a TDEE.
+    if len(dates) == 0:
+        streak = 0 if tdee is not None else None
+        return {'current_streak': streak, 'longest_streak': streak, 'periods': []}
+
+    keys = period_starts(dates, period)
+    period_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(period_keys)), counts)
+
+    totals = np.add.reduceat(calories, starts)
+    means = totals / counts
+    # Sort calories within each period to read the median and p90 by position
+    ordered = calories[np.lexsort((calories, group))].astype(np.float64)
+    medians = _grouped_percentile(ordered, starts, counts, 0.5)
+    p90s = _grouped_percentile(ordered, starts, counts, 0.9)
+
+    if tdee is not None:
+        within = calories <= tdee
+        days_over = np.add.reduceat((~within).astype(np.int64), starts)
+
+        # Streaks restart at each period for the per-period figure
+        new_period = np.zeros(len(dates), dtype=bool)
+        new_period[starts] = True
+        period_streaks = np.maximum.reduceat(_streaks(within, dates, new_period), starts)
+        streaks = _streaks(within, dates, np.zeros(len(dates), dtype=bool))
+
+    moving_average = _moving_average(means, MOVING_AVERAGE_WINDOW)
+
+    periods = []
+    for i, start in enumerate(period_keys.astype(str)):
+        periods.append({
+            'start': start,
+            'days_logged': int(counts[i]),
+            'total_calories': int(totals[i]),
+            'mean_calories': round(float(means[i]), 1),
+            'median_calories': round(float(medians[i]), 1),
+            'p90_calories': round(float(p90s[i]), 1),
+            'days_over_tdee': int(days_over[i]) if tdee is not None else None,
+            'longest_streak': int(period_streaks[i]) if tdee is not None else None,
+            'moving_average': round(float(moving_average[i]), 1),
+        })
+    return {
+        'current_streak': int(streaks[-1]) if tdee is not None else None,
+        'longest_streak': int(streaks.max()) if tdee is not None else None,
+        'periods': periods,
+    }
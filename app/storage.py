@@ -0,0 +1,63 @@
+import functools
+import random
+import sqlite3
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from . import db
+
+BUSY_ERROR_CODES = (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def _set_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+    return on_connect
+
+
+def init_storage(app):
+    # Apply the configured SQLite pragmas to every new pooled connection
+    pragmas = app.config['SQLITE_PRAGMAS']
+    if pragmas and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        with app.app_context():
+            event.listen(db.engine, 'connect', _set_pragmas(pragmas))
+
+
+def is_busy_error(error):
+    # SQLITE_BUSY / SQLITE_LOCKED surface as OperationalError from pysqlite
+    orig = getattr(error, 'orig', None)
+    code = getattr(orig, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in BUSY_ERROR_CODES
+    return 'database is locked' in str(orig) or 'database is busy' in str(orig)
+
+
+def run_with_retry(fn, retries=None, backoff=None):
+    # Run fn, rolling back and retrying with jittered exponential backoff
+    # while SQLite reports the database as busy
+    if retries is None:
+        retries = current_app.config['DB_WRITE_RETRIES']
+    if backoff is None:
+        backoff = current_app.config['DB_WRITE_RETRY_BACKOFF']
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except OperationalError as e:
+            if attempt >= retries or not is_busy_error(e):
+                raise
+            db.session.rollback()
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+
+def retry_on_busy(view):
+    # Route decorator: re-run the whole write transaction when SQLite is busy
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        return run_with_retry(lambda: view(*args, **kwargs))
+    return wrapper
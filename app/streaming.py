@@ -0,0 +1,26 @@
+from flask import current_app
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def json_array_lines(items, dump):
+    # Yield a JSON array one element at a time so nothing is buffered
+    dumps = current_app.json.dumps
+    yield '['
+    for i, item in enumerate(items):
+        yield (',' if i else '') + dumps(dump(item))
+    yield ']\n'
+
+
+def ndjson_lines(items, dump):
+    # Yield one JSON document per line
+    dumps = current_app.json.dumps
+    for item in items:
+        yield dumps(dump(item)) + '\n'
+
+
+STREAM_FORMATS = {
+    'json': (json_array_lines, JSON_MIMETYPE),
+    'ndjson': (ndjson_lines, NDJSON_MIMETYPE),
+}
@@ -0,0 +1,38 @@
+import numpy as np
+from . import db
+from .models import User
+from .utils import calculate_tdee_array
+
+
+def recompute_tdees(chunk_size=1000, dry_run=False):
+    # Recompute every user's TDEE in id order, one chunk at a time.
+    # Yields (users processed so far, [(id, username, old tdee, new tdee), ...])
+    # for each chunk; changed rows are written back with one executemany
+    # UPDATE and a commit per chunk unless dry_run is set.
+    last_id = 0
+    processed = 0
+    while True:
+        rows = db.session.execute(
+            db.select(User.id, User.username, User.height, User.weight, User.activity_level, User.tdee)
+            .where(User.id > last_id)
+            .order_by(User.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        ids, usernames, heights, weights, levels, old = zip(*rows)
+        new = calculate_tdee_array(heights, weights, levels)
+        old = np.array([-1 if tdee is None else tdee for tdee in old], dtype=np.int64)
+        changed = np.flatnonzero(new != old)
+
+        changes = [(ids[i], usernames[i], rows[i].tdee, int(new[i])) for i in changed]
+        if changes and not dry_run:
+            db.session.execute(
+                db.update(User),
+                [{'id': user_id, 'tdee': tdee} for user_id, _, _, tdee in changes],
+            )
+            db.session.commit()
+
+        last_id = ids[-1]
+        processed += len(rows)
+        yield processed, changes
@@ -1,12 +1,77 @@
+import base64
+from datetime import date
+
+# Multipliers for activity levels 1 to 5, anything else counts as 1.2
+ACTIVITY_MULTIPLIERS = {
+    1: 1.2,
+    2: 1.375,
+    3: 1.55,
+    4: 1.725,
+    5: 1.9
+}
 
 def calculate_tdee(height, weight, activity_level):
     # Placeholder TDEE calculation
     base_tdee = (height * 6.25) + (weight * 9.99) - (5 * 30) + 5  
-    activity_multiplier = {
-        1: 1.2,
-        2: 1.375,
-        3: 1.55,
-        4: 1.725,
-        5: 1.9
-    }
-    return int(base_tdee * activity_multiplier.get(activity_level, 1.2))
\ No newline at end of file
+    return int(base_tdee * ACTIVITY_MULTIPLIERS.get(activity_level, 1.2))
+
+
+def calculate_tdee_array(heights, weights, activity_levels):
+    # Vectorized calculate_tdee over arrays, same operation order so results match exactly
+    import numpy as np
+    heights = np.asarray(heights, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    activity_levels = np.asarray(activity_levels, dtype=np.int64)
+    base_tdee = (heights * 6.25) + (weights * 9.99) - (5 * 30) + 5
+    lookup = np.full(max(ACTIVITY_MULTIPLIERS) + 1, 1.2)
+    for level, multiplier in ACTIVITY_MULTIPLIERS.items():
+        lookup[level] = multiplier
+    known = (activity_levels >= 0) & (activity_levels < len(lookup))
+    multipliers = np.where(known, lookup[np.where(known, activity_levels, 0)], 1.2)
+    # int() truncates toward zero, as does the float -> int cast
+    return (base_tdee * multipliers).astype(np.int64)
+
+
+def describe_remaining(tdee, total_calories_consumed):
+    # Message and clamped remaining calories reported after logging meals
+    remaining_calories = tdee - total_calories_consumed
+    if remaining_calories > 0:
+        return "Meal added successfully.", remaining_calories
+    return f"The daily TDEE has been surpassed by {abs(remaining_calories)} calories.", 0
+
+
+def parse_calories(value):
+    # Accept integers or integer strings such as "350", raise ValueError otherwise
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError("calories must be an integer.")
+
+
+def parse_date(value):
+    # Accept date objects or ISO 'YYYY-MM-DD' strings, raise ValueError otherwise
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD.")
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD.") from None
+
+
+def encode_cursor(meal_date, meal_id):
+    # Opaque keyset cursor pointing just after (date, id)
+    raw = f"{meal_date.isoformat()}:{meal_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Inverse of encode_cursor, raise ValueError on anything malformed
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        meal_date, meal_id = raw.split(':')
+        return date.fromisoformat(meal_date), int(meal_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"Invalid cursor '{cursor}'.") from None
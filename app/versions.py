@@ -0,0 +1,114 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import Response, current_app, request
+from sqlalchemy.dialects.sqlite import insert
+from . import db
+from .models import DataVersion
+
+
+def bump_data_versions(*user_ids):
+    # Increment each user's data version inside the current transaction
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    stmt = insert(DataVersion)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DataVersion.user_id],
+        set_={'version': DataVersion.version + 1},
+    )
+    db.session.execute(stmt, [{'user_id': user_id, 'version': 1} for user_id in user_ids])
+
+
+def data_version(user_id):
+    # Single primary-key lookup, 0 for users whose meals never changed
+    version = db.session.execute(
+        db.select(DataVersion.version).where(DataVersion.user_id == user_id)
+    ).scalar()
+    return version or 0
+
+
+def meals_etag(user_id, version, query_string):
+    # One representation per query string of GET /meals/<username>. The user
+    # id is in the tag as a username can later belong to someone else.
+    digest = hashlib.blake2b(query_string, digest_size=8).hexdigest()
+    return f'{user_id}.{version}-{digest}'
+
+
+def meal_etag(meal_id, user_id, version):
+    # The owner travels in the tag so a revalidation never reads the meal row:
+    # any change to the meal bumps its owner's version
+    return f'm{meal_id}.{user_id}.{version}'
+
+
+def meal_not_modified(meal_id):
+    # The ETag of GET /get_meal/<id> sent in If-None-Match if it is still current, else None
+    prefix = f'm{meal_id}.'
+    for etag in request.if_none_match.as_set(include_weak=True):
+        if not etag.startswith(prefix):
+            continue
+        user_id, _, version = etag[len(prefix):].partition('.')
+        if not user_id.isdigit():
+            continue
+        if version == str(data_version(int(user_id))):
+            return etag
+    return None
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+class ResponseBodyCache:
+    # Bounded LRU of serialized response bodies. Keys include the data version,
+    # so entries never need invalidating; superseded ones age out.
+
+    def __init__(self, max_size=256, max_bytes=65536):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def init_body_cache(app):
+    if app.config['MEALS_BODY_CACHE_SIZE']:
+        app.extensions['meal_body_cache'] = ResponseBodyCache(
+            max_size=app.config['MEALS_BODY_CACHE_SIZE'],
+            max_bytes=app.config['MEALS_BODY_CACHE_MAX_BYTES'],
+        )
+
+
+def body_cache():
+    return current_app.extensions.get('meal_body_cache')
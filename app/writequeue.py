@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from sqlalchemy.exc import OperationalError
+from . import db
+from .models import Meal
+from .rollup import add_meals_to_daily_totals, daily_totals_for
+from .storage import is_busy_error, run_with_retry
+from .versions import bump_data_versions
+
+
+class WriteUnavailable(Exception):
+    # The meal was not stored, the client can send it again
+    pass
+
+
+class MealWriteQueue:
+    # Group commit for add_meal. Request threads submit meal rows and wait on
+    # a Future; one writer thread drains the queue every few milliseconds (or
+    # every batch_size rows) and commits the whole batch in one transaction.
+    # Each Future resolves to (meal_id, calories logged that day up to and
+    # including this meal), exactly what a serial add_meal would have seen.
+
+    def __init__(self, app, batch_size=100, max_delay=0.005):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.batches = 0
+        self.meals = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, row):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((row, future))
+        return future
+
+    def wait(self, future, timeout):
+        # The submitted meal's result. A meal whose batch has not started
+        # within timeout is cancelled, and one the database stayed busy for
+        # through the writer's retries was rolled back: both raise
+        # WriteUnavailable. A batch already being committed is waited for, so
+        # a client retrying never stores the meal twice.
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                return self.wait(future, None)
+            raise WriteUnavailable("The meal could not be stored in time, try again shortly.")
+        except OperationalError as e:
+            if not is_busy_error(e):
+                raise
+            raise WriteUnavailable("The database is busy, try again shortly.") from e
+
+    def close(self):
+        # Flush what is queued and stop the writer thread
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'meals': self.meals,
+            'pending': self._queue.qsize(),
+        }
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='meal-writer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        # Block for the first job, then collect more until the batch is full or the delay is up
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                # Put the stop marker back so the loop ends after this batch
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                # Skip meals whose request gave up waiting before the batch started
+                batch = [job for job in batch if job[1].set_running_or_notify_cancel()]
+                if batch:
+                    self._write(batch)
+
+    def _commit(self, rows):
+        ids = db.session.scalars(
+            db.insert(Meal).returning(Meal.id, sort_by_parameter_order=True),
+            rows,
+        ).all()
+        # Totals before this batch, read in the same transaction as the insert
+        keys = sorted({(row['user_id'], row['date']) for row in rows})
+        running = daily_totals_for(keys)
+        add_meals_to_daily_totals(rows)
+        bump_data_versions(*(row['user_id'] for row in rows))
+        db.session.commit()
+        return ids, running
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            ids, running = run_with_retry(lambda: self._commit(rows))
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) > 1:
+                # Retry one by one so a single bad row only fails its own request
+                for job in batch:
+                    self._write([job])
+                return
+            batch[0][1].set_exception(e)
+            return
+
+        self.batches += 1
+        self.meals += len(batch)
+        for (row, future), meal_id in zip(batch, ids):
+            key = (row['user_id'], row['date'])
+            running[key] = running.get(key, 0) + row['calories']
+            future.set_result((meal_id, running[key]))
+
+
+def init_write_queue(app):
+    if app.config['MEAL_WRITE_BEHIND']:
+        app.extensions['meal_write_queue'] = MealWriteQueue(
+            app,
+            batch_size=app.config['MEAL_WRITE_BATCH_SIZE'],
+            max_delay=app.config['MEAL_WRITE_MAX_DELAY'],
+        )
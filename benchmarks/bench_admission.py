@@ -0,0 +1,123 @@
+# Write latency of well-behaved users next to an abusive client. --users
+# clients each POST /add_meal every --interval seconds from their own IP,
+# while --abusers threads retry POST /add_meal and PUT /update_meal as one
+# user from one IP, ignoring Retry-After, at --abuser-rate requests per second
+# in total (0 for as fast as they can). Runs without the abuser, with it and
+# no admission control, and with it and admission control on, and reports the
+# well-behaved users' latency and the responses each side got.
+#
+# The test client runs every request on its caller's thread, so with an
+# unbounded abuser even cheap 429s compete with the users for the GIL;
+# rejecting a write costs about as much as any Flask request.
+#
+#   python -m benchmarks.bench_admission --users 20 --abusers 16 --abuser-rate 500
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+import numpy as np
+from app import create_app, db
+from app.migrations import upgrade_database
+from app.models import User
+
+ADMISSION = {
+    'WRITE_RATE_PER_USER': 20,
+    'WRITE_BURST_PER_USER': 20,
+    'WRITE_RATE_PER_IP': 40,
+    'WRITE_BURST_PER_IP': 40,
+    'WRITE_MAX_IN_FLIGHT': 4,
+    'WRITE_MAX_QUEUED': 32,
+    'WRITE_QUEUE_TIMEOUT': 2.0,
+}
+NO_ADMISSION = {'WRITE_RATE_PER_USER': None, 'WRITE_RATE_PER_IP': None, 'WRITE_MAX_IN_FLIGHT': None}
+
+
+def run(path, settings, users, abusers, abuser_rate, interval, seconds):
+    if os.path.exists(path):
+        os.remove(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', **settings},
+                     config_object='app.config.ProductionConfig')
+    with app.app_context():
+        upgrade_database()
+        db.session.add_all(
+            User(username=f'user{i}', height=175, weight=70, activity_level=2, tdee=2500) for i in range(users + 1)
+        )
+        db.session.commit()
+    abuser = f'user{users}'
+    meal = {'name': 'Snack', 'calories': 50, 'date': '2024-06-01'}
+    first = app.test_client().post('/add_meal', json={**meal, 'username': abuser},
+                                   environ_base={'REMOTE_ADDR': '10.1.0.1'}).get_json()['meal']['id']
+
+    stop = threading.Event()
+    latencies = []
+    good = Counter()
+    bad = Counter()
+
+    def well_behaved(n):
+        client = app.test_client()
+        environ = {'REMOTE_ADDR': f'10.0.{n // 250}.{n % 250 + 1}'}
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            began = time.perf_counter()
+            status = client.post('/add_meal', json={**meal, 'username': f'user{n}'}, environ_base=environ).status_code
+            latencies.append(time.perf_counter() - began)
+            good[status] += 1
+            next_at += interval
+            time.sleep(max(0, next_at - time.perf_counter()))
+
+    def abusive(n):
+        client = app.test_client()
+        environ = {'REMOTE_ADDR': '10.1.0.1'}
+        pause = abusers / abuser_rate if abuser_rate else 0
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            next_at += pause
+            time.sleep(max(0, next_at - time.perf_counter()))
+            if n % 2:
+                response = client.put(f'/update_meal/{first}', json={'username': abuser, 'calories': 60},
+                                      environ_base=environ)
+            else:
+                response = client.post('/add_meal', json={**meal, 'username': abuser}, environ_base=environ)
+            bad[response.status_code] += 1
+
+    threads = [threading.Thread(target=well_behaved, args=(n,)) for n in range(users)]
+    threads += [threading.Thread(target=abusive, args=(n,)) for n in range(abusers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    ms = np.array(latencies) * 1000
+    return np.percentile(ms, [50, 95, 99]), good, bad
+
+
+def describe(counts):
+    return ' '.join(f'{status}:{count}' for status, count in sorted(counts.items())) or '-'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--abusers', type=int, default=16, help='threads of the abusive client')
+    parser.add_argument('--abuser-rate', type=float, default=500, help='abusive requests per second, 0 for no limit')
+    parser.add_argument('--interval', type=float, default=0.25, help='seconds between a user\'s writes')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'admission.db')
+        print(f"{args.users} users writing every {args.interval}s, abuser with {args.abusers} threads "
+              f"at {args.abuser_rate or 'unlimited'} req/s, {args.seconds}s per run ({os.cpu_count()} CPUs)\n")
+        print(f"{'run':<24} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}  {'users':<20} abuser")
+        for label, settings, abusers in (
+            ('no abuser', NO_ADMISSION, 0),
+            ('abuser, no admission', NO_ADMISSION, args.abusers),
+            ('abuser, admission', ADMISSION, args.abusers),
+        ):
+            (p50, p95, p99), good, bad = run(path, settings, args.users, abusers, args.abuser_rate,
+                                               args.interval, args.seconds)
+            print(f"{label:<24} {p50:>7.1f} {p95:>7.1f} {p99:>7.1f}  {describe(good):<20} {describe(bad)}")
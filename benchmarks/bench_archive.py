@@ -0,0 +1,108 @@
+# Hot/cold partitioning: seeds N users x M meals spread over several years,
+# times the common reads before and after 'flask archive-meals' moves meals
+# older than the horizon to cold storage, and reports the hot database size
+# against the size of the archive files.
+#
+#   python -m benchmarks.bench_archive --users 500 --meals-per-user 1000 --days 365
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import text
+from app import create_app, db
+from app.archive import archive_meals
+from app.models import Meal, User
+from app.rollup import rebuild_daily_totals
+
+SEED_CHUNK = 50000
+FIRST_DAY = date(2021, 1, 1)
+
+
+def seed(users, meals_per_user, span_days):
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'height': 175, 'weight': 70, 'activity_level': 2, 'tdee': 2300}
+        for i in range(users)
+    ])
+    total = users * meals_per_user
+    for start in range(0, total, SEED_CHUNK):
+        db.session.execute(db.insert(Meal), [
+            {'name': f'Meal {k % 50}', 'user_id': k % users + 1, 'description': 'Seeded meal',
+             'calories': 200 + k % 700, 'date': FIRST_DAY + timedelta(days=k * span_days // total)}
+            for k in range(start, min(start + SEED_CHUNK, total))
+        ])
+        db.session.commit()
+    rebuild_daily_totals()
+    return total
+
+
+def hot_size():
+    with db.engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()")).scalar()
+
+
+def archive_size(root):
+    return sum(os.path.getsize(os.path.join(path, name)) for path, _, names in os.walk(root) for name in names)
+
+
+def time_reads(client, users, meals, last_day, rng, repeat):
+    # Median ms per read kind; the body cache is off so every request queries
+    urls = {
+        'recent month': lambda: f'/meals/user{rng.randrange(users)}?from={last_day - timedelta(days=30)}&to={last_day}',
+        'recent page': lambda: f'/meals/user{rng.randrange(users)}?from={last_day - timedelta(days=90)}&limit=50',
+        'archived month': lambda: f'/meals/user{rng.randrange(users)}?from={FIRST_DAY}&to={FIRST_DAY + timedelta(days=30)}',
+        'full history': lambda: f'/meals/user{rng.randrange(users)}',
+        'old meal by id': lambda: f'/get_meal/{rng.randint(1, meals // 10)}',
+    }
+    results = {}
+    for label, url in urls.items():
+        samples = []
+        for _ in range(repeat):
+            began = time.perf_counter()
+            response = client.get(url())
+            samples.append(time.perf_counter() - began)
+            assert response.status_code == 200, (label, response.status_code)
+        results[label] = float(np.median(samples)) * 1000
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--meals-per-user', type=int, default=1000)
+    parser.add_argument('--span-days', type=int, default=3 * 365, help='days the seeded history covers')
+    parser.add_argument('--days', type=int, default=365, help='archive meals older than this many days')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'archive.db')}",
+                          'MEAL_ARCHIVE_DIR': os.path.join(tmp, 'archive'),
+                          'MEALS_BODY_CACHE_SIZE': 0})
+        with app.app_context():
+            meals = seed(args.users, args.meals_per_user, args.span_days)
+            last_day = FIRST_DAY + timedelta(days=args.span_days - 1)
+            client = app.test_client()
+            before_size = hot_size()
+            before = time_reads(client, args.users, meals, last_day, random.Random(1), args.repeat)
+
+            began = time.perf_counter()
+            moved = 0
+            for moved in archive_meals(last_day - timedelta(days=args.days)):
+                pass
+            elapsed = time.perf_counter() - began
+            print(f"Archived {moved:,} of {meals:,} meals in {elapsed:.1f}s ({moved / elapsed:,.0f} meals/s)\n")
+
+            after_size = hot_size()
+            after = time_reads(client, args.users, meals, last_day, random.Random(1), args.repeat)
+
+        cold_size = archive_size(os.path.join(tmp, 'archive'))
+        print(f"hot database  {before_size / 2**20:>8.1f} MiB -> {after_size / 2**20:.1f} MiB")
+        print(f"archive files {cold_size / 2**20:>8.1f} MiB ({cold_size / max(moved, 1):.1f} bytes per meal)\n")
+        print(f"{'read':<16} {'before ms':>10} {'after ms':>9} {'change':>8}")
+        for label in before:
+            change = (after[label] - before[label]) / before[label] * 100
+            print(f"{label:<16} {before[label]:>10.2f} {after[label]:>9.2f} {change:>+7.0f}%")
@@ -0,0 +1,91 @@
+# A coach dashboard for --clients users: one GET /meals/<username> per client
+# summed on the client, against a single POST /batch/daily_summary; and one
+# GET /get_meal per id against a single POST /batch/meals. Reports wall time
+# and SQL statements per dashboard render.
+#
+#   python -m benchmarks.bench_batch --users 2000 --meals-per-user 300 --clients 200
+import argparse
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+import numpy as np
+from sqlalchemy import event
+from app import create_app, db
+from benchmarks.suite import FIRST_DAY, seed
+
+
+def render(repeat, build):
+    # Median ms and statements per call of build()
+    counter = {'queries': 0}
+
+    def count(*args):
+        counter['queries'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    samples = []
+    try:
+        for _ in range(repeat):
+            counter['queries'] = 0
+            began = time.perf_counter()
+            build()
+            samples.append(time.perf_counter() - began)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return float(np.median(samples)) * 1000, counter['queries']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--meals-per-user', type=int, default=300)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--days', type=int, default=7, help='date range of the dashboard')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # No body cache, so every repeat does the work
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'batch.db')}",
+                          'MEALS_BODY_CACHE_SIZE': 0})
+        with app.app_context():
+            meals = seed(args.users, args.meals_per_user)
+            client = app.test_client()
+            rng = random.Random(1)
+            usernames = [f'user{i}' for i in rng.sample(range(args.users), args.clients)]
+            date_to = FIRST_DAY + timedelta(days=args.meals_per_user // 3 - 1)
+            date_from = date_to - timedelta(days=args.days - 1)
+            meal_ids = rng.sample(range(1, meals + 1), args.clients)
+
+            def per_client_totals():
+                totals = {}
+                for username in usernames:
+                    response = client.get(f'/meals/{username}?from={date_from}&to={date_to}')
+                    days = defaultdict(int)
+                    for meal in response.get_json() if response.status_code == 200 else []:
+                        days[meal['date']] += meal['calories']
+                    totals[username] = days
+                return totals
+
+            def batch_totals():
+                return client.post('/batch/daily_summary', json={
+                    'usernames': usernames, 'from': date_from.isoformat(), 'to': date_to.isoformat()}).get_json()
+
+            def per_id_meals():
+                return [client.get(f'/get_meal/{meal_id}').get_json() for meal_id in meal_ids]
+
+            def batch_meals():
+                return client.post('/batch/meals', json={'ids': meal_ids}).get_json()
+
+            print(f"{args.clients} clients, {args.days}-day range, {meals:,} meals\n")
+            print(f"{'render':<36} {'ms':>8} {'queries':>8}")
+            for label, build in [
+                (f'{args.clients} x GET /meals/<username>', per_client_totals),
+                ('POST /batch/daily_summary', batch_totals),
+                (f'{args.clients} x GET /get_meal/<id>', per_id_meals),
+                ('POST /batch/meals', batch_meals),
+            ]:
+                ms, queries = render(args.repeat, build)
+                print(f"{label:<36} {ms:>8.1f} {queries:>8}")
@@ -0,0 +1,63 @@
+# Compare POST /add_meal once per meal against a single POST /meals/bulk.
+#
+#   python -m benchmarks.bench_bulk --meals 2000 --users 20
+import argparse
+import os
+import tempfile
+import time
+from app import create_app, db
+from app.models import User
+
+
+def make_meals(count, users):
+    return [
+        {
+            'name': f'Meal {i}',
+            'username': f'user{i % users}',
+            'calories': 300 + i % 400,
+            'date': f'2024-06-{1 + i % 28:02d}',
+        }
+        for i in range(count)
+    ]
+
+
+def fresh_app(path, users):
+    if os.path.exists(path):
+        os.remove(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with app.app_context():
+        db.session.add_all(
+            User(username=f'user{i}', height=175, weight=70, activity_level=2, tdee=2500)
+            for i in range(users)
+        )
+        db.session.commit()
+    return app
+
+
+def per_meal(app, meals):
+    client = app.test_client()
+    start = time.perf_counter()
+    for meal in meals:
+        assert client.post('/add_meal', json=meal).status_code == 200
+    return time.perf_counter() - start
+
+
+def bulk(app, meals):
+    client = app.test_client()
+    start = time.perf_counter()
+    assert client.post('/meals/bulk', json=meals).status_code == 200
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meals', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    meals = make_meals(args.meals, args.users)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        for label, run in (('per-meal /add_meal', per_meal), ('single /meals/bulk', bulk)):
+            elapsed = run(fresh_app(path, args.users), meals)
+            print(f"{label:20s} {args.meals} meals in {elapsed:.3f}s ({args.meals / elapsed:,.0f} meals/s)")
@@ -0,0 +1,151 @@
+# Lookup latency and per-worker memory of the memory-mapped food catalog
+# against loading the same foods into a dict (by id) and a sorted name list
+# (for prefixes). Generates --foods foods as CSV, builds the catalog from it,
+# times lookups in this process, then starts --workers processes per mode that
+# each load the foods, do the same lookups and stay up together while they
+# report RSS and PSS (which splits pages shared between processes among them).
+# The 'none' row is a worker that imports the same modules and loads nothing.
+#
+#   python -m benchmarks.bench_catalog --foods 500000 --workers 4
+import argparse
+import bisect
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from app.catalog import Food, FoodCatalog, write_catalog
+
+WORDS = ['apple', 'apricot', 'bagel', 'banana', 'bean', 'beef', 'bread', 'broccoli', 'butter', 'cabbage',
+         'carrot', 'cheese', 'chicken', 'chickpea', 'chocolate', 'cod', 'corn', 'cracker', 'egg', 'lentil',
+         'mango', 'milk', 'muffin', 'noodle', 'oat', 'olive', 'onion', 'orange', 'pasta', 'pea', 'pear',
+         'pepper', 'pork', 'potato', 'rice', 'salmon', 'soup', 'spinach', 'tofu', 'tomato', 'tuna', 'yogurt']
+STYLES = ['raw', 'boiled', 'baked', 'fried', 'grilled', 'steamed', 'canned', 'dried', 'frozen', 'roasted']
+BRANDS = ['Acme', 'Brookside', 'Countryfare', 'Delmonte', 'Evergreen', 'Farmhouse', 'Goldleaf', 'Harvest']
+
+
+def generate(path, count, rng):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'name', 'kcal_per_100g', 'serving_grams'])
+        for food_id in range(1, count + 1):
+            name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS)}, {rng.choice(STYLES)} ({rng.choice(BRANDS)} {food_id})"
+            writer.writerow([food_id, name, round(rng.uniform(10, 900), 1), rng.choice([30, 50, 100, 150, 250])])
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return [(int(row['id']), row['name'], float(row['kcal_per_100g']), float(row['serving_grams']))
+                for row in csv.DictReader(f)]
+
+
+class DictCatalog:
+    # The catalog held in Python objects, as a worker would without the file format
+    def __init__(self, foods):
+        self.by_id = {food_id: Food(food_id, name, kcal, serving) for food_id, name, kcal, serving in foods}
+        self.names = sorted((food.name.casefold(), food.id) for food in self.by_id.values())
+
+    def get(self, food_id):
+        return self.by_id.get(food_id)
+
+    def search(self, prefix, limit=20):
+        prefix = prefix.casefold()
+        foods = []
+        i = bisect.bisect_left(self.names, (prefix,))
+        while i < len(self.names) and len(foods) < limit and self.names[i][0].startswith(prefix):
+            foods.append(self.by_id[self.names[i][1]])
+            i += 1
+        return foods
+
+
+def load(mode, csv_path, catalog_path):
+    if mode == 'none':
+        return None
+    return FoodCatalog(catalog_path) if mode == 'mmap' else DictCatalog(read_csv(csv_path))
+
+
+def workload(count, rng, lookups):
+    ids = [rng.randint(1, count) for _ in range(lookups)]
+    prefixes = [rng.choice(WORDS)[:rng.randint(2, 5)] + rng.choice(['', ' ']) for _ in range(lookups // 10)]
+    return ids, prefixes
+
+
+def time_lookups(catalog, ids, prefixes):
+    began = time.perf_counter()
+    for food_id in ids:
+        catalog.get(food_id)
+    by_id = (time.perf_counter() - began) / len(ids)
+    began = time.perf_counter()
+    for prefix in prefixes:
+        catalog.search(prefix, 20)
+    return by_id, (time.perf_counter() - began) / len(prefixes)
+
+
+def rss_kib():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+
+def child(mode, csv_path, catalog_path, count, lookups):
+    began = time.perf_counter()
+    catalog = load(mode, csv_path, catalog_path)
+    loaded = time.perf_counter() - began
+    # Every worker touches the whole catalog over its lifetime
+    if catalog is not None:
+        ids, prefixes = workload(count, random.Random(os.getpid()), lookups)
+        time_lookups(catalog, ids + list(range(1, count + 1)), prefixes)
+    print(json.dumps({'load': loaded, 'rss': rss_kib()}), flush=True)
+    # Stay mapped until the parent has read everyone's PSS
+    sys.stdin.read()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--foods', type=int, default=500000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--child', nargs=4, metavar=('MODE', 'CSV', 'CATALOG', 'FOODS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, csv_path, catalog_path, count = args.child
+        child(mode, csv_path, catalog_path, int(count), args.lookups)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'foods.csv')
+        catalog_path = os.path.join(tmp, 'foods.catalog')
+        generate(csv_path, args.foods, random.Random(1))
+        began = time.perf_counter()
+        write_catalog(catalog_path, read_csv(csv_path))
+        print(f"{args.foods:,} foods: CSV {os.path.getsize(csv_path) / 2 ** 20:.1f} MiB, catalog "
+              f"{os.path.getsize(catalog_path) / 2 ** 20:.1f} MiB built in {time.perf_counter() - began:.1f}s\n")
+
+        ids, prefixes = workload(args.foods, random.Random(2), args.lookups)
+        print(f"{'mode':<6} {'load s':>7} {'get us':>7} {'prefix us':>10} "
+              f"{'RSS MiB/worker':>15} {'PSS MiB/worker':>15} {'total PSS MiB':>14}")
+        for mode in ('none', 'dict', 'mmap'):
+            began = time.perf_counter()
+            catalog = load(mode, csv_path, catalog_path)
+            loaded = time.perf_counter() - began
+            by_id, by_prefix = time_lookups(catalog, ids, prefixes) if catalog is not None else (0, 0)
+            del catalog
+
+            workers = [
+                subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_catalog', '--lookups', str(args.lookups),
+                                  '--child', mode, csv_path, catalog_path, str(args.foods)],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                for _ in range(args.workers)
+            ]
+            rss = [json.loads(worker.stdout.readline())['rss'] for worker in workers]
+            pss = []
+            for worker in workers:
+                with open(f'/proc/{worker.pid}/smaps_rollup') as f:
+                    pss.append(next(int(line.split()[1]) for line in f if line.startswith('Pss:')))
+            for worker in workers:
+                worker.communicate('')
+            print(f"{mode:<6} {loaded:>7.2f} {by_id * 1e6:>7.2f} {by_prefix * 1e6:>10.1f} "
+                  f"{sum(rss) / len(rss) / 1024:>15.1f} {sum(pss) / len(pss) / 1024:>15.1f} {sum(pss) / 1024:>14.1f}")
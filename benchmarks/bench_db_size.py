@@ -0,0 +1,89 @@
+# Table and index sizes before and after meals switched from a username
+# string to an integer user_id (schema version 4 -> 5), measured with the
+# dbstat virtual table on a seeded database, plus the time to delete a user
+# together with all of their meals.
+#
+#   python -m benchmarks.bench_db_size --users 1000 --meals-per-user 200
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from sqlalchemy import text
+from app import create_app, db
+from app.migrations import MIGRATIONS, upgrade_database
+
+
+def seed_legacy(users, meals_per_user):
+    # The original layout (version 1), then the migrations up to version 4
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(100) NOT NULL UNIQUE, '
+            "height INTEGER NOT NULL, weight INTEGER NOT NULL, activity_level INTEGER NOT NULL, tdee INTEGER)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE meal (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, username VARCHAR(100) NOT NULL, "
+            "description VARCHAR(200), calories INTEGER NOT NULL, date VARCHAR(20) NOT NULL)"
+        ))
+        conn.execute(
+            text('INSERT INTO "user" (username, height, weight, activity_level, tdee) VALUES (:username, 175, 70, 2, 2300)'),
+            [{'username': f'user.{i:06d}@example.com'} for i in range(users)],
+        )
+        conn.execute(
+            text("INSERT INTO meal (name, username, description, calories, date) "
+                 "VALUES (:name, :username, 'Seeded meal', :calories, :date)"),
+            [{'name': f'Meal {k % 50}', 'username': f'user.{k % users:06d}@example.com', 'calories': 200 + k % 700,
+              'date': (date(2022, 1, 1) + timedelta(days=k // users // 3)).isoformat()}
+             for k in range(users * meals_per_user)],
+        )
+        for version, migrate in MIGRATIONS:
+            if version <= 4:
+                migrate(conn)
+        conn.execute(text("CREATE TABLE schema_version (version INTEGER NOT NULL, PRIMARY KEY (version))"))
+        conn.execute(text("INSERT INTO schema_version (version) VALUES (4)"))
+
+
+def sizes():
+    # Bytes per table and index after a VACUUM, FTS5 shadow tables folded together
+    with db.engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+        rows = conn.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all()
+    result = {}
+    for name, size in rows:
+        if name.startswith('meal_fts'):
+            name = 'meal_fts (all)'
+        result[name] = result.get(name, 0) + size
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--meals-per-user', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'size.db')}",
+                          'DB_AUTO_UPGRADE': False})
+        with app.app_context():
+            seed_legacy(args.users, args.meals_per_user)
+            before = sizes()
+            began = time.perf_counter()
+            upgrade_database()
+            print(f"Upgraded {args.users * args.meals_per_user:,} meals in {time.perf_counter() - began:.1f}s\n")
+            after = sizes()
+
+            print(f"{'object':<34} {'before KiB':>11} {'after KiB':>10} {'change':>8}")
+            for name in sorted(set(before) | set(after)):
+                old, new = before.get(name, 0), after.get(name, 0)
+                change = f"{(new - old) / old * 100:+.0f}%" if old and new else ''
+                print(f"{name:<34} {old / 1024:>11,.0f} {new / 1024:>10,.0f} {change:>8}")
+            total_before, total_after = sum(before.values()), sum(after.values())
+            print(f"{'total':<34} {total_before / 1024:>11,.0f} {total_after / 1024:>10,.0f} "
+                  f"{(total_after - total_before) / total_before * 100:>+7.0f}%")
+
+            client = app.test_client()
+            began = time.perf_counter()
+            response = client.delete('/delete_user/1')
+            assert response.status_code == 204
+            print(f"\nDELETE /delete_user/1 with {args.meals_per_user} meals: {(time.perf_counter() - began) * 1000:.1f}ms")
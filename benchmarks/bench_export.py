@@ -0,0 +1,111 @@
+# Throughput and peak memory of the streaming export. Seeds --meals meals into
+# a temporary database once, then runs every format in a fresh interpreter
+# (so the peak RSS is that run's own) writing to /dev/null, next to loading
+# the same rows into one in-memory JSON list as GET /meals/<username> does.
+#
+#   python -m benchmarks.bench_export --meals 1000000
+#   python -m benchmarks.bench_export --meals 10000000 --users 10000
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from app import create_app, db
+from app.models import Meal, User
+
+SEED_CHUNK = 50000
+FIRST_DAY = date(2022, 1, 1)
+RUNS = [('csv', False), ('csv', True), ('ndjson', False), ('ndjson', True), ('in-memory list', False)]
+
+
+def seed(users, meals):
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'height': 175, 'weight': 70, 'activity_level': 2, 'tdee': 2300}
+        for i in range(users)
+    ])
+    for start in range(0, meals, SEED_CHUNK):
+        db.session.execute(db.insert(Meal), [
+            {'name': f'Meal {k % 50}', 'user_id': k % users + 1, 'description': 'Seeded meal',
+             'calories': 200 + k % 700, 'date': FIRST_DAY + timedelta(days=k // users // 3)}
+            for k in range(start, min(start + SEED_CHUNK, meals))
+        ])
+        db.session.commit()
+
+
+def peak_rss_kib():
+    # VmHWM starts over at exec; ru_maxrss on Linux keeps the forking parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(path, fmt, compress):
+    # One run; prints rows, seconds and peak RSS in KiB as JSON
+    from app.export import export_body, export_rows
+    from app.serializers import meal_serializer
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'DB_AUTO_UPGRADE': False})
+    with app.app_context(), open(os.devnull, 'wb') as out:
+        began = time.perf_counter()
+        rows = 0
+        if fmt == 'in-memory list':
+            meals = db.session.execute(meal_serializer.select().order_by(Meal.id)).all()
+            out.write(app.json.dumps(meal_serializer.dump_many(meals)).encode())
+            rows = len(meals)
+        else:
+            def counted(source):
+                nonlocal rows
+                for row in source:
+                    rows += 1
+                    yield row
+            chunk_size = app.config['EXPORT_CHUNK_SIZE']
+            for piece in export_body(counted(export_rows(None, 0, chunk_size)), fmt, compress, chunk_size):
+                out.write(piece)
+        elapsed = time.perf_counter() - began
+    print(json.dumps({'rows': rows, 'seconds': elapsed,
+                      'maxrss_kib': peak_rss_kib()}))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meals', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--max-list-meals', type=int, default=2000000,
+                        help='skip the in-memory list above this many meals, it needs about 1 KiB per meal')
+    parser.add_argument('--child', nargs=3, metavar=('DB', 'FORMAT', 'GZIP'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, fmt, compress = args.child
+        child(path, fmt, compress == '1')
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.db')
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+        with app.app_context():
+            began = time.perf_counter()
+            seed(args.users, args.meals)
+            print(f"Seeded {args.meals:,} meals in {time.perf_counter() - began:.1f}s\n")
+
+        print(f"{'run':<18} {'rows/s':>10} {'seconds':>8} {'peak RSS MiB':>13}")
+        for fmt, compress in RUNS:
+            if fmt == 'in-memory list' and args.meals > args.max_list_meals:
+                print(f"{fmt:<18} {'skipped':>10}")
+                continue
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_export', '--child', path, fmt, '1' if compress else '0'],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            result = json.loads(output.splitlines()[-1])
+            label = fmt + (' + gzip' if compress else '')
+            print(f"{label:<18} {result['rows'] / result['seconds']:>10,.0f} {result['seconds']:>8.1f} "
+                  f"{result['maxrss_kib'] / 1024:>13.1f}")
@@ -0,0 +1,66 @@
+# Overhead of the per-request instrumentation: the same requests with
+# METRICS_ENABLED off and on.
+#
+#   python -m benchmarks.bench_metrics --meals 1000 --requests 500
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+import numpy as np
+from app import create_app, db
+from app.models import Meal, User
+from app.rollup import rebuild_daily_totals
+
+
+def build(path, enabled, meals):
+    if os.path.exists(path):
+        os.remove(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'METRICS_ENABLED': enabled})
+    with app.app_context():
+        user = User(username='bench', height=175, weight=70, activity_level=2, tdee=2500)
+        db.session.add(user)
+        db.session.flush()
+        db.session.execute(db.insert(Meal), [
+            {'name': f'Meal {i}', 'user_id': user.id, 'description': '', 'calories': 300,
+             'date': date(2024, 1, 1) + timedelta(days=i // 3)}
+            for i in range(meals)
+        ])
+        db.session.commit()
+        rebuild_daily_totals()
+    return app
+
+
+def measure(app, url, requests, method='GET', body=None):
+    client = app.test_client()
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client.open(url, method=method, json=body)
+        latencies.append(time.perf_counter() - start)
+    return np.percentile(np.array(latencies) * 1000, [50, 95])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meals', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    cases = (
+        ('GET /get_meal/1', '/get_meal/1', 'GET', None),
+        (f'GET /meals ({args.meals} rows)', '/meals/bench', 'GET', None),
+        ('POST /add_meal', '/add_meal', 'POST', {'name': 'x', 'username': 'bench', 'calories': 1, 'date': '2024-01-01'}),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        results = {}
+        for enabled in (False, True):
+            app = build(path, enabled, args.meals)
+            for label, url, method, body in cases:
+                results[(label, enabled)] = measure(app, url, args.requests, method, body)
+
+    print(f"{'request':<24} {'off p50':>9} {'on p50':>9} {'overhead':>9}")
+    for label, *_ in cases:
+        off, on = results[(label, False)], results[(label, True)]
+        print(f"{label:<24} {off[0]:>7.3f}ms {on[0]:>7.3f}ms {(on[0] - off[0]) / off[0] * 100:>+8.1f}%")
@@ -0,0 +1,77 @@
+# Scaling of 'flask daily-report' with the worker count. Seeds --users users
+# with --days days of daily totals straight into the rollup, then times the
+# report for the last day in-process (1 worker) and with process pools, next
+# to a sequential Python pass that loads every user and looks up their day.
+#
+#   python -m benchmarks.bench_report --users 200000 --days 30 --workers 1 2 4 8
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from app import create_app, db
+from app.models import DailyTotal, User
+from app.report import daily_report
+
+SEED_CHUNK = 50000
+FIRST_DAY = date(2024, 1, 1)
+
+
+def seed(users, days, rng):
+    for start in range(0, users, SEED_CHUNK):
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'height': 175, 'weight': 70, 'activity_level': 2, 'tdee': rng.randint(1600, 3200)}
+            for i in range(start, min(start + SEED_CHUNK, users))
+        ])
+    # About 70% of users log on any given day
+    rows = [
+        {'user_id': user_id, 'date': FIRST_DAY + timedelta(days=day), 'calories': rng.randint(800, 4000), 'meal_count': 3}
+        for user_id in range(1, users + 1) for day in range(days) if rng.random() < 0.7
+    ]
+    for start in range(0, len(rows), SEED_CHUNK):
+        db.session.execute(db.insert(DailyTotal), rows[start:start + SEED_CHUNK])
+    db.session.commit()
+    return len(rows)
+
+
+def sequential_pass(day):
+    # What the report replaces: one query per user, compared in Python
+    began = time.perf_counter()
+    exceeded = 0
+    for user in db.session.scalars(db.select(User)):
+        calories = db.session.scalar(
+            db.select(DailyTotal.calories).where(DailyTotal.user_id == user.id, DailyTotal.date == day))
+        if user.tdee is not None and calories is not None and calories > user.tdee:
+            exceeded += 1
+    return time.perf_counter() - began
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'report.db')}"})
+        with app.app_context():
+            began = time.perf_counter()
+            rows = seed(args.users, args.days, random.Random(1))
+            print(f"Seeded {args.users:,} users, {rows:,} daily totals in {time.perf_counter() - began:.1f}s "
+                  f"({os.cpu_count()} CPUs)\n")
+            day = FIRST_DAY + timedelta(days=args.days - 1)
+
+            print(f"{'run':<22} {'seconds':>8} {'speedup':>8}")
+            results = []
+            if not args.skip_sequential:
+                results.append(('sequential pass', sequential_pass(day)))
+            for workers in args.workers:
+                best = min(daily_report(day, workers)['seconds'] for _ in range(args.repeat))
+                results.append((f'{workers} workers, {workers * 4} parts', best))
+            baseline = results[0][1]
+            for label, seconds in results:
+                print(f"{label:<22} {seconds:>8.3f} {baseline / seconds:>7.2f}x")
@@ -0,0 +1,84 @@
+# GET /search (FTS5, bm25 ranked) against a LIKE '%q%' scan over name and
+# description on the same table, plus GET /autocomplete latency.
+#
+#   python -m benchmarks.bench_search --meals 500000 --users 100
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from sqlalchemy import or_
+from app import create_app, db
+from app.models import Meal, User
+from app.serializers import meal_serializer
+
+WORDS = (
+    'chicken', 'salad', 'rice', 'beans', 'toast', 'soup', 'pasta', 'tomato', 'cheese', 'egg',
+    'oatmeal', 'banana', 'apple', 'yogurt', 'salmon', 'tuna', 'beef', 'pork', 'tofu', 'curry',
+    'noodles', 'burrito', 'pizza', 'sandwich', 'wrap', 'smoothie', 'granola', 'avocado', 'spinach', 'lentil',
+)
+# Rare words so that, like real histories, most terms are selective
+RARE = tuple(f'brand{i}' for i in range(2000))
+QUERIES = ('chicken', 'salmon avocado', 'curr', 'brand42', 'brand7 lentil')
+
+
+def seed(meals, users):
+    rng = random.Random(42)
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'height': 170, 'weight': 70, 'activity_level': 2, 'tdee': 2300}
+        for i in range(users)
+    ])
+    for start in range(0, meals, 50000):
+        db.session.execute(db.insert(Meal), [
+            {'name': ' '.join(rng.sample(WORDS, 2)).capitalize(), 'user_id': k % users + 1,
+             'description': ' '.join(rng.sample(WORDS, 3) + [rng.choice(RARE)]), 'calories': rng.randint(100, 900),
+             'date': date(2022, 1, 1) + timedelta(days=k // users // 3)}
+            for k in range(start, min(start + 50000, meals))
+        ])
+        db.session.commit()
+
+
+def like_scan(user_id, text, limit):
+    # Baseline: every word as a substring of the name or description
+    query = meal_serializer.select().where(Meal.user_id == user_id)
+    for word in text.split():
+        pattern = f'%{word}%'
+        query = query.where(or_(Meal.name.like(pattern), Meal.description.like(pattern)))
+    return db.session.execute(query.limit(limit)).all()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--meals', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'search.db')}",
+                          'METRICS_ENABLED': False})
+        client = app.test_client()
+        with app.app_context():
+            seed(args.meals, args.users)
+            print(f"{args.meals:,} meals, {args.meals // args.users:,} per user\n")
+            print(f"{'query':<18} {'fts ms':>8} {'like ms':>8} {'speedup':>8}")
+            for text in QUERIES:
+                fts = best_of(lambda: client.get(f'/search?username=user0&q={text}&limit=20'), args.repeat)
+                # Ranking needs every match, so the LIKE scan reads the whole user history
+                like = best_of(lambda: like_scan(1, text, args.meals), args.repeat)
+                print(f"{text:<18} {fts:>8.2f} {like:>8.2f} {like / fts:>7.1f}x")
+
+            print()
+            for prefix in ('c', 'ch', 'chicken s'):
+                elapsed = best_of(lambda: client.get(f'/autocomplete?username=user0&prefix={prefix}'), args.repeat)
+                print(f"autocomplete {prefix!r:<12} {elapsed:>8.2f}ms")
@@ -0,0 +1,74 @@
+# Compare ORM + marshmallow against Core column tuples + RowSerializer
+# for the body of GET /meals/<username>.
+#
+#   python -m benchmarks.bench_serialization --sizes 1 100 10000
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from flask import jsonify
+from app import create_app, db
+from app.models import Meal, User
+from app.schemas import meals_schema
+from app.serializers import meal_serializer
+
+
+def seed(count):
+    db.session.execute(db.delete(Meal))
+    user_id = db.session.scalar(db.select(User.id).where(User.username == 'bench'))
+    if user_id is None:
+        user = User(username='bench', height=175, weight=70, activity_level=2, tdee=2500)
+        db.session.add(user)
+        db.session.flush()
+        user_id = user.id
+    start = date(2020, 1, 1)
+    db.session.execute(db.insert(Meal), [
+        {
+            'name': f'Meal {i}',
+            'user_id': user_id,
+            'description': 'Grilled chicken with mixed greens',
+            'calories': 300 + i % 400,
+            'date': start + timedelta(days=i // 3),
+        }
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def marshmallow_path():
+    meals = Meal.query.join(Meal.user).filter(User.username == 'bench').order_by(Meal.date, Meal.id).all()
+    return meals_schema.jsonify(meals).data
+
+
+def fast_path():
+    query = meal_serializer.select().where(User.username == 'bench').order_by(Meal.date, Meal.id)
+    return jsonify(meal_serializer.dump_many(db.session.execute(query))).data
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        with app.test_request_context():
+            print(f"{'meals':>8} {'marshmallow':>14} {'fast':>12} {'speedup':>8}")
+            for size in args.sizes:
+                seed(size)
+                assert marshmallow_path() == fast_path()
+                slow = best_of(marshmallow_path, args.repeat)
+                fast = best_of(fast_path, args.repeat)
+                print(f"{size:>8} {slow * 1000:>12.3f}ms {fast * 1000:>10.3f}ms {slow / fast:>7.1f}x")
@@ -0,0 +1,77 @@
+# Cold start: import time, create_app() time and time to first request,
+# each measured in a fresh interpreter, plus a `python -X importtime`
+# breakdown of the slowest imports.
+#
+#   python -m benchmarks.bench_startup --runs 5
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app({{'SQLALCHEMY_DATABASE_URI': {uri!r}}}, config_object={config!r})
+created = time.perf_counter()
+app.test_client().get('/get_meal/1')
+served = time.perf_counter()
+print(imported - start, created - imported, served - created)
+"""
+
+
+def probe(uri, config):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(uri=uri, config=config)],
+        capture_output=True, text=True, check=True, env=env,
+    ).stdout
+    return [float(value) * 1000 for value in output.split()]
+
+
+def importtime(uri, config, top):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    code = f"from app import create_app; create_app({{'SQLALCHEMY_DATABASE_URI': {uri!r}}}, config_object={config!r})"
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, check=True, env=env,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # Top-level imports and their direct children only
+        if not name.startswith(' ' * 4):
+            rows.append((int(cumulative_us), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12)
+    parser.add_argument('--config', default='app.config.Config')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        # Create the schema once, as a deploy would with 'flask db-upgrade'
+        probe(uri, 'app.config.Config')
+
+        runs = [probe(uri, args.config) for _ in range(args.runs)]
+        runs.sort(key=sum)
+        imported, created, served = runs[len(runs) // 2]
+        print(f"median of {args.runs} runs with {args.config}:")
+        print(f"  import app        {imported:7.1f}ms")
+        print(f"  create_app()      {created:7.1f}ms")
+        print(f"  first request     {served:7.1f}ms")
+        print(f"  total             {imported + created + served:7.1f}ms")
+
+        print(f"\nslowest imports (cumulative):")
+        for cumulative_us, name in importtime(uri, args.config, args.top):
+            print(f"  {cumulative_us / 1000:7.1f}ms {name}")
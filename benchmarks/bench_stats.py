@@ -0,0 +1,88 @@
+# GET /stats/<username> over a synthetic multi-year history, against a
+# straightforward Python loop over Meal ORM objects computing the same figures.
+#
+#   python -m benchmarks.bench_stats --years 5 --meals-per-day 4
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from app import create_app, db
+from app.models import Meal, User
+from app.rollup import rebuild_daily_totals
+
+
+def seed(years, meals_per_day):
+    user = User(username='bench', height=175, weight=70, activity_level=2, tdee=2300)
+    db.session.add(user)
+    db.session.flush()
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=365 * years)
+    rows = []
+    for day in range(365 * years):
+        if rng.random() < 0.1:
+            continue  # days without logging
+        for _ in range(meals_per_day):
+            rows.append({
+                'name': 'Meal', 'user_id': user.id, 'description': '',
+                'calories': rng.randint(200, 900), 'date': start + timedelta(days=day),
+            })
+    db.session.execute(db.insert(Meal), rows)
+    db.session.commit()
+    rebuild_daily_totals()
+    return len(rows)
+
+
+def python_loop(tdee):
+    # Baseline: hydrate every meal and aggregate in Python
+    per_day = defaultdict(int)
+    for meal in Meal.query.join(Meal.user).filter(User.username == 'bench').all():
+        per_day[meal.date] += meal.calories
+    per_week = defaultdict(list)
+    for day, calories in sorted(per_day.items()):
+        per_week[day - timedelta(days=day.weekday())].append(calories)
+    result = []
+    for start, values in per_week.items():
+        ordered = sorted(values)
+        result.append({
+            'start': start,
+            'total': sum(values),
+            'mean': statistics.mean(values),
+            'median': statistics.median(values),
+            'p90': statistics.quantiles(ordered, n=10, method='inclusive')[-1] if len(ordered) > 1 else ordered[0],
+            'over': sum(1 for value in values if value > tdee),
+        })
+    return result
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--meals-per-day', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"})
+        client = app.test_client()
+        with app.app_context():
+            meals = seed(args.years, args.meals_per_day)
+            print(f"{meals:,} meals over {args.years} years")
+            for period in ('week', 'month'):
+                elapsed = best_of(lambda: client.get(f'/stats/bench?period={period}'), args.repeat)
+                print(f"GET /stats?period={period:<6} {elapsed * 1000:8.1f}ms")
+            elapsed = best_of(lambda: python_loop(2300), args.repeat)
+            print(f"{'python loop (weekly)':<24} {elapsed * 1000:8.1f}ms")
@@ -0,0 +1,65 @@
+# Mixed concurrent reads and writes against the default and the production
+# SQLite profiles. Reports throughput and failed requests.
+#
+#   python -m benchmarks.bench_storage --threads 16 --requests 100
+import argparse
+import os
+import tempfile
+import threading
+import time
+from app import create_app, db
+from app.migrations import upgrade_database
+from app.models import User
+
+
+def run(path, config_object, threads, requests_per_thread):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'}, config_object=config_object)
+    with app.app_context():
+        upgrade_database()
+        db.session.add_all(
+            User(username=f'user{i}', height=175, weight=70, activity_level=2, tdee=2500) for i in range(threads)
+        )
+        db.session.commit()
+
+    failures = []
+
+    def worker(n):
+        client = app.test_client()
+        for i in range(requests_per_thread):
+            try:
+                if i % 4 == 0:
+                    response = client.post('/add_meal', json={
+                        'name': 'Snack', 'username': f'user{n}', 'calories': 50, 'date': '2024-06-01',
+                    })
+                else:
+                    response = client.get(f'/meals/user{n}?limit=100')
+                if response.status_code not in (200, 404):
+                    failures.append(response.status_code)
+            except Exception as e:
+                failures.append(type(e).__name__)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return threads * requests_per_thread / elapsed, len(failures)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread, 1 in 4 is a write')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f"{'profile':<12} {'req/s':>8} {'failed':>7}")
+        for label, config_object in (('default', 'app.config.Config'), ('production', 'app.config.ProductionConfig')):
+            rate, failed = run(path, config_object, args.threads, args.requests)
+            print(f"{label:<12} {rate:>8,.0f} {failed:>7}")
@@ -0,0 +1,67 @@
+# Concurrent POST /add_meal with and without the group-commit writer.
+# Reports throughput, commits per second and failed requests.
+#
+#   python -m benchmarks.bench_write_queue --threads 16 --meals 200
+import argparse
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import event
+from app import create_app, db
+from app.models import User
+
+
+def run(path, write_behind, threads, meals_per_thread):
+    if os.path.exists(path):
+        os.remove(path)
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'MEAL_WRITE_BEHIND': write_behind})
+    with app.app_context():
+        db.session.add_all(
+            User(username=f'user{i}', height=175, weight=70, activity_level=2, tdee=2500) for i in range(threads)
+        )
+        db.session.commit()
+        engine = db.engine
+
+    commits = []
+    event.listen(engine, 'commit', lambda conn: commits.append(1))
+    failures = []
+
+    def worker(n):
+        client = app.test_client()
+        for i in range(meals_per_thread):
+            try:
+                response = client.post('/add_meal', json={
+                    'name': 'Snack', 'username': f'user{n}', 'calories': 50, 'date': '2024-06-01',
+                })
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+            except Exception as e:
+                failures.append(type(e).__name__)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if write_behind:
+        app.extensions['meal_write_queue'].close()
+    total = threads * meals_per_thread
+    return total / elapsed, len(commits) / elapsed, len(commits), len(failures)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--meals', type=int, default=200, help='meals per thread')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f"{'mode':<14} {'meals/s':>10} {'commits/s':>10} {'commits':>8} {'failed':>7}")
+        for label, write_behind in (('per-request', False), ('write-behind', True)):
+            rate, commit_rate, commits, failed = run(path, write_behind, args.threads, args.meals)
+            print(f"{label:<14} {rate:>10,.0f} {commit_rate:>10,.0f} {commits:>8} {failed:>7}")
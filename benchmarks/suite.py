@@ -0,0 +1,286 @@
+# Endpoint latency suite. Seeds N users x M meals into a temporary SQLite
+# database, replays a weighted request mix through create_app()'s test client
+# and through a threaded local HTTP server, and writes p50/p95/p99 latency,
+# throughput and queries per request for each endpoint as a JSON baseline.
+#
+#   python -m benchmarks.suite --users 200 --meals-per-user 500 --requests 5000
+#   python -m benchmarks.suite --compare benchmarks/baselines/old.json benchmarks/baselines/new.json
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import event
+from werkzeug.serving import make_server
+from app import create_app, db
+from app.models import Meal, User
+from app.migrations import upgrade_database
+from app.rollup import rebuild_daily_totals
+
+SEED_CHUNK = 50000
+FIRST_DAY = date(2022, 1, 1)
+
+
+def seed(users, meals_per_user):
+    # Users user0..userN-1 (ids 1..N), meal k (1-based) belongs to user (k - 1) % users
+    for start in range(0, users, SEED_CHUNK):
+        db.session.execute(db.insert(User), [
+            {'username': f'user{i}', 'height': 150 + i % 50, 'weight': 50 + i % 60,
+             'activity_level': 1 + i % 5, 'tdee': 2000 + i % 800}
+            for i in range(start, min(start + SEED_CHUNK, users))
+        ])
+    total = users * meals_per_user
+    for start in range(0, total, SEED_CHUNK):
+        db.session.execute(db.insert(Meal), [
+            {'name': f'Meal {k}', 'user_id': k % users + 1, 'description': 'Seeded meal',
+             'calories': 200 + k % 700, 'date': FIRST_DAY + timedelta(days=(k // users) // 3)}
+            for k in range(start, min(start + SEED_CHUNK, total))
+        ])
+        db.session.commit()
+    rebuild_daily_totals()
+    return total
+
+
+class Mix:
+    # Weighted request mix; each entry builds (endpoint, method, url, json body)
+
+    def __init__(self, users, meals, rng):
+        self.users = users
+        self.meals = meals
+        self.rng = rng
+        self.days = max(1, meals // users // 3)
+        self.entries = [
+            (30, self.get_meals_page),
+            (7, self.get_meals_range),
+            (20, self.get_meal),
+            (25, self.add_meal),
+            (10, self.update_meal),
+            (5, self.get_stats),
+            (3, self.update_user),
+        ]
+        self.weights = [weight for weight, _ in self.entries]
+
+    def next(self):
+        _, build = self.rng.choices(self.entries, weights=self.weights)[0]
+        return build()
+
+    def _user(self):
+        return self.rng.randrange(self.users)
+
+    def _day(self):
+        return (FIRST_DAY + timedelta(days=self.rng.randrange(self.days))).isoformat()
+
+    def get_meals_page(self):
+        return 'get_meals', 'GET', f'/meals/user{self._user()}?limit=50', None
+
+    def get_meals_range(self):
+        day = self._day()
+        return 'get_meals', 'GET', f'/meals/user{self._user()}?from={day}&to={day}', None
+
+    def get_meal(self):
+        return 'get_meal', 'GET', f'/get_meal/{self.rng.randint(1, self.meals)}', None
+
+    def add_meal(self):
+        body = {'name': 'Replay', 'username': f'user{self._user()}', 'calories': self.rng.randint(100, 900), 'date': self._day()}
+        return 'add_meal', 'POST', '/add_meal', body
+
+    def update_meal(self):
+        meal_id = self.rng.randint(1, self.meals)
+        body = {'username': f'user{(meal_id - 1) % self.users}', 'calories': self.rng.randint(100, 900)}
+        return 'update_meal', 'PUT', f'/update_meal/{meal_id}', body
+
+    def get_stats(self):
+        return 'get_stats', 'GET', f'/stats/user{self._user()}?period=month', None
+
+    def update_user(self):
+        return 'update_user', 'PUT', f'/update_user/{self._user() + 1}', {'weight': self.rng.randint(50, 110)}
+
+
+def summarize(samples, elapsed):
+    results = {}
+    for endpoint, values in sorted(samples.items()):
+        latencies = np.array([latency for latency, _ in values]) * 1000
+        queries = [count for _, count in values if count is not None]
+        results[endpoint] = {
+            'count': len(values),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            'mean_ms': round(float(latencies.mean()), 3),
+            'throughput_rps': round(len(values) / elapsed, 1),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    return results
+
+
+def replay_test_client(app, mix, requests):
+    # Single-threaded replay, also counting SQL statements per request
+    counter = {'queries': 0}
+
+    def count(*args):
+        counter['queries'] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    client = app.test_client()
+    samples = defaultdict(list)
+    start = time.perf_counter()
+    try:
+        for _ in range(requests):
+            endpoint, method, url, body = mix.next()
+            counter['queries'] = 0
+            began = time.perf_counter()
+            response = client.open(url, method=method, json=body)
+            samples[endpoint].append((time.perf_counter() - began, counter['queries']))
+            assert response.status_code < 500, (url, response.status_code)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return summarize(samples, time.perf_counter() - start)
+
+
+def replay_server(app, mix, requests, threads):
+    # Concurrent replay over real HTTP against a threaded local server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    jobs = [mix.next() for _ in range(requests)]
+    samples = defaultdict(list)
+    lock = threading.Lock()
+
+    def worker(chunk):
+        for endpoint, method, url, body in chunk:
+            data = None if body is None else json.dumps(body).encode()
+            request = urllib.request.Request(base + url, data=data, method=method,
+                                             headers={'Content-Type': 'application/json'})
+            began = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except urllib.error.HTTPError as e:
+                e.read()
+                assert e.code < 500, (url, e.code)
+            with lock:
+                samples[endpoint].append((time.perf_counter() - began, None))
+
+    workers = [threading.Thread(target=worker, args=(jobs[i::threads],)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return summarize(samples, elapsed)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'suite.db')}"},
+                         config_object=args.config)
+        with app.app_context():
+            upgrade_database()
+            began = time.perf_counter()
+            meals = seed(args.users, args.meals_per_user)
+            print(f"Seeded {args.users:,} users and {meals:,} meals in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+
+        rng = random.Random(args.seed)
+        results = {
+            'test_client': replay_test_client(app, Mix(args.users, meals, rng), args.requests),
+            'server': replay_server(app, Mix(args.users, meals, rng), args.requests, args.threads),
+        }
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': args.config,
+            'users': args.users,
+            'meals_per_user': args.meals_per_user,
+            'requests': args.requests,
+            'threads': args.threads,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+
+def print_results(baseline):
+    for mode, endpoints in baseline['results'].items():
+        print(f"\n[{mode}]")
+        print(f"{'endpoint':<14} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8}")
+        for endpoint, row in endpoints.items():
+            queries = '-' if row['queries_per_request'] is None else row['queries_per_request']
+            print(f"{endpoint:<14} {row['count']:>6} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} "
+                  f"{row['throughput_rps']:>8} {queries:>8}")
+
+
+def compare(old_path, new_path, threshold):
+    # Print relative change per endpoint and metric, exit 1 if any p95 regressed past threshold
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['meta']['revision']} -> {new['meta']['revision']}")
+    regressed = False
+    for mode in new['results']:
+        print(f"\n[{mode}]")
+        for endpoint, row in new['results'][mode].items():
+            before = old['results'].get(mode, {}).get(endpoint)
+            if before is None:
+                print(f"{endpoint:<14} new")
+                continue
+            changes = []
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+                if before[metric] and row[metric] is not None:
+                    change = (row[metric] - before[metric]) / before[metric] * 100
+                    changes.append(f"{metric} {before[metric]} -> {row[metric]} ({change:+.1f}%)")
+                    if metric == 'p95_ms' and change > threshold:
+                        regressed = True
+            print(f"{endpoint:<14} " + ', '.join(changes))
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--meals-per-user', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per replay mode')
+    parser.add_argument('--threads', type=int, default=8, help='client threads for the server replay')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--config', default='app.config.Config')
+    parser.add_argument('--output', help='baseline path, default benchmarks/baselines/<revision>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='diff two baselines instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='p95 regression in percent that fails --compare')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.threshold))
+
+    baseline = run(args)
+    print_results(baseline)
+    output = args.output or os.path.join(os.path.dirname(__file__), 'baselines', f"{baseline['meta']['revision']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    print(f"\nWrote {output}", file=sys.stderr)
@@ -0,0 +1,141 @@
+import threading
+import pytest
+from app import create_app, db
+from app.admission import Rejected, WriteAdmission
+from app.models import User
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def app(tmp_path):
+    # Two writes of burst and one more per second per user, five per client IP
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'admission.db'}",
+        'WRITE_RATE_PER_USER': 1,
+        'WRITE_BURST_PER_USER': 2,
+        'WRITE_RATE_PER_IP': 1,
+        'WRITE_BURST_PER_IP': 5,
+        'WRITE_MAX_IN_FLIGHT': 2,
+    })
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.session.add_all([
+            User(username='alice', height=170, weight=60, activity_level=2, tdee=2000),
+            User(username='bob', height=180, weight=80, activity_level=2, tdee=2500),
+        ])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def post_meal(client, username, ip='10.0.0.1'):
+    return client.post('/add_meal', json={'name': 'Snack', 'username': username, 'calories': 100, 'date': '2024-06-01'},
+                       environ_base={'REMOTE_ADDR': ip})
+
+def test_rate_limit_per_user_and_ip(app):
+    client = app.test_client()
+    assert [post_meal(client, 'alice').status_code for _ in range(2)] == [200, 200]
+
+    # alice is out of tokens; the rejection is fast and says when to come back
+    response = post_meal(client, 'alice')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+    assert "alice" in response.get_json()['error']
+
+    # bob from the same client is unaffected, and is limited from any client once out of tokens
+    assert [post_meal(client, 'bob').status_code for _ in range(2)] == [200, 200]
+    assert post_meal(client, 'bob', ip='10.0.0.2').status_code == 429
+    assert post_meal(client, 'alice', ip='10.0.0.2').status_code == 429
+
+    # The client's last token goes to an unknown user, then the client is limited
+    assert post_meal(client, 'carol').status_code == 400
+    response = post_meal(client, 'dave')
+    assert response.status_code == 429
+    assert "10.0.0.1" in response.get_json()['error']
+
+    state = client.get('/metrics/admission').get_json()
+    assert state['admitted'] == 5
+    assert state['rate_limited'] == {'user': 3, 'ip': 1}
+    assert {entry['key'] for entry in state['throttled_users']} == {'alice', 'bob'}
+    assert 'meal_tracker_write_rate_limited_total 4' in client.get('/metrics').get_data(as_text=True)
+
+def test_rejected_rate_does_not_charge_the_other_bucket():
+    clock = FakeClock()
+    admission = WriteAdmission(user_rate=1, user_burst=1, ip_rate=1, ip_burst=2, clock=clock)
+    admission.check_rate('alice', 'ip')
+    with pytest.raises(Rejected) as e:
+        admission.check_rate('alice', 'ip')
+    assert e.value.status == 429
+    assert e.value.retry_after == pytest.approx(1.0)
+
+    # The client's second token is still there for another user
+    admission.check_rate('bob', 'ip')
+
+    clock.now = 0.5
+    with pytest.raises(Rejected) as e:
+        admission.check_rate('alice', 'other-ip')
+    assert e.value.retry_after == pytest.approx(0.5)
+    clock.now = 1.0
+    admission.check_rate('alice', 'other-ip')
+
+def test_concurrency_cap_queues_then_sheds():
+    admission = WriteAdmission(max_in_flight=1, max_queued=1, queue_timeout=5)
+    admission.acquire()
+
+    # One write waits for the slot, the next has nowhere to wait
+    waiter = threading.Thread(target=admission.acquire)
+    waiter.start()
+    while admission.stats()['queued'] == 0:
+        pass
+    with pytest.raises(Rejected) as e:
+        admission.acquire()
+    assert e.value.status == 503
+
+    admission.release()
+    waiter.join()
+    stats = admission.stats()
+    assert (stats['in_flight'], stats['queued'], stats['admitted']) == (1, 0, 2)
+    assert stats['shed'] == {'queue_full': 1, 'queue_timeout': 0}
+
+    # A queued write gives up after the timeout
+    admission.queue_timeout = 0.01
+    admission.max_queued = 1
+    with pytest.raises(Rejected):
+        admission.acquire()
+    assert admission.stats()['shed']['queue_timeout'] == 1
+
+def test_write_behind_batches_are_not_capped(tmp_path):
+    # Meals waiting on the group-commit writer do not hold admission slots
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'queue.db'}",
+        'MEAL_WRITE_BEHIND': True,
+        'MEAL_WRITE_MAX_DELAY': 0.2,
+        'WRITE_MAX_IN_FLIGHT': 1,
+        'WRITE_MAX_QUEUED': 20,
+    })
+    with app.app_context():
+        db.session.add(User(username='alice', height=170, weight=60, activity_level=2, tdee=2000))
+        db.session.commit()
+        statuses = []
+
+        def post():
+            statuses.append(post_meal(app.test_client(), 'alice').status_code)
+
+        threads = [threading.Thread(target=post) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue = app.extensions['meal_write_queue']
+        queue.close()
+
+        assert statuses == [200] * 10
+        assert queue.stats()['batches'] < 10
+        assert app.extensions['write_admission'].stats()['in_flight'] == 0
+        db.drop_all()
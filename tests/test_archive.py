@@ -0,0 +1,108 @@
+import os
+import pytest
+from datetime import date
+from app import create_app, db
+from app.archive import archive_meals, meal_archive
+from app.commands import archive_meals_command
+from app.models import ArchivedMeal, Meal, User
+from app.rollup import rebuild_daily_totals, verify_daily_totals
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'archive.db'}",
+        'MEAL_ARCHIVE_DIR': str(tmp_path / 'archive'),
+    })
+    app.config['TESTING'] = True
+    with app.app_context():
+        user = User(username='testuser', height=180, weight=75, activity_level=3, tdee=2500)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([
+            Meal(name='Old breakfast', user_id=user.id, description='Oats', calories=300, date=date(2023, 1, 5)),
+            Meal(name='Old dinner', user_id=user.id, description='Stew', calories=700, date=date(2023, 1, 5)),
+            Meal(name='Spring lunch', user_id=user.id, description='Salad', calories=400, date=date(2023, 3, 10)),
+            Meal(name='Recent lunch', user_id=user.id, description='Soup', calories=500, date=date(2024, 5, 1)),
+        ])
+        db.session.commit()
+        rebuild_daily_totals()
+        yield app
+        db.drop_all()
+
+def test_reads_span_hot_and_archived_meals(app):
+    client = app.test_client()
+    before = client.get('/meals/testuser').get_json()
+    pages = client.get('/meals/testuser?limit=2').get_json()
+
+    assert list(archive_meals(date(2024, 1, 1), chunk_size=2)) == [2, 3]
+
+    # Only the recent meal is left in the hot table, in a compact file per month
+    assert db.session.query(Meal).count() == 1
+    assert sorted(os.listdir(app.config['MEAL_ARCHIVE_DIR'] + '/1')) == ['2023-01.1.json.gz', '2023-03.1.json.gz']
+
+    # Lists, pages, ranges and streams read across both tiers unchanged
+    assert client.get('/meals/testuser').get_json() == before
+    first = client.get('/meals/testuser?limit=2').get_json()
+    assert first == pages
+    second = client.get(f"/meals/testuser?limit=2&cursor={first['next']}").get_json()
+    assert [meal['name'] for meal in second['meals']] == ['Spring lunch', 'Recent lunch']
+    assert second['next'] is None
+    assert client.get('/meals/testuser?from=2023-03-01&to=2023-03-31').get_json() == [before[2]]
+    assert client.get('/meals/testuser?stream=json').get_json() == before
+
+    # Single meals are found in the archive by id, but can no longer be changed
+    assert client.get(f"/get_meal/{before[0]['id']}").get_json() == before[0]
+    response = client.put(f"/update_meal/{before[0]['id']}", json={'username': 'testuser', 'calories': 1})
+    assert response.status_code == 404
+    data = client.post('/batch/meals', json={'ids': [4, 1]}).get_json()
+    assert [meal['id'] for meal in data['meals']] == [4, 1]
+    assert data['meals'][1] == dict(before[0], tdee=2500, remaining_calories=1500)
+
+    # The rollup still counts archived meals, and a rebuild keeps them
+    stats = client.get('/stats/testuser?period=month&from=2023-01-01&to=2023-01-31').get_json()
+    assert stats['periods'][0]['total_calories'] == 1000
+    assert verify_daily_totals() == []
+    rebuild_daily_totals()
+    assert verify_daily_totals() == []
+
+def test_archived_ids_are_not_reused(app):
+    client = app.test_client()
+    list(archive_meals(date(2025, 1, 1)))
+    assert db.session.query(Meal).count() == 0
+
+    response = client.post('/add_meal', json={'name': 'New', 'username': 'testuser', 'calories': 100, 'date': '2025-02-01'})
+    assert response.get_json()['meal']['id'] == 5
+    assert [meal['id'] for meal in client.get('/meals/testuser').get_json()] == [1, 2, 3, 4, 5]
+
+def test_uncommitted_archive_files_are_ignored(app):
+    client = app.test_client()
+    list(archive_meals(date(2024, 1, 1)))
+    before = client.get('/meals/testuser').get_json()
+
+    # A run that wrote its files but died before committing leaves a newer
+    # generation holding meals that are still hot
+    archive = meal_archive()
+    archive.write(1, '2024-05', 0, [(4, 'Recent lunch', 'Soup', 500, date(2024, 5, 1))])
+    archive.write(1, '2023-03', 1, [(4, 'Recent lunch', 'Soup', 500, date(2023, 3, 1))])
+    assert client.get('/meals/testuser').get_json() == before
+
+    # Archiving more of a month moves it to a new generation and drops the old file
+    db.session.add(Meal(name='Late entry', user_id=1, calories=250, date=date(2023, 3, 20)))
+    db.session.commit()
+    assert list(archive_meals(date(2024, 1, 1))) == [1]
+    assert sorted(os.listdir(app.config['MEAL_ARCHIVE_DIR'] + '/1')) == ['2023-01.1.json.gz', '2023-03.2.json.gz', '2024-05.1.json.gz']
+    assert [meal['name'] for meal in client.get('/meals/testuser?to=2023-12-31').get_json()] == [
+        'Old breakfast', 'Old dinner', 'Spring lunch', 'Late entry']
+
+def test_delete_user_removes_archive(app):
+    client = app.test_client()
+    list(archive_meals(date(2024, 1, 1)))
+    assert client.delete('/delete_user/1').status_code == 204
+    assert db.session.query(ArchivedMeal).count() == 0
+    assert not os.path.exists(app.config['MEAL_ARCHIVE_DIR'] + '/1')
+
+def test_archive_command(app):
+    result = app.test_cli_runner().invoke(archive_meals_command, ['--before', '2023-02-01'])
+    assert result.exit_code == 0
+    assert 'archived 2 meals dated before 2023-02-01' in result.output
+    assert db.session.query(ArchivedMeal).count() == 2
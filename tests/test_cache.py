@@ -0,0 +1,41 @@
+from app.cache import UserProfileCache, UserProfile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_and_counters():
+    cache = UserProfileCache(max_size=2, ttl=60)
+    cache.put('alice', UserProfile(1, 2000))
+    cache.put('bob', UserProfile(2, 2500))
+
+    # Touch alice so bob becomes the least recently used entry
+    assert cache.get('alice') == UserProfile(1, 2000)
+    cache.put('carol', UserProfile(3, 1800))
+
+    assert cache.get('bob') is None
+    assert cache.get('carol') == UserProfile(3, 1800)
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 2, 'misses': 1, 'evictions': 1}
+
+def test_ttl_expiry_and_invalidation():
+    clock = FakeClock()
+    cache = UserProfileCache(max_size=10, ttl=5, clock=clock)
+    cache.put('alice', UserProfile(1, 2000))
+    cache.put('bob', UserProfile(2, 2500))
+
+    clock.now = 4
+    assert cache.get('alice') is not None
+
+    # Entries expire after the TTL
+    clock.now = 6
+    assert cache.get('alice') is None
+
+    # Explicit invalidation takes effect immediately
+    cache.invalidate('bob', 'unknown')
+    assert cache.get('bob') is None
+    assert cache.stats()['size'] == 0
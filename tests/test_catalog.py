@@ -0,0 +1,108 @@
+import pytest
+from app import create_app, db
+from app.catalog import Food, FoodCatalog, write_catalog
+from app.models import User
+
+FOODS = [
+    (7, 'Apple, raw', 52, 182),
+    (3, 'Apricot', 48, 35),
+    (12, 'apple pie', 237, 125),
+    (5, 'Banana', 89, 118),
+    (9, 'Äpfel, gebacken', 62.5, 0),
+]
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'catalog.db'}",
+        'FOOD_CATALOG_PATH': str(tmp_path / 'foods.catalog'),
+    })
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.session.add(User(username='testuser', height=180, weight=75, activity_level=3, tdee=2500))
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def test_catalog_lookups(tmp_path):
+    path = tmp_path / 'foods.catalog'
+    assert write_catalog(path, FOODS) == 5
+    catalog = FoodCatalog(path)
+    assert len(catalog) == 5
+    assert catalog.get(7) == Food(7, 'Apple, raw', 52.0, 182.0)
+    assert catalog.get(9) == Food(9, 'Äpfel, gebacken', 62.5, 0.0)
+    assert catalog.get(8) is None
+    assert catalog.get(100) is None
+
+    # Prefix matches ignore case and come back in name order
+    assert [food.id for food in catalog.search('APP')] == [12, 7]
+    assert [food.id for food in catalog.search('ap', limit=2)] == [12, 7]
+    assert [food.id for food in catalog.search('ap')] == [12, 7, 3]
+    assert [food.id for food in catalog.search('äp')] == [9]
+    assert catalog.search('zucchini') == []
+    catalog.close()
+
+def test_long_names_are_cut_on_a_character_boundary(tmp_path):
+    path = tmp_path / 'foods.catalog'
+    write_catalog(path, FOODS + [(20, 'é' * 40000, 100, 100)])
+    catalog = FoodCatalog(path)
+    assert catalog.get(20).name == 'é' * 32767
+    assert [food.id for food in catalog.search('a')] == [12, 7, 3]
+    assert [food.id for food in catalog.search('éé')] == [20]
+    catalog.close()
+
+def test_write_catalog_rejects_bad_input(tmp_path):
+    with pytest.raises(ValueError, match='Duplicate food id 3'):
+        write_catalog(tmp_path / 'dup.catalog', FOODS + [(3, 'Other', 1, 1)])
+    (tmp_path / 'junk').write_bytes(b'not a catalog at all, just some bytes')
+    with pytest.raises(ValueError, match='not a version 1 food catalog'):
+        FoodCatalog(tmp_path / 'junk')
+
+def test_foods_route_and_catalog_meals(app, tmp_path):
+    client = app.test_client()
+    assert client.get('/foods?prefix=app').status_code == 404
+
+    # Build the catalog from CSV; the running app picks it up
+    source = tmp_path / 'foods.csv'
+    source.write_text('id,name,kcal_per_100g,serving_grams\n' + ''.join(
+        f'{food_id},"{name}",{kcal},{serving}\n' for food_id, name, kcal, serving in FOODS), encoding='utf-8')
+    result = app.test_cli_runner().invoke(args=['build-food-catalog', str(source)])
+    assert result.exit_code == 0, result.output
+    assert 'Wrote 5 foods' in result.output
+
+    response = client.get('/foods?prefix=Apple&limit=1')
+    assert response.status_code == 200
+    assert response.get_json() == [{'id': 12, 'name': 'apple pie', 'kcal_per_100g': 237.0, 'serving_grams': 125.0}]
+    assert client.get('/foods?prefix=').status_code == 400
+    assert client.get('/foods?prefix=a&limit=0').status_code == 400
+    assert client.get('/foods/5').get_json()['name'] == 'Banana'
+    assert client.get('/foods/6').status_code == 404
+
+    # A serving by default, or the given grams; an explicit name wins
+    response = client.post('/add_meal', json={'username': 'testuser', 'food_id': 7, 'date': '2024-06-01'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['meal']['name'] == 'Apple, raw'
+    assert data['meal']['calories'] == 95
+    response = client.post('/add_meal', json={'username': 'testuser', 'food_id': 5, 'grams': 250,
+                                              'name': 'Two bananas', 'date': '2024-06-01'})
+    assert response.get_json()['meal']['calories'] == 222
+    assert response.get_json()['remaining_calories'] == 2500 - 95 - 222
+
+    for body, error in [
+        ({'food_id': 6}, 'Unknown food_id 6.'),
+        ({'food_id': '7'}, 'food_id must be an integer.'),
+        ({'food_id': 7, 'grams': 0}, 'grams must be a positive number.'),
+        ({'food_id': 7, 'grams': float('inf')}, 'grams must be a positive number.'),
+        ({'food_id': 7, 'grams': float('nan')}, 'grams must be a positive number.'),
+    ]:
+        response = client.post('/add_meal', json={'username': 'testuser', **body})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == error
+
+def test_build_food_catalog_reports_bad_rows(app, tmp_path):
+    source = tmp_path / 'foods.csv'
+    source.write_text('id,name,kcal_per_100g,serving_grams\n1,Rice,130,150\nx,Beans,100,\n', encoding='utf-8')
+    result = app.test_cli_runner().invoke(args=['build-food-catalog', str(source)])
+    assert result.exit_code != 0
+    assert 'Line 3' in result.output
@@ -0,0 +1,80 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import date
+from app import create_app, db
+from app.archive import archive_meals
+from app.commands import export_meals_command
+from app.models import Meal, User
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'export.db'}",
+        'MEAL_ARCHIVE_DIR': str(tmp_path / 'archive'),
+        'EXPORT_CHUNK_SIZE': 2,
+    })
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.session.add_all([
+            User(username='alice', height=170, weight=60, activity_level=2, tdee=2100),
+            User(username='bob', height=180, weight=80, activity_level=3, tdee=2700),
+        ])
+        db.session.flush()
+        # Ids 1-7 alternate between the users; the 2023 meals get archived
+        for i, day in enumerate([date(2023, 1, 5), date(2024, 5, 1), date(2023, 2, 1), date(2024, 5, 2),
+                                 date(2024, 5, 3), date(2023, 1, 6), date(2024, 5, 4)]):
+            db.session.add(Meal(name=f'Meal {i + 1}', user_id=i % 2 + 1, description=None if i == 4 else 'Food',
+                                calories=100 * (i + 1), date=day))
+        db.session.commit()
+        list(archive_meals(date(2024, 1, 1)))
+        yield app
+        db.drop_all()
+
+def test_export_user_csv(app):
+    client = app.test_client()
+    response = client.get('/export/alice?format=csv')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=meals-1.csv'
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['id', 'user_id', 'username', 'name', 'description', 'calories', 'date']
+    # Hot and archived meals together, in id order
+    assert rows[1:] == [
+        ['1', '1', 'alice', 'Meal 1', 'Food', '100', '2023-01-05'],
+        ['3', '1', 'alice', 'Meal 3', 'Food', '300', '2023-02-01'],
+        ['5', '1', 'alice', 'Meal 5', '', '500', '2024-05-03'],
+        ['7', '1', 'alice', 'Meal 7', 'Food', '700', '2024-05-04'],
+    ]
+
+    # Resuming after an id, optionally compressed
+    response = client.get('/export/alice?after=3&gzip=1')
+    assert response.mimetype == 'application/gzip'
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert [json.loads(line)['id'] for line in lines] == [5, 7]
+    assert json.loads(lines[0]) == {'id': 5, 'user_id': 1, 'username': 'alice', 'name': 'Meal 5',
+                                    'description': None, 'calories': 500, 'date': '2024-05-03'}
+
+def test_export_errors(app):
+    client = app.test_client()
+    assert client.get('/export/alice?format=xml').status_code == 400
+    assert client.get('/export/alice?after=x').status_code == 400
+    assert client.get('/export/nobody').status_code == 404
+
+def test_export_command(app, tmp_path):
+    runner = app.test_cli_runner()
+    output = tmp_path / 'all.ndjson'
+    result = runner.invoke(export_meals_command, ['--output', str(output)])
+    assert result.exit_code == 0
+    assert 'Exported 7 meals, last id 7.' in result.output
+    meals = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [meal['id'] for meal in meals] == [1, 2, 3, 4, 5, 6, 7]
+    assert [meal['username'] for meal in meals[:2]] == ['alice', 'bob']
+
+    result = runner.invoke(export_meals_command, ['--username', 'bob', '--format', 'csv', '--after-id', '2', '--gzip',
+                                                  '--output', str(tmp_path / 'bob.csv.gz')])
+    assert result.exit_code == 0
+    rows = gzip.decompress((tmp_path / 'bob.csv.gz').read_bytes()).decode().splitlines()
+    assert [row.split(',')[0] for row in rows] == ['id', '4', '6']
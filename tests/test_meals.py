@@ -1,7 +1,12 @@
 import pytest
 from app import create_app, db
-from app.models import Meal, User
+from app.models import Meal, User, DailyTotal
+from app.schemas import meal_schema, meals_schema, user_schema
+from app.serializers import meal_serializer, user_serializer
+from app.utils import calculate_tdee
+from flask import jsonify
 import json
+from datetime import date
 
 @pytest.fixture
 def client():
@@ -24,8 +29,8 @@ def test_get_meals_by_username(client):
     db.session.commit()
     
     # Create meals for the user
-    meal1 = Meal(name='Grilled Chicken Salad', username='john_doe', description='Grilled chicken breast with mixed greens and vinaigrette', calories=350, date='2024-06-02')
-    meal2 = Meal(name='Pasta Carbonara', username='john_doe', description='Spaghetti with creamy sauce, bacon, and parmesan cheese', calories=600, date='2024-06-02')
+    meal1 = Meal(name='Grilled Chicken Salad', user_id=user.id, description='Grilled chicken breast with mixed greens and vinaigrette', calories=350, date=date(2024, 6, 2))
+    meal2 = Meal(name='Pasta Carbonara', user_id=user.id, description='Spaghetti with creamy sauce, bacon, and parmesan cheese', calories=600, date=date(2024, 6, 2))
     db.session.add(meal1)
     db.session.add(meal2)
     db.session.commit()
@@ -77,6 +82,24 @@ def test_add_meal(client):
     assert response_data['meal']['date'] == meal_data['date']
     assert 'remaining_calories' in response_data
 
+def test_add_meal_calories_are_stored_as_integers(client):
+    db.session.add(User(username='testuser', height=180, weight=75, activity_level=3, tdee=2500))
+    db.session.commit()
+
+    # An integer string is stored and returned as the integer
+    response = client.post('/add_meal', json={'name': 'Soup', 'username': 'testuser', 'calories': '350', 'date': '2024-05-31'})
+    assert response.status_code == 200
+    meal = response.get_json()['meal']
+    assert meal['calories'] == 350
+    assert response.get_json()['remaining_calories'] == 2150
+    assert client.get(f"/get_meal/{meal['id']}").get_json() == meal
+
+    for calories in ('lots', 3.5, True, None):
+        response = client.post('/add_meal', json={'name': 'Soup', 'username': 'testuser', 'calories': calories})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == "calories must be an integer."
+    assert Meal.query.count() == 1
+
 def test_add_meal_user_not_exist(client):
     # Data for a meal with a non-existent user
     meal_data = {
@@ -102,7 +125,7 @@ def test_get_meal(client):
     db.session.add(test_user)
     db.session.commit()
 
-    test_meal = Meal(name='Dinner', username='testuser', description='Steak and potatoes', calories=600, date='2024-05-30')
+    test_meal = Meal(name='Dinner', user_id=test_user.id, description='Steak and potatoes', calories=600, date=date(2024, 5, 30))
     db.session.add(test_meal)
     db.session.commit()
 
@@ -123,7 +146,7 @@ def test_update_meal(client):
     db.session.add(user)
     db.session.commit()
 
-    meal = Meal(name='Grilled Chicken Salad', username='john_doe', description='Grilled chicken breast with mixed greens', calories=350, date='2024-06-02')
+    meal = Meal(name='Grilled Chicken Salad', user_id=user.id, description='Grilled chicken breast with mixed greens', calories=350, date=date(2024, 6, 2))
     db.session.add(meal)
     db.session.commit()
 
@@ -168,7 +191,7 @@ def test_delete_meal(client):
     db.session.add(test_user)
     db.session.commit()
 
-    test_meal = Meal(name='Dinner', username='testuser', description='Steak and potatoes', calories=600, date='2024-05-30')
+    test_meal = Meal(name='Dinner', user_id=test_user.id, description='Steak and potatoes', calories=600, date=date(2024, 5, 30))
     db.session.add(test_meal)
     db.session.commit()
 
@@ -282,4 +305,675 @@ def test_delete_user(client):
 
     # Verify the response
     assert response.status_code == 204
-    assert User.query.get(test_user.id) is None
\ No newline at end of file
+    assert User.query.get(test_user.id) is None
+    assert client.delete(f'/delete_user/{test_user.id}').status_code == 404
+
+def test_meals_follow_their_user(client):
+    # Create two users with meals
+    for username in ('testuser', 'other'):
+        client.post('/add_user', json={'username': username, 'height': 180, 'weight': 75, 'activity_level': 3})
+        client.post('/add_meal', json={'name': 'Dinner', 'username': username, 'calories': 600, 'date': '2024-05-30'})
+    test_user = User.query.filter_by(username='testuser').first()
+
+    # Renaming the user keeps their meals
+    client.put(f'/update_user/{test_user.id}', json={'username': 'renamed'})
+    meals = client.get('/meals/renamed').get_json()
+    assert [(meal['name'], meal['username']) for meal in meals] == [('Dinner', 'renamed')]
+    assert client.get('/meals/testuser').status_code == 404
+
+    # Deleting the user removes their meals, daily totals and search entries with it
+    assert client.delete(f'/delete_user/{test_user.id}').status_code == 204
+    db.session.expire_all()
+    assert [meal.user.username for meal in Meal.query.all()] == ['other']
+    assert DailyTotal.query.filter_by(user_id=test_user.id).count() == 0
+    assert db.session.execute(db.text("SELECT count(*) FROM meal_fts WHERE meal_fts MATCH 'dinner'")).scalar() == 1
+
+def test_daily_total_follows_meal_changes(client):
+    # Create a test user
+    test_user = User(username='testuser', height=180, weight=75, activity_level=3, tdee=2500)
+    db.session.add(test_user)
+    db.session.commit()
+
+    # Add two meals on the same day
+    meal_data = {'name': 'Breakfast', 'username': 'testuser', 'calories': 400, 'date': '2024-05-30'}
+    response = client.post('/add_meal', json=meal_data)
+    assert response.get_json()['remaining_calories'] == 2100
+    meal_data = {'name': 'Lunch', 'username': 'testuser', 'calories': 700, 'date': '2024-05-30'}
+    response = client.post('/add_meal', json=meal_data)
+    assert response.get_json()['remaining_calories'] == 1400
+    lunch_id = response.get_json()['meal']['id']
+
+    total = db.session.get(DailyTotal, (test_user.id, date(2024, 5, 30)))
+    assert (total.calories, total.meal_count) == (1100, 2)
+
+    # Move lunch to the next day with different calories
+    response = client.put(f'/update_meal/{lunch_id}', json={'username': 'testuser', 'calories': 650, 'date': '2024-05-31'})
+    assert response.status_code == 200
+    db.session.expire_all()
+    total = db.session.get(DailyTotal, (test_user.id, date(2024, 5, 30)))
+    assert (total.calories, total.meal_count) == (400, 1)
+    total = db.session.get(DailyTotal, (test_user.id, date(2024, 5, 31)))
+    assert (total.calories, total.meal_count) == (650, 1)
+
+    # Deleting the last meal of a day removes its rollup row
+    client.delete(f'/meals/{lunch_id}')
+    db.session.expire_all()
+    assert db.session.get(DailyTotal, (test_user.id, date(2024, 5, 31))) is None
+
+def test_daily_totals_rebuild_and_verify(client):
+    # Meals inserted behind the routes' back leave the rollup out of sync
+    test_user = User(username='testuser', height=180, weight=75, activity_level=3, tdee=2500)
+    db.session.add(test_user)
+    db.session.commit()
+    db.session.add(Meal(name='Dinner', user_id=test_user.id, calories=600, date=date(2024, 5, 30)))
+    db.session.add(Meal(name='Snack', user_id=test_user.id, calories=200, date=date(2024, 5, 30)))
+    db.session.commit()
+
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(args=['daily-totals', 'verify'])
+    assert result.exit_code != 0
+    assert f'Mismatch: user {test_user.id} 2024-05-30' in result.output
+
+    result = runner.invoke(args=['daily-totals', 'rebuild'])
+    assert result.exit_code == 0
+    total = db.session.get(DailyTotal, (test_user.id, date(2024, 5, 30)))
+    assert (total.calories, total.meal_count) == (800, 2)
+
+    result = runner.invoke(args=['daily-totals', 'verify'])
+    assert result.exit_code == 0
+    assert 'in sync' in result.output
+
+def test_get_meals_date_range(client):
+    # Create meals over three days
+    user = User(username='john_doe', height=175, weight=70, activity_level=2, tdee=2300)
+    db.session.add(user)
+    db.session.commit()
+    for day in (1, 2, 3):
+        db.session.add(Meal(name=f'Meal {day}', user_id=user.id, calories=500, date=date(2024, 6, day)))
+    db.session.commit()
+
+    # Test an inclusive range that leaves out the first day
+    response = client.get('/meals/john_doe?from=2024-06-02&to=2024-06-03')
+    assert response.status_code == 200
+    meals = response.get_json()
+    assert [meal['date'] for meal in meals] == ['2024-06-02', '2024-06-03']
+
+    # Test an open-ended range
+    response = client.get('/meals/john_doe?to=2024-06-01')
+    assert [meal['name'] for meal in response.get_json()] == ['Meal 1']
+
+    # Test a malformed bound
+    response = client.get('/meals/john_doe?from=June')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "Invalid date 'June', expected YYYY-MM-DD."
+
+def test_upgrade_string_dates_in_place(client):
+    # Recreate the meal table the way older versions stored it
+    db.drop_all()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(100) NOT NULL UNIQUE, height INTEGER NOT NULL, '
+            "weight INTEGER NOT NULL, activity_level INTEGER NOT NULL, tdee INTEGER)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE meal (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, username VARCHAR(100) NOT NULL, "
+            "description VARCHAR(200), calories INTEGER NOT NULL, date VARCHAR(20) NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO \"user\" (username, height, weight, activity_level, tdee) VALUES ('john_doe', 175, 70, 2, 2300)"
+        )
+        conn.exec_driver_sql("INSERT INTO meal (name, username, calories, date) VALUES ('Toast', 'john_doe', 200, '2024-06-02')")
+        conn.exec_driver_sql("INSERT INTO meal (name, username, calories, date) VALUES ('Soup', 'john_doe', 300, '2024/06/02')")
+        # A meal left behind by a deleted user
+        conn.exec_driver_sql("INSERT INTO meal (name, username, calories, date) VALUES ('Stew', 'gone', 400, '2024-06-02')")
+
+    from app.migrations import upgrade_database
+    upgrade_database()
+
+    # The column is now a DATE with the composite index, meals point at their
+    # user by id, and values survived; the orphaned meal is gone
+    inspector = db.inspect(db.engine)
+    assert 'ix_meal_user_id_date' in [index['name'] for index in inspector.get_indexes('meal')]
+    assert [key['referred_table'] for key in inspector.get_foreign_keys('meal')] == ['user']
+    user = User.query.filter_by(username='john_doe').first()
+    meals = Meal.query.order_by(Meal.id).all()
+    assert [(meal.user_id, meal.date) for meal in meals] == [(user.id, date(2024, 6, 2)), (user.id, date(2024, 6, 2))]
+
+    # The daily rollup was rebuilt from the migrated rows
+    total = db.session.get(DailyTotal, (user.id, date(2024, 6, 2)))
+    assert (total.calories, total.meal_count) == (500, 2)
+
+    # And the existing meals were indexed for search
+    assert [meal['name'] for meal in client.get('/search?username=john_doe&q=soup').get_json()] == ['Soup']
+
+def test_failed_upgrade_is_rolled_back(client, monkeypatch):
+    # An old database whose dates need no fixing, so the first statement of
+    # the upgrade is DDL
+    db.drop_all()
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(100) NOT NULL UNIQUE, height INTEGER NOT NULL, '
+            "weight INTEGER NOT NULL, activity_level INTEGER NOT NULL, tdee INTEGER)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE meal (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, username VARCHAR(100) NOT NULL, "
+            "description VARCHAR(200), calories INTEGER NOT NULL, date VARCHAR(20) NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO \"user\" (username, height, weight, activity_level, tdee) VALUES ('john_doe', 175, 70, 2, 2300)"
+        )
+        conn.exec_driver_sql("INSERT INTO meal (name, username, calories, date) VALUES ('Toast', 'john_doe', 200, '2024-06-02')")
+
+    # The last step fails after all the others have run
+    from app import migrations
+    steps = migrations.MIGRATIONS
+
+    def broken(conn):
+        steps[-1][1](conn)
+        raise RuntimeError("Step failed.")
+    monkeypatch.setattr(migrations, 'MIGRATIONS', steps[:-1] + [(steps[-1][0], broken)])
+    with pytest.raises(RuntimeError, match='Step failed.'):
+        migrations.upgrade_database()
+
+    # Nothing was kept, and the upgrade goes through once the step is fixed
+    assert set(db.inspect(db.engine).get_table_names()) == {'user', 'meal'}
+    with db.engine.connect() as conn:
+        assert migrations.current_version(conn) == 1
+    monkeypatch.setattr(migrations, 'MIGRATIONS', steps)
+    assert migrations.upgrade_database() == (1, migrations.SCHEMA_VERSION)
+    assert [(meal.name, meal.date) for meal in Meal.query.all()] == [('Toast', date(2024, 6, 2))]
+
+def test_get_meals_keyset_pages(client):
+    # Create five meals, two of them sharing a day
+    user = User(username='john_doe', height=175, weight=70, activity_level=2, tdee=2300)
+    db.session.add(user)
+    db.session.commit()
+    for day in (1, 2, 2, 3, 4):
+        db.session.add(Meal(name=f'Meal {day}', user_id=user.id, calories=500, date=date(2024, 6, day)))
+    db.session.commit()
+
+    # Walk the pages until the cursor runs out
+    seen = []
+    url = '/meals/john_doe?limit=2'
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['meals']) <= 2
+        seen.extend(meal['id'] for meal in page['meals'])
+        if page['next'] is None:
+            break
+        url = f"/meals/john_doe?limit=2&cursor={page['next']}"
+
+    all_ids = [meal['id'] for meal in client.get('/meals/john_doe').get_json()]
+    assert seen == all_ids
+
+    # Test malformed paging parameters
+    assert client.get('/meals/john_doe?limit=0').status_code == 400
+    assert client.get('/meals/john_doe?limit=abc').status_code == 400
+    assert client.get('/meals/john_doe?limit=2&cursor=%%%').status_code == 400
+
+def test_get_meals_streamed(client):
+    # Create a few meals
+    user = User(username='john_doe', height=175, weight=70, activity_level=2, tdee=2300)
+    db.session.add(user)
+    db.session.commit()
+    for day in (1, 2, 3):
+        db.session.add(Meal(name=f'Meal {day}', user_id=user.id, calories=500, date=date(2024, 6, day)))
+    db.session.commit()
+    expected = client.get('/meals/john_doe').get_json()
+
+    # A streamed JSON array carries the same meals as the buffered response
+    response = client.get('/meals/john_doe?stream=json')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert json.loads(response.data) == expected
+
+    # NDJSON has one meal per line
+    response = client.get('/meals/john_doe?stream=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.data.splitlines()] == expected
+
+    # Test an unknown stream format and an empty stream
+    assert client.get('/meals/john_doe?stream=xml').status_code == 400
+    assert client.get('/meals/nobody?stream=json').status_code == 404
+
+def test_add_meals_bulk(client):
+    # Create two users
+    db.session.add(User(username='alice', height=170, weight=60, activity_level=2, tdee=2000))
+    db.session.add(User(username='bob', height=180, weight=80, activity_level=3, tdee=2500))
+    db.session.commit()
+
+    meals = [
+        {'name': 'Oats', 'username': 'alice', 'calories': 400, 'date': '2024-06-01'},
+        {'name': 'Steak', 'username': 'bob', 'calories': 900, 'date': '2024-06-01'},
+        {'name': 'Pizza', 'username': 'alice', 'calories': 1700, 'date': '2024-06-01'},
+        {'name': 'Ghost', 'username': 'nobody', 'calories': 100, 'date': '2024-06-01'},
+        {'name': 'Bad', 'username': 'alice', 'calories': 'lots'},
+    ]
+    response = client.post('/meals/bulk', json=meals)
+    assert response.status_code == 200
+    data = response.get_json()
+
+    # Valid rows are stored, the others are reported by index
+    assert [row['index'] for row in data['created']] == [0, 1, 2]
+    assert [error['index'] for error in data['errors']] == [3, 4]
+    assert data['errors'][0]['error'] == "Username 'nobody' does not exist. Please register first."
+    assert Meal.query.count() == 3
+
+    # Remaining calories are reported once per affected day
+    days = {(day['username'], day['date']): day for day in data['days']}
+    assert days[('alice', '2024-06-01')]['remaining_calories'] == 0
+    assert days[('alice', '2024-06-01')]['message'] == "The daily TDEE has been surpassed by 100 calories."
+    assert days[('bob', '2024-06-01')]['remaining_calories'] == 1600
+
+    alice = User.query.filter_by(username='alice').first()
+    total = db.session.get(DailyTotal, (alice.id, date(2024, 6, 1)))
+    assert (total.calories, total.meal_count) == (2100, 2)
+
+def test_add_meals_bulk_ndjson(client):
+    # Create a user
+    db.session.add(User(username='alice', height=170, weight=60, activity_level=2, tdee=2000))
+    db.session.commit()
+
+    body = '\n'.join([
+        json.dumps({'name': 'Oats', 'username': 'alice', 'calories': 400, 'date': '2024-06-01'}),
+        '{not json',
+        json.dumps({'name': 'Soup', 'username': 'alice', 'calories': 300, 'date': '2024-06-02'}),
+    ])
+    response = client.post('/meals/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [row['index'] for row in data['created']] == [0, 2]
+    assert data['errors'] == [{'index': 1, 'error': 'Line is not valid JSON.'}]
+    assert [day['remaining_calories'] for day in data['days']] == [1600, 1700]
+
+    # A batch where nothing is valid is rejected
+    response = client.post('/meals/bulk', json=[{'name': 'Ghost', 'username': 'nobody', 'calories': 1}])
+    assert response.status_code == 400
+
+def test_add_meals_bulk_without_tdee(client):
+    # A user without a TDEE gets no remaining calories, and the batch is stored once
+    db.session.add(User(username='carol', height=165, weight=55, activity_level=2, tdee=None))
+    db.session.commit()
+
+    response = client.post('/meals/bulk', json=[
+        {'name': 'Oats', 'username': 'carol', 'calories': 400, 'date': '2024-06-01'},
+        {'name': 'Soup', 'username': 'carol', 'calories': 300, 'date': '2024-06-01'},
+    ])
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [row['index'] for row in data['created']] == [0, 1]
+    assert data['days'] == [{'username': 'carol', 'date': '2024-06-01', 'message': 'Meal added successfully.',
+                             'remaining_calories': None}]
+    assert Meal.query.count() == 2
+
+def test_user_cache_invalidated_by_user_updates(client):
+    # Create a user through the API and log a meal to warm the cache
+    user_id = client.post('/add_user', json={'username': 'alice', 'height': 170, 'weight': 60, 'activity_level': 1}).get_json()['id']
+    meal_data = {'name': 'Oats', 'username': 'alice', 'calories': 100, 'date': '2024-06-01'}
+    client.post('/add_meal', json=meal_data)
+    client.post('/add_meal', json=meal_data)
+    cache = client.application.extensions['user_cache']
+    assert cache.stats()['hits'] >= 1
+
+    # A TDEE reassessment is visible to the next meal
+    new_tdee = client.put(f'/update_user/{user_id}', json={'activity_level': 5}).get_json()['user']['tdee']
+    response = client.post('/add_meal', json=meal_data)
+    assert response.get_json()['remaining_calories'] == new_tdee - 300
+
+    # After a rename the old username is unknown and the new one works
+    client.put(f'/update_user/{user_id}', json={'username': 'alicia'})
+    assert client.post('/add_meal', json=meal_data).status_code == 400
+    assert client.post('/add_meal', json=dict(meal_data, username='alicia')).status_code == 200
+
+    # A deleted user can no longer log meals
+    client.delete(f'/delete_user/{user_id}')
+    assert client.post('/add_meal', json=dict(meal_data, username='alicia')).status_code == 400
+
+def test_fast_serializer_matches_schemas(client):
+    # Create a user and meals, including one without a description
+    user = User(username='john_doe', height=175, weight=70, activity_level=2, tdee=2300)
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Meal(name='Toast', user_id=user.id, description=None, calories=200, date=date(2024, 6, 1)))
+    db.session.add(Meal(name='Soup', user_id=user.id, description='Tomato', calories=300, date=date(2024, 6, 2)))
+    db.session.commit()
+
+    # The column-tuple path serializes byte for byte like the marshmallow schemas
+    meals = Meal.query.order_by(Meal.id).all()
+    rows = db.session.execute(meal_serializer.select().order_by(Meal.id)).all()
+    assert jsonify(meal_serializer.dump_many(rows)).data == meals_schema.jsonify(meals).data
+    assert jsonify(meal_serializer.dump(rows[0])).data == meal_schema.jsonify(meals[0]).data
+
+    row = db.session.execute(user_serializer.select()).first()
+    assert jsonify(user_serializer.dump(row)).data == user_schema.jsonify(user).data
+
+    # And so do the endpoints using it
+    assert client.get('/meals/john_doe').data == meals_schema.jsonify(meals).data
+    assert client.get(f'/get_meal/{meals[1].id}').data == meal_schema.jsonify(meals[1]).data
+    assert client.get('/get_meal/999').status_code == 404
+
+def test_get_stats(client):
+    # Create a user and two weeks of meals (2024-06-03 is a Monday)
+    db.session.add(User(username='alice', height=170, weight=60, activity_level=2, tdee=2000))
+    db.session.commit()
+    daily = {3: 1800, 4: 2200, 5: 1500, 6: 1900, 10: 2500, 11: 1000, 12: 1200}
+    meals = []
+    for day, calories in daily.items():
+        meals.append({'name': 'Lunch', 'username': 'alice', 'calories': calories - 500, 'date': f'2024-06-{day:02d}'})
+        meals.append({'name': 'Snack', 'username': 'alice', 'calories': 500, 'date': f'2024-06-{day:02d}'})
+    client.post('/meals/bulk', json=meals)
+
+    response = client.get('/stats/alice?period=week')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['tdee'] == 2000
+    first, second = data['periods']
+    assert first == {
+        'start': '2024-06-03',
+        'days_logged': 4,
+        'total_calories': 7400,
+        'mean_calories': 1850.0,
+        'median_calories': 1850.0,
+        'p90_calories': 2110.0,
+        'days_over_tdee': 1,
+        'longest_streak': 2,
+        'moving_average': 1850.0,
+    }
+    assert second['start'] == '2024-06-10'
+    assert second['days_over_tdee'] == 1
+    assert second['longest_streak'] == 2
+    assert second['moving_average'] == round((1850 + 4700 / 3) / 2, 1)
+    assert data['current_streak'] == 2
+    assert data['longest_streak'] == 2
+
+    # Monthly periods and date ranges
+    data = client.get('/stats/alice?period=month&from=2024-06-10').get_json()
+    assert [(p['start'], p['days_logged']) for p in data['periods']] == [('2024-06-01', 3)]
+
+    # Test bad input
+    assert client.get('/stats/alice?period=year').status_code == 400
+    assert client.get('/stats/nobody').status_code == 404
+
+def test_get_stats_without_tdee(client):
+    # A user without a TDEE still gets totals, but no days over it or streaks
+    user = User(username='bob', height=180, weight=80, activity_level=2)
+    db.session.add(user)
+    db.session.commit()
+    assert client.get('/stats/bob').get_json()['longest_streak'] is None
+    db.session.add_all([
+        Meal(name='Lunch', user_id=user.id, calories=calories, date=date(2024, 6, day))
+        for day, calories in ((3, 1800), (4, 2200), (5, 1500))
+    ])
+    db.session.commit()
+    from app.rollup import rebuild_daily_totals
+    rebuild_daily_totals()
+
+    response = client.get('/stats/bob')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['tdee'] is None
+    assert (data['current_streak'], data['longest_streak']) == (None, None)
+    period, = data['periods']
+    assert (period['total_calories'], period['median_calories']) == (5500, 1800.0)
+    assert (period['days_over_tdee'], period['longest_streak']) == (None, None)
+
+def test_recompute_tdee_command(client):
+    # Users with stale or missing TDEE values and one that is already correct
+    db.session.add(User(username='stale', height=180, weight=75, activity_level=3, tdee=1))
+    db.session.add(User(username='missing', height=160, weight=55, activity_level=1))
+    db.session.add(User(username='current', height=170, weight=70, activity_level=2, tdee=calculate_tdee(170, 70, 2)))
+    db.session.commit()
+
+    # A dry run only prints the diff
+    runner = client.application.test_cli_runner()
+    result = runner.invoke(args=['recompute-tdee', '--dry-run', '--chunk-size', '2'])
+    assert result.exit_code == 0
+    assert f"stale: 1 -> {calculate_tdee(180, 75, 3)}" in result.output
+    assert f"missing: None -> {calculate_tdee(160, 55, 1)}" in result.output
+    assert 'current:' not in result.output
+    assert 'would change 2 users' in result.output
+    db.session.expire_all()
+    assert User.query.filter_by(username='stale').first().tdee == 1
+
+    # The real run writes the new values back
+    result = runner.invoke(args=['recompute-tdee', '--chunk-size', '2'])
+    assert result.exit_code == 0
+    assert 'updated 2 users' in result.output
+    db.session.expire_all()
+    assert User.query.filter_by(username='stale').first().tdee == calculate_tdee(180, 75, 3)
+    assert User.query.filter_by(username='missing').first().tdee == calculate_tdee(160, 55, 1)
+
+def test_daily_report_command(client, tmp_path):
+    db.session.add_all([User(username=f'user{i}', height=170, weight=70, activity_level=2, tdee=2000) for i in range(6)])
+    db.session.add(User(username='no_tdee', height=170, weight=70, activity_level=2))
+    db.session.commit()
+    for username, calories in [('user0', 2600), ('user1', 1900), ('user2', 2100), ('user2', 700), ('user4', 1200)]:
+        client.post('/add_meal', json={'name': 'Meal', 'username': username, 'calories': calories, 'date': '2024-06-01'})
+    client.post('/add_meal', json={'name': 'Meal', 'username': 'user1', 'calories': 5000, 'date': '2024-06-02'})
+
+    runner = client.application.test_cli_runner()
+    reports = []
+    for workers in ('1', '2'):
+        output = tmp_path / f'report{workers}.json'
+        result = runner.invoke(args=['daily-report', '--date', '2024-06-01', '--workers', workers, '--partitions', '3',
+                                     '--top', '2', '--bucket-width', '500', '-o', str(output)])
+        assert result.exit_code == 0
+        assert '2 of 4 users who logged meals exceeded their TDEE' in result.output
+        reports.append(json.loads(output.read_text()))
+
+    # Partial results merge the same way however many processes computed them
+    for report in reports:
+        del report['workers'], report['seconds']
+    assert reports[0] == reports[1]
+    report = reports[0]
+    assert (report['users'], report['users_without_tdee'], report['users_logged']) == (7, 1, 4)
+    assert (report['exceeded'], report['exceeded_share'], report['excess_calories']) == (2, 0.5, 1400)
+    assert [(row['username'], row['excess']) for row in report['top_offenders']] == [('user2', 800), ('user0', 600)]
+    assert report['remaining_histogram'] == {'bucket_width': 500, 'buckets': [
+        {'from': -1000, 'to': -500, 'count': 2},
+        {'from': 0, 'to': 500, 'count': 1},
+        {'from': 500, 'to': 1000, 'count': 1},
+    ]}
+
+def test_metrics_endpoint(client, caplog):
+    # Create a user and a few meals through the API
+    db.session.add(User(username='alice', height=170, weight=60, activity_level=2, tdee=2000))
+    db.session.commit()
+    for calories in (300, 400, 500):
+        client.post('/add_meal', json={'name': 'Snack', 'username': 'alice', 'calories': calories, 'date': '2024-06-01'})
+    client.get('/meals/alice')
+    client.get('/get_meal/999')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE meal_tracker_request_duration_seconds histogram' in text
+    assert 'meal_tracker_request_duration_seconds_count{endpoint="routes.add_meal"} 3' in text
+    assert 'meal_tracker_responses_total{endpoint="routes.get_meal",status="404"} 1' in text
+    # The meal list fetched three meals with one query, after the data version lookup
+    assert 'meal_tracker_request_rows_sum{endpoint="routes.get_meals"} 4' in text
+    assert 'meal_tracker_request_queries_sum{endpoint="routes.get_meals"} 2' in text
+    # Two of the meals and the meal list found alice in the user cache
+    assert 'meal_tracker_user_cache_hits_total 3' in text
+    # /metrics does not measure itself
+    assert 'endpoint="routes.metrics"' not in text
+
+    # Opt-in N+1 warning and slow query samples
+    client.application.config['METRICS_QUERY_WARNING_THRESHOLD'] = 1
+    client.application.config['METRICS_SLOW_QUERY_SECONDS'] = 0
+    client.post('/add_meal', json={'name': 'Snack', 'username': 'alice', 'calories': 100, 'date': '2024-06-02'})
+    assert 'possible N+1 pattern' in caplog.text
+    samples = client.get('/metrics/slow_queries').get_json()
+    assert samples and all(sample['endpoint'] == 'routes.add_meal' for sample in samples)
+
+def test_conditional_get_meals(client):
+    # Create a user and a meal
+    client.post('/add_user', json={'username': 'john_doe', 'height': 175, 'weight': 70, 'activity_level': 2})
+    meal_id = client.post('/add_meal', json={'name': 'Toast', 'username': 'john_doe', 'calories': 200,
+                                             'date': '2024-06-01'}).get_json()['meal']['id']
+
+    # Unchanged data answers 304 with the same ETag, for the list and a single meal
+    response = client.get('/meals/john_doe')
+    etag = response.headers['ETag']
+    response = client.get('/meals/john_doe', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    meal_etag = client.get(f'/get_meal/{meal_id}').headers['ETag']
+    assert client.get(f'/get_meal/{meal_id}', headers={'If-None-Match': meal_etag}).status_code == 304
+
+    # Any tag matches an existing meal, and only an existing one
+    response = client.get(f'/get_meal/{meal_id}', headers={'If-None-Match': '*'})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == meal_etag
+    assert client.get(f'/get_meal/{meal_id + 100}', headers={'If-None-Match': '*'}).status_code == 404
+
+    # Other query strings are other representations
+    assert client.get('/meals/john_doe?limit=1', headers={'If-None-Match': etag}).status_code == 200
+
+    # Revalidating a meal does not read the meal table
+    queries = []
+    db.event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+    client.get(f'/get_meal/{meal_id}', headers={'If-None-Match': meal_etag})
+    assert queries and not any('FROM meal' in statement for statement in queries)
+
+    # Every write to the user's meals changes the tags
+    client.put(f'/update_meal/{meal_id}', json={'username': 'john_doe', 'calories': 250})
+    response = client.get('/meals/john_doe', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()[0]['calories'] == 250
+    assert client.get(f'/get_meal/{meal_id}', headers={'If-None-Match': meal_etag}).status_code == 200
+
+    etag = response.headers['ETag']
+    client.post('/meals/bulk', json=[{'name': 'Soup', 'username': 'john_doe', 'calories': 300, 'date': '2024-06-01'}])
+    response = client.get('/meals/john_doe', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+
+    # The repeated read was served from the body cache
+    assert client.get('/meals/john_doe').data == response.data
+    assert client.application.extensions['meal_body_cache'].stats()['hits'] >= 1
+
+    etag = response.headers['ETag']
+    client.delete(f'/meals/{meal_id}')
+    assert client.get('/meals/john_doe', headers={'If-None-Match': etag}).status_code == 200
+
+def test_conditional_get_meals_reused_username(client):
+    # alice logs a meal and keeps the tag of her list
+    alice_id = client.post('/add_user', json={'username': 'alice', 'height': 170, 'weight': 60,
+                                              'activity_level': 2}).get_json()['id']
+    client.post('/add_meal', json={'name': 'Toast', 'username': 'alice', 'calories': 200, 'date': '2024-06-01'})
+    etag = client.get('/meals/alice').headers['ETag']
+
+    # She is renamed and a new user takes her old name, at the same data version
+    client.put(f'/update_user/{alice_id}', json={'username': 'bob'})
+    client.post('/add_user', json={'username': 'alice', 'height': 180, 'weight': 80, 'activity_level': 2})
+    client.post('/add_meal', json={'name': 'Soup', 'username': 'alice', 'calories': 300, 'date': '2024-06-01'})
+
+    # The old tag does not match the new alice's meals
+    response = client.get('/meals/alice', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [meal['name'] for meal in response.get_json()] == ['Soup']
+
+def test_search_and_autocomplete(client):
+    # Create two users and some meals
+    for username in ('john_doe', 'jane'):
+        client.post('/add_user', json={'username': username, 'height': 175, 'weight': 70, 'activity_level': 2})
+    client.post('/meals/bulk', json=[
+        {'name': 'Chicken salad', 'username': 'john_doe', 'description': 'Grilled chicken, lettuce', 'calories': 450},
+        {'name': 'Chicken salad', 'username': 'john_doe', 'calories': 400},
+        {'name': 'Chili', 'username': 'john_doe', 'description': 'With beans', 'calories': 600},
+        {'name': 'Toast', 'username': 'john_doe', 'description': 'With chicken pate', 'calories': 250},
+        {'name': 'Chicken soup', 'username': 'jane', 'calories': 300},
+    ])
+
+    # Ranked matches on name and description, only among the user's meals
+    response = client.get('/search?username=john_doe&q=chicken')
+    assert response.status_code == 200
+    names = [meal['name'] for meal in response.get_json()]
+    assert sorted(names) == ['Chicken salad', 'Chicken salad', 'Toast']
+    assert names[-1] == 'Toast'
+    assert len(client.get('/search?username=john_doe&q=chicken&limit=1').get_json()) == 1
+
+    # The last word matches as a prefix and query syntax is treated as text
+    assert [meal['name'] for meal in client.get('/search?username=john_doe&q=bea').get_json()] == ['Chili']
+    assert client.get('/search?username=john_doe&q="chicken" OR (').status_code == 200
+
+    # The index follows updates and deletes
+    toast = next(meal for meal in client.get('/meals/john_doe').get_json() if meal['name'] == 'Toast')
+    client.put(f"/update_meal/{toast['id']}", json={'username': 'john_doe', 'description': 'With butter'})
+    assert len(client.get('/search?username=john_doe&q=chicken').get_json()) == 2
+    assert [meal['name'] for meal in client.get('/search?username=john_doe&q=butter').get_json()] == ['Toast']
+    client.delete(f"/meals/{toast['id']}")
+    assert client.get('/search?username=john_doe&q=butter').get_json() == []
+
+    # Distinct names by case-insensitive prefix, most logged first
+    assert client.get('/autocomplete?username=john_doe&prefix=chi').get_json() == ['Chicken salad', 'Chili']
+    assert client.get('/autocomplete?username=john_doe&prefix=chi&limit=1').get_json() == ['Chicken salad']
+    assert client.get('/autocomplete?username=john_doe&prefix=%25').get_json() == []
+
+    assert client.get('/search?username=john_doe').status_code == 400
+    assert client.get('/autocomplete?username=john_doe&prefix=c&limit=0').status_code == 400
+    assert client.get('/search?username=nobody&q=chicken').status_code == 404
+
+def test_batch_meals(client):
+    users = [User(username='coach_a', height=170, weight=60, activity_level=2, tdee=2000),
+             User(username='coach_b', height=180, weight=80, activity_level=3)]
+    db.session.add_all(users)
+    db.session.commit()
+    ids = []
+    for calories in (500, 900):
+        response = client.post('/add_meal', json={'name': 'Meal', 'username': 'coach_a', 'calories': calories, 'date': '2024-06-01'})
+        ids.append(response.get_json()['meal']['id'])
+    meal = Meal(name='Meal', user_id=users[1].id, description='', calories=400, date=date(2024, 6, 1))
+    db.session.add(meal)
+    db.session.commit()
+    ids.append(meal.id)
+
+    # Requested order, duplicates once, unknown ids reported
+    response = client.post('/batch/meals', json={'ids': [ids[2], ids[0], 999, ids[0]]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['not_found'] == [999]
+    assert [meal['id'] for meal in data['meals']] == [ids[2], ids[0]]
+    # Remaining calories are for the whole day, a user without a TDEE has none
+    assert data['meals'][1] == {'id': ids[0], 'name': 'Meal', 'username': 'coach_a', 'description': '',
+                                'calories': 500, 'date': '2024-06-01', 'tdee': 2000, 'remaining_calories': 600}
+    assert data['meals'][0]['tdee'] is None and data['meals'][0]['remaining_calories'] is None
+
+    assert client.post('/batch/meals', json={'ids': []}).status_code == 400
+    assert client.post('/batch/meals', json={'ids': ['1']}).status_code == 400
+    assert client.post('/batch/meals', json=[1]).status_code == 400
+
+def test_batch_daily_summary(client):
+    db.session.add_all([User(username='client_a', height=170, weight=60, activity_level=2, tdee=2000),
+                        User(username='client_b', height=180, weight=80, activity_level=3, tdee=2600)])
+    db.session.commit()
+    for username, calories, day in [('client_a', 800, '2024-06-01'), ('client_a', 1500, '2024-06-01'),
+                                    ('client_a', 300, '2024-06-03'), ('client_a', 700, '2024-06-09')]:
+        client.post('/add_meal', json={'name': 'Meal', 'username': username, 'calories': calories, 'date': day})
+
+    response = client.post('/batch/daily_summary', json={
+        'usernames': ['client_b', 'client_a', 'ghost'], 'from': '2024-06-01', 'to': '2024-06-07'})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'from': '2024-06-01',
+        'to': '2024-06-07',
+        'users': [
+            {'username': 'client_b', 'tdee': 2600, 'total_calories': 0, 'days': []},
+            {'username': 'client_a', 'tdee': 2000, 'total_calories': 2600, 'days': [
+                {'date': '2024-06-01', 'calories': 2300, 'meal_count': 2, 'remaining_calories': 0},
+                {'date': '2024-06-03', 'calories': 300, 'meal_count': 1, 'remaining_calories': 1700},
+            ]},
+        ],
+        'unknown': ['ghost'],
+    }
+
+    # A single day by default, and bad ranges are rejected
+    data = client.post('/batch/daily_summary', json={'usernames': ['client_a'], 'from': '2024-06-09', 'to': '2024-06-09'}).get_json()
+    assert data['users'][0]['days'] == [{'date': '2024-06-09', 'calories': 700, 'meal_count': 1, 'remaining_calories': 1300}]
+    assert client.post('/batch/daily_summary', json={'usernames': ['client_a'], 'from': '2024-06-09', 'to': '2024-06-01'}).status_code == 400
+    assert client.post('/batch/daily_summary', json={'usernames': ['client_a'], 'from': '2020-01-01', 'to': '2024-06-01'}).status_code == 400
+    assert client.post('/batch/daily_summary', json={'usernames': 'client_a'}).status_code == 400
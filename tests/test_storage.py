@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+import pytest
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.models import Meal, User
+from app.migrations import upgrade_database
+from app.storage import run_with_retry
+
+@pytest.fixture
+def app(tmp_path):
+    # App using the production storage profile on a throwaway database
+    app = create_app(
+        {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'prod.db'}"},
+        config_object='app.config.ProductionConfig',
+    )
+    app.config['TESTING'] = True
+    with app.app_context():
+        # Production does not create tables on startup
+        upgrade_database()
+        yield app
+        db.drop_all()
+
+def test_production_pragmas_applied(app):
+    with db.engine.connect() as conn:
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+        assert conn.exec_driver_sql('PRAGMA temp_store').scalar() == 2  # MEMORY
+
+def test_run_with_retry_on_busy(app):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            error = sqlite3.OperationalError('database is locked')
+            error.sqlite_errorcode = sqlite3.SQLITE_BUSY
+            raise OperationalError('INSERT', {}, error)
+        return 'done'
+
+    assert run_with_retry(flaky, retries=3, backoff=0) == 'done'
+    assert len(calls) == 3
+
+    # Other operational errors and exhausted retries are raised
+    calls.clear()
+    with pytest.raises(OperationalError):
+        run_with_retry(flaky, retries=1, backoff=0)
+
+    def broken():
+        calls.append(1)
+        raise OperationalError('SELECT', {}, sqlite3.OperationalError('no such table: meal'))
+
+    calls.clear()
+    with pytest.raises(OperationalError):
+        run_with_retry(broken, retries=3, backoff=0)
+    assert len(calls) == 1
+
+def test_concurrent_mixed_reads_and_writes(app):
+    for i in range(4):
+        db.session.add(User(username=f'user{i}', height=175, weight=70, activity_level=2, tdee=2500))
+    db.session.commit()
+
+    failures = []
+    requests_done = []
+
+    def worker(n):
+        client = app.test_client()
+        for i in range(25):
+            username = f'user{n % 4}'
+            response = client.post('/add_meal', json={'name': 'Snack', 'username': username, 'calories': 10, 'date': '2024-06-01'})
+            if response.status_code != 200:
+                failures.append(response.status_code)
+            response = client.get(f'/meals/{username}?limit=50')
+            if response.status_code != 200:
+                failures.append(response.status_code)
+            requests_done.append(2)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{sum(requests_done)} mixed requests in {elapsed:.2f}s ({sum(requests_done) / elapsed:,.0f} req/s)")
+    assert failures == []
+    assert Meal.query.count() == 200
+
+def test_production_startup_skips_schema(tmp_path):
+    app = create_app(
+        {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'fresh.db'}"},
+        config_object='app.config.ProductionConfig',
+    )
+    runner = app.test_cli_runner()
+    with app.app_context():
+        assert db.inspect(db.engine).get_table_names() == []
+
+        result = runner.invoke(args=['db-upgrade', '--check'])
+        assert result.exit_code == 1
+        assert 'Database is at version None' in result.output
+
+        result = runner.invoke(args=['db-upgrade'])
+        assert result.exit_code == 0
+        assert 'Created database at version' in result.output
+        assert {'meal', 'user', 'daily_total', 'schema_version'} <= set(db.inspect(db.engine).get_table_names())
+
+        result = runner.invoke(args=['db-upgrade'])
+        assert 'Database already at version' in result.output
+        result = runner.invoke(args=['db-upgrade', '--check'])
+        assert result.exit_code == 0
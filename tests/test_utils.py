@@ -0,0 +1,15 @@
+import itertools
+from app.utils import calculate_tdee, calculate_tdee_array
+
+def test_calculate_tdee_array_matches_scalar():
+    # Every combination over realistic and out-of-range inputs
+    heights = range(100, 231, 7)
+    weights = range(30, 201, 3)
+    levels = range(0, 8)
+    combos = list(itertools.product(heights, weights, levels))
+
+    result = calculate_tdee_array(*zip(*combos))
+    assert result.tolist() == [calculate_tdee(h, w, a) for h, w, a in combos]
+
+def test_calculate_tdee_array_empty():
+    assert calculate_tdee_array([], [], []).tolist() == []
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import pytest
+from sqlalchemy.exc import OperationalError
+from datetime import date
+from app import create_app, db
+from app.models import Meal, User, DailyTotal
+
+@pytest.fixture
+def app(tmp_path):
+    # App with add_meal going through the group-commit writer
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'queue.db'}",
+        'MEAL_WRITE_BEHIND': True,
+        'MEAL_WRITE_MAX_DELAY': 0.05,
+    })
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.session.add(User(username='testuser', height=180, weight=75, activity_level=3, tdee=2500))
+        db.session.commit()
+        yield app
+        app.extensions['meal_write_queue'].close()
+        db.drop_all()
+
+def test_add_meal_response_unchanged(app):
+    client = app.test_client()
+    response = client.post('/add_meal', json={'name': 'Lunch', 'username': 'testuser', 'calories': 700, 'date': '2024-05-30'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['message'] == 'Meal added successfully.'
+    assert data['remaining_calories'] == 1800
+    assert data['meal'] == {
+        'id': data['meal']['id'],
+        'name': 'Lunch',
+        'username': 'testuser',
+        'description': '',
+        'calories': 700,
+        'date': '2024-05-30',
+    }
+    assert client.get(f"/get_meal/{data['meal']['id']}").get_json() == data['meal']
+
+def test_add_meal_string_calories(app):
+    client = app.test_client()
+    response = client.post('/add_meal', json={'name': 'Lunch', 'username': 'testuser', 'calories': '700', 'date': '2024-05-30'})
+    assert response.get_json()['meal']['calories'] == 700
+    assert client.post('/add_meal', json={'name': 'Lunch', 'username': 'testuser', 'calories': 'x'}).status_code == 400
+
+def test_concurrent_meals_share_commits(app):
+    results = []
+
+    def post_meal():
+        response = app.test_client().post('/add_meal', json={'name': 'Snack', 'username': 'testuser', 'calories': 100, 'date': '2024-05-30'})
+        results.append(response.get_json())
+
+    threads = [threading.Thread(target=post_meal) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every request got its own meal and the running total it would have seen serially
+    assert len({result['meal']['id'] for result in results}) == 20
+    assert sorted(result['remaining_calories'] for result in results) == list(range(500, 2500, 100))
+
+    # Fewer commits than meals, and the rollup agrees with the meal table
+    stats = app.extensions['meal_write_queue'].stats()
+    assert stats['meals'] == 20
+    assert stats['batches'] < 20
+    db.session.expire_all()
+    assert Meal.query.count() == 20
+    user = User.query.filter_by(username='testuser').first()
+    assert db.session.get(DailyTotal, (user.id, date(2024, 5, 30))).calories == 2000
+
+def test_add_meal_timeout_is_retryable(app):
+    # Hold the writer inside its first batch
+    write_queue = app.extensions['meal_write_queue']
+    started, release = threading.Event(), threading.Event()
+    write = write_queue._write
+
+    def held_write(batch):
+        started.set()
+        release.wait(5)
+        write(batch)
+    write_queue._write = held_write
+
+    user = User.query.filter_by(username='testuser').first()
+    future = write_queue.submit(dict(name='First', user_id=user.id, description='', calories=100, date=date(2024, 5, 30)))
+    assert started.wait(5)
+
+    # A meal still waiting for its batch is dropped and the client told to retry
+    app.config['MEAL_WRITE_TIMEOUT'] = 0.01
+    meal = {'username': 'testuser', 'calories': 100, 'date': '2024-05-30'}
+    response = app.test_client().post('/add_meal', json={**meal, 'name': 'Second'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+    # One whose batch is already being written is waited for past the timeout
+    threading.Timer(0.1, release.set).start()
+    assert write_queue.wait(future, 0.01)[1] == 100
+    app.config['MEAL_WRITE_TIMEOUT'] = 10
+    assert app.test_client().post('/add_meal', json={**meal, 'name': 'Third'}).status_code == 200
+    db.session.expire_all()
+    assert [meal.name for meal in Meal.query.order_by(Meal.id)] == ['First', 'Third']
+
+def test_add_meal_busy_is_not_resubmitted(app):
+    error = sqlite3.OperationalError('database is locked')
+    error.sqlite_errorcode = sqlite3.SQLITE_BUSY
+
+    def busy(rows):
+        raise OperationalError('INSERT', {}, error)
+    write_queue = app.extensions['meal_write_queue']
+    write_queue._commit = busy
+    submitted = []
+    submit = write_queue.submit
+    write_queue.submit = lambda row: submitted.append(row) or submit(row)
+    app.config['DB_WRITE_RETRY_BACKOFF'] = 0.001
+
+    response = app.test_client().post('/add_meal', json={'name': 'Lunch', 'username': 'testuser', 'calories': 700})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert len(submitted) == 1